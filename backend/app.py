@@ -1,19 +1,94 @@
+import json
+import os
 from flask import Flask
-from database import init_app, db
+from database import init_app, db, normalize_database_url, REPLICA_BIND
+from auth import init_app as init_auth
+from passwords import init_app as init_passwords
+from ratelimit import init_app as init_ratelimit
+from collection_cache import init_app as init_collection_cache
+from jobs import init_app as init_jobs
+from metrics import init_app as init_metrics
+from middleware import init_app as init_middleware
 from routes import bp as api_bp
+import maintenance  # registers the periodic jobs
 from flask_cors import CORS
 from flask_migrate import Migrate
+from json_provider import ORJSONProvider
 
 def create_app():
     app = Flask(__name__)
+    app.json = ORJSONProvider(app)
     app.config['SECRET_KEY'] = 'dev' # Replace with a strong secret key in production
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:////data/app/database.db'
+    app.config['SQLALCHEMY_DATABASE_URI'] = normalize_database_url(os.environ.get('DATABASE_URL', 'sqlite:////data/app/database.db'))
+    if os.environ.get('DATABASE_READ_URL'):
+        # Reads made while serving GET requests go to this replica.
+        app.config['SQLALCHEMY_BINDS'] = {REPLICA_BIND: normalize_database_url(os.environ['DATABASE_READ_URL'])}
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = json.loads(os.environ.get('DATABASE_ENGINE_OPTIONS', '{}'))
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLITE_PRAGMAS'] = {
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000')),
+        'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', '-64000')),
+        'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', '268435456')),
+        'temp_store': os.environ.get('SQLITE_TEMP_STORE', 'MEMORY'),
+    }
+    app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', '5'))
+    app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', '10'))
+    app.config['DB_POOL_TIMEOUT'] = int(os.environ.get('DB_POOL_TIMEOUT', '30'))
+    app.config['AUTH_CACHE_SIZE'] = 4096
+    # Seconds a resolved principal may be reused. Each worker process caches
+    # its own and only sees its own commits, so with GUNICORN_WORKERS > 1 a
+    # user change (e.g. being accepted) can take this long to reach the others.
+    app.config['AUTH_CACHE_TTL'] = int(os.environ.get('AUTH_CACHE_TTL', '300'))
+    app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', '500'))  # bytes
+    app.config['COMPRESS_LEVEL'] = int(os.environ.get('COMPRESS_LEVEL', '6'))
+    app.config['COMPRESS_BROTLI_QUALITY'] = int(os.environ.get('COMPRESS_BROTLI_QUALITY', '4'))
+    # Werkzeug hash method, e.g. 'pbkdf2:sha256:600000'. Hashes must fit the
+    # 128-character password_hash column, which rules out scrypt.
+    app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2')
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', '0'))  # 0 hashes on the request worker
+    app.config['PASSWORD_HASH_MAX_PENDING'] = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', '32'))
+    app.config['PASSWORD_HASH_WAIT'] = float(os.environ.get('PASSWORD_HASH_WAIT', '5'))  # seconds before a 503
+    app.config['RATELIMIT_ENABLED'] = os.environ.get('RATELIMIT_ENABLED', '1') == '1'
+    app.config['RATELIMIT_STORAGE'] = os.environ.get('RATELIMIT_STORAGE', 'memory')  # or sqlite:////path/to/file
+    app.config['RATELIMIT_AUTH_PER_IP'] = os.environ.get('RATELIMIT_AUTH_PER_IP', '20/60')  # requests/seconds
+    app.config['RATELIMIT_AUTH_PER_USERNAME'] = os.environ.get('RATELIMIT_AUTH_PER_USERNAME', '5/60')
+    app.config['COLLECTION_CACHE_ENABLED'] = os.environ.get('COLLECTION_CACHE_ENABLED', '1') == '1'
+    app.config['COLLECTION_CACHE_STORAGE'] = os.environ.get('COLLECTION_CACHE_STORAGE', 'memory')  # or sqlite:////path/to/file
+    app.config['COLLECTION_CACHE_MAX_BYTES'] = int(os.environ.get('COLLECTION_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+    app.config['JOBS_WORKERS'] = int(os.environ.get('JOBS_WORKERS', '2'))  # per process; 0 leaves jobs to `flask jobs work`
+    app.config['JOBS_POLL_INTERVAL'] = float(os.environ.get('JOBS_POLL_INTERVAL', '5'))  # seconds between idle polls
+    app.config['JOBS_LOCK_TIMEOUT'] = int(os.environ.get('JOBS_LOCK_TIMEOUT', '600'))  # seconds before a running job is presumed dead
+    app.config['JOBS_EAGER'] = os.environ.get('JOBS_EAGER', '0') == '1'  # run a request's jobs before responding
+    app.config['JOBS_RETENTION_DAYS'] = int(os.environ.get('JOBS_RETENTION_DAYS', '7'))
+    # Days before completed tasks, checked grocery items and thoughts move to
+    # the archive; 0 keeps them in place.
+    app.config['ARCHIVE_TASKS_AFTER_DAYS'] = int(os.environ.get('ARCHIVE_TASKS_AFTER_DAYS', '90'))
+    app.config['ARCHIVE_GROCERY_ITEMS_AFTER_DAYS'] = int(os.environ.get('ARCHIVE_GROCERY_ITEMS_AFTER_DAYS', '7'))
+    app.config['ARCHIVE_THOUGHTS_AFTER_DAYS'] = int(os.environ.get('ARCHIVE_THOUGHTS_AFTER_DAYS', '365'))
+    app.config['SYNC_TOMBSTONE_RETENTION_DAYS'] = int(os.environ.get('SYNC_TOMBSTONE_RETENTION_DAYS', '30'))
+    # Bearer token required by /metrics. Unset, only loopback clients may
+    # scrape it, which a reverse proxy on the same host also appears as.
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+    # off, header (X-Profile: 1 profiles that request) or sample (PROFILE_SAMPLE_RATE of requests);
+    # profiled requests slower than PROFILE_SLOW_MS are written to PROFILE_DIR as .prof files.
+    app.config['PROFILE_MODE'] = os.environ.get('PROFILE_MODE', 'off')
+    app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('PROFILE_SAMPLE_RATE', '0.01'))
+    app.config['PROFILE_SLOW_MS'] = int(os.environ.get('PROFILE_SLOW_MS', '500'))
+    app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', '/data/app/profiles')
 
     init_app(app)
+    init_auth(app)
+    init_passwords(app)
+    init_ratelimit(app)
+    init_collection_cache(app)
+    init_jobs(app)
+    init_metrics(app)
+    init_middleware(app)
     migrate = Migrate(app, db, directory='/app/migrations')
     app.register_blueprint(api_bp)
-    CORS(app, resources={r"/api/*": {"origins": "*"}})  # Enable CORS for all /api routes
+    CORS(app, resources={r"/api/*": {"origins": "*"}}, expose_headers=['X-Next-Cursor', 'ETag', 'Retry-After'])  # Enable CORS for all /api routes
 
     @app.route('/')
     def hello():
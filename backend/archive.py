@@ -0,0 +1,134 @@
+"""Set-based removal of finished rows and their archive.
+
+Completed tasks, checked grocery items and old thoughts are moved out of
+the live tables by a periodic job, so list endpoints and full syncs stop
+carrying them. Each archived row keeps its API representation as
+zlib-compressed JSON in archived_records, readable through GET
+/api/archive. Rows are removed with DELETE ... WHERE id IN (...) a chunk
+at a time; the dependents, sync tombstones and collection versions that
+ORM deletes would have maintained are kept in step here.
+"""
+import datetime
+import json
+import zlib
+from flask import current_app
+from sqlalchemy import or_
+from database import db
+from models import Family, Task, TaskOccurrence, GroceryItem, Thought, ArchivedRecord
+from versions import bump_version
+from sync import record_tombstones
+from events import publish_change
+import serializers
+
+# Rows per statement and per archival transaction, which keeps IN lists
+# under SQLite's variable limit and write locks short.
+CHUNK_SIZE = 500
+
+ARCHIVED_COLLECTIONS = {
+    'tasks': (Task, serializers.task_rows, serializers.serialize_tasks),
+    'grocery_items': (GroceryItem, serializers.grocery_item_rows, serializers.serialize_grocery_items),
+    'thoughts': (Thought, serializers.thought_rows, serializers.serialize_thoughts),
+}
+
+def _chunks(ids):
+    for i in range(0, len(ids), CHUNK_SIZE):
+        yield ids[i:i + CHUNK_SIZE]
+
+def delete_rows(model, family_id, ids, *criteria):
+    """Delete the family's rows with these ids that still match `criteria`
+    in the current transaction; returns the ids deleted.
+
+    The criteria are repeated in the DELETE, so a row that changed since
+    `ids` were read (a task reopened, say) is left alone.
+    """
+    collection = model.__tablename__
+    deleted = []
+    for chunk in _chunks(ids):
+        matching = model.query.filter(model.family_id == family_id, model.id.in_(chunk), *criteria)
+        # Locks the rows where the database supports it, so none stops
+        # matching between the statements below.
+        locked = [row_id for (row_id,) in matching.with_entities(model.id).with_for_update()]
+        if not locked:
+            continue
+        if model is Task:
+            TaskOccurrence.query.filter(TaskOccurrence.task_id.in_(matching.with_entities(Task.id))).delete(
+                synchronize_session=False)
+        matching.delete(synchronize_session=False)
+        remaining = {row_id for (row_id,) in db.session.query(model.id).filter(model.id.in_(chunk))}
+        deleted.extend(row_id for row_id in locked if row_id not in remaining)
+    if deleted:
+        record_tombstones(family_id, collection, deleted)
+        bump_version(family_id, collection)
+    return deleted
+
+def _completed_occurrences(task_ids):
+    completed = {}
+    for task_id, moment in db.session.query(TaskOccurrence.task_id, TaskOccurrence.occurrence).filter(
+            TaskOccurrence.task_id.in_(task_ids)).order_by(TaskOccurrence.task_id, TaskOccurrence.occurrence):
+        completed.setdefault(task_id, []).append(moment.isoformat())
+    return completed
+
+def archive_rows(model, family_id, ids, *criteria):
+    """Move the rows that still match `criteria` into archived_records;
+    returns the ids moved."""
+    collection = model.__tablename__
+    _, rows, serialize = ARCHIVED_COLLECTIONS[collection]
+    items = serialize(rows().filter(model.id.in_(ids)).order_by(model.id).all())
+    if model is Task:
+        # Completions of recurring tasks live in task_occurrences, which go with the task.
+        completed = _completed_occurrences(ids)
+        for item in items:
+            if item['recurrence']:
+                item['completed_occurrences'] = completed.get(item['id'], [])
+    deleted = set(delete_rows(model, family_id, ids, *criteria))
+    archived_at = datetime.datetime.utcnow()
+    records = [{
+        'family_id': family_id,
+        'collection': collection,
+        'record_id': item['id'],
+        'archived_at': archived_at,
+        'data': zlib.compress(json.dumps(item, separators=(',', ':')).encode()),
+    } for item in items if item['id'] in deleted]
+    if records:
+        db.session.execute(ArchivedRecord.__table__.insert(), records)
+    return [item['id'] for item in items if item['id'] in deleted]
+
+def serialize_archived(rows):
+    return [dict(json.loads(zlib.decompress(row.data)), archived_at=row.archived_at.isoformat()) for row in rows]
+
+def _older_than(column, cutoff):
+    # Rows from before updated_at existed have it NULL and are older still.
+    return or_(column < cutoff, column.is_(None))
+
+def _expired(model, cutoff):
+    if model is Task:
+        return [Task.completed.is_(True), _older_than(Task.updated_at, cutoff)]
+    if model is GroceryItem:
+        return [GroceryItem.is_completed.is_(True), _older_than(GroceryItem.updated_at, cutoff)]
+    return [Thought.timestamp < cutoff]
+
+def archive_expired(now=None):
+    """Archive every row past its collection's ARCHIVE_*_AFTER_DAYS; returns
+    how many were moved. Commits a chunk at a time, so a failed run keeps
+    the chunks it finished and the next one picks up the rest."""
+    now = now or datetime.datetime.utcnow()
+    family_ids = [family_id for (family_id,) in db.session.query(Family.id)]
+    archived = 0
+    for collection, (model, _, _) in ARCHIVED_COLLECTIONS.items():
+        days = current_app.config['ARCHIVE_%s_AFTER_DAYS' % collection.upper()]
+        if not days:
+            continue
+        cutoff = now - datetime.timedelta(days=days)
+        for family_id in family_ids:
+            while True:
+                criteria = _expired(model, cutoff)
+                ids = [row_id for (row_id,) in db.session.query(model.id).filter(
+                    model.family_id == family_id, *criteria).order_by(model.id).limit(CHUNK_SIZE)]
+                if not ids:
+                    break
+                moved = archive_rows(model, family_id, ids, *criteria)
+                db.session.commit()
+                for row_id in moved:
+                    publish_change(family_id, collection, 'deleted', row_id)
+                archived += len(moved)
+    return archived
@@ -1,8 +1,67 @@
+import threading
 import jwt
+from collections import namedtuple
 from functools import wraps
 from flask import request, jsonify, current_app, g
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from cache import LRUCache
 from models import User
 
+# Lightweight stand-in for the User row: handlers only need these fields, so
+# resolved principals are cached and the per-request user lookup is skipped.
+Principal = namedtuple('Principal', ['id', 'family_id', 'is_accepted'])
+
+principal_cache = LRUCache(maxsize=4096, ttl=300)
+
+# Invalidations per user id. A load only caches its result if no
+# invalidation happened while it read the row, since what it read may
+# predate the commit that caused it.
+_generations = {}
+_generations_lock = threading.Lock()
+
+def init_app(app):
+    principal_cache.maxsize = app.config.get('AUTH_CACHE_SIZE', principal_cache.maxsize)
+    principal_cache.ttl = app.config.get('AUTH_CACHE_TTL', principal_cache.ttl)
+
+def invalidate_principal(user_id):
+    with _generations_lock:
+        _generations[user_id] = _generations.get(user_id, 0) + 1
+        principal_cache.delete(user_id)
+
+def load_principal(user_id):
+    principal = principal_cache.get(user_id)
+    if principal is None:
+        generation = _generations.get(user_id, 0)
+        user = User.query.get(user_id)
+        if not user:
+            return None
+        principal = Principal(user.id, user.family_id, user.is_accepted)
+        with _generations_lock:
+            if _generations.get(user_id, 0) == generation:
+                principal_cache.set(user_id, principal)
+    return principal
+
+# Cached principals are dropped once a change to the user row is committed,
+# and a request that read the row before that commit doesn't cache it. The
+# cache is per process, so other workers keep serving their entry until
+# AUTH_CACHE_TTL runs out.
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _track_user_change(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('changed_user_ids', set()).add(target.id)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_changed_users(session):
+    for user_id in session.info.pop('changed_user_ids', ()):
+        invalidate_principal(user_id)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changed_users(session):
+    session.info.pop('changed_user_ids', None)
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -17,7 +76,7 @@ def token_required(f):
 
         try:
             data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS256"])
-            current_user = User.query.get(data['id'])
+            current_user = load_principal(data['id'])
             if not current_user:
                 return jsonify({'message': 'Token is invalid!'}), 401
             g.current_user = current_user
@@ -26,4 +85,4 @@ def token_required(f):
 
         return f(*args, **kwargs)
 
-    return decorated
\ No newline at end of file
+    return decorated
@@ -0,0 +1,425 @@
+"""Benchmark every API endpoint against a seeded temporary SQLite database.
+
+Two modes, both on the same seed:
+
+  client  each endpoint through the Flask test client, one request at a
+          time: latency percentiles and SQL statements per request.
+  server  gunicorn with several workers, driven by concurrent keep-alive
+          clients for a fixed time: req/s and latency percentiles.
+
+Results are written as JSON with stable key order so runs from two commits
+can be diffed, or compared directly:
+
+    python benchmarks/api_suite.py --output before.json
+    python benchmarks/api_suite.py --output after.json --compare before.json
+"""
+import argparse
+import collections
+import datetime
+import http.client
+import itertools
+import json
+import os
+import platform
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BACKEND)
+# Auth limits would turn most of a benchmark into 429s.
+os.environ.setdefault('RATELIMIT_ENABLED', '0')
+
+import jwt
+from flask_migrate import upgrade
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from app import create_app
+from database import db
+from passwords import hash_password
+
+PASSWORD = 'bench'
+
+class Context:
+    """Ids and counters shared by the scenarios of one run."""
+
+    def __init__(self, token):
+        self.headers = {'Authorization': 'Bearer ' + token}
+        self.disposable = collections.defaultdict(list)
+        self._unique = itertools.count(1)
+
+    def unique(self):
+        return next(self._unique)
+
+Scenario = collections.namedtuple('Scenario', ['name', 'method', 'path', 'body', 'disposable', 'server'])
+
+def scenario(name, method, path, body=None, disposable=None, server=None):
+    """`disposable` is (table, columns): one such row is inserted per request
+    beforehand and its id substituted for %d in `path`.
+
+    Reads and creates are safe to repeat under concurrency; scenarios that
+    consume rows only run in client mode.
+    """
+    if server is None:
+        server = disposable is None
+    return Scenario(name, method, path, body, disposable, server)
+
+def _insert_disposable(ctx, scenario, count):
+    table, columns = scenario.disposable
+    start = db.session.execute(text('SELECT coalesce(max(id), 0) FROM %s' % table)).scalar() + 1
+    rows = [{column: value(start + n) if callable(value) else value for column, value in columns.items()}
+            for n in range(count)]
+    for n, row in enumerate(rows):
+        row['id'] = start + n
+    db.session.execute(text('INSERT INTO %s (%s) VALUES (%s)' % (
+        table, ', '.join(rows[0]), ', '.join(':' + column for column in rows[0]))), rows)
+    db.session.commit()
+    ctx.disposable[scenario.name] = [row['id'] for row in rows]
+
+def _import_body(ctx, i):
+    return '\n'.join([
+        json.dumps({'type': 'export', 'format': 1, 'family': 'imported'}),
+        json.dumps({'type': 'tasks', 'data': {'title': 'imported task', 'completed': False}}),
+        json.dumps({'type': 'grocery_items', 'data': {'name': 'imported item', 'category': 'Other'}}),
+    ]) + '\n'
+
+SCENARIOS = [
+    scenario('register', 'POST', '/api/register', lambda ctx, i: {
+        'family_name': 'family-1', 'username': 'bench-new-%d' % ctx.unique(), 'password': PASSWORD, 'email': 'new@example.com'}),
+    scenario('login', 'POST', '/api/login', lambda ctx, i: {'username': 'user-1-0', 'password': PASSWORD}),
+    scenario('family_users', 'GET', '/api/family/users'),
+    scenario('family_export', 'GET', '/api/family/export'),
+    scenario('family_import', 'POST', '/api/family/import', _import_body, server=False),
+    scenario('accept_user', 'PUT', '/api/family/users/%d/accept', disposable=('users', {
+        'username': lambda id: 'pending-%d' % id, 'password_hash': 'x', 'email': 'pending@example.com',
+        'is_accepted': 0, 'family_id': 1})),
+    scenario('tasks_list', 'GET', '/api/tasks'),
+    scenario('tasks_list_page', 'GET', '/api/tasks?completed=false&limit=50'),
+    scenario('tasks_window', 'GET', '/api/tasks?from=2025-01-01&to=2025-03-31'),
+    scenario('task_create', 'POST', '/api/tasks', lambda ctx, i: {'title': 'bench task', 'description': 'created'}),
+    scenario('tasks_batch', 'POST', '/api/tasks/batch', lambda ctx, i: {
+        'operations': [{'op': 'create', 'data': {'title': 'batch task %d' % n}} for n in range(20)]}),
+    scenario('task_get', 'GET', '/api/tasks/1'),
+    scenario('task_update', 'PUT', '/api/tasks/1', lambda ctx, i: {'title': 'task %d' % i}),
+    scenario('task_occurrence', 'PUT', '/api/tasks/1/occurrences/2025-01-02T10:00:00', lambda ctx, i: {'completed': i % 2 == 0}),
+    scenario('tasks_clear_completed', 'DELETE', '/api/tasks/completed', server=False),
+    scenario('task_delete', 'DELETE', '/api/tasks/%d', disposable=('tasks', {
+        'title': 'doomed', 'completed': 0, 'family_id': 1, 'author_id': 1})),
+    scenario('meals_list', 'GET', '/api/meals'),
+    scenario('meals_range', 'GET', '/api/meals?from=2025-01-01&to=2025-01-07'),
+    scenario('meal_create', 'POST', '/api/meals', lambda ctx, i: {'name': 'bench meal', 'date': '2025-01-02', 'meal_time': 'dinner', 'recipe_id': 1}),
+    scenario('meal_get', 'GET', '/api/meals/1'),
+    scenario('meal_update', 'PUT', '/api/meals/1', lambda ctx, i: {'name': 'meal %d' % i}),
+    scenario('meal_delete', 'DELETE', '/api/meals/%d', disposable=('meals', {
+        'name': 'doomed', 'family_id': 1})),
+    scenario('recipes_list', 'GET', '/api/recipes'),
+    scenario('recipes_by_ingredient', 'GET', '/api/recipes?ingredient=salt&limit=50'),
+    scenario('recipes_cookable', 'GET', '/api/recipes/cookable?max_missing=1'),
+    scenario('recipe_create', 'POST', '/api/recipes', lambda ctx, i: {
+        'name': 'bench recipe', 'instructions': ['mix', 'bake'],
+        'ingredients': [{'name': 'flour', 'quantity': '200 g'}, {'name': 'egg', 'quantity': '2'}]}),
+    scenario('recipe_get', 'GET', '/api/recipes/1'),
+    scenario('recipe_update', 'PUT', '/api/recipes/1', lambda ctx, i: {
+        'name': 'recipe %d' % i, 'ingredients': [{'name': 'flour', 'quantity': '250 g'}, {'name': 'salt', 'quantity': '1 tsp'}]}),
+    scenario('recipe_ingredients_patch', 'PATCH', '/api/recipes/1/ingredients', lambda ctx, i: {
+        'ingredients': [{'name': 'flour', 'quantity': '%d g' % (200 + i % 50)}]}),
+    scenario('recipe_delete', 'DELETE', '/api/recipes/%d', disposable=('recipes', {
+        'name': 'doomed', 'instructions': '[]', 'family_id': 1})),
+    scenario('grocery_list', 'GET', '/api/grocery_items'),
+    scenario('grocery_open', 'GET', '/api/grocery_items?is_completed=false'),
+    scenario('grocery_create', 'POST', '/api/grocery_items', lambda ctx, i: {'name': 'bench item', 'quantity': '1', 'category': 'Produce'}),
+    scenario('grocery_batch', 'POST', '/api/grocery_items/batch', lambda ctx, i: {
+        'operations': [{'op': 'create', 'data': {'name': 'batch item %d' % n}} for n in range(20)]}),
+    scenario('grocery_from_meals', 'POST', '/api/grocery_items/from_meals?from=2025-01-01&to=2025-01-07', lambda ctx, i: {}),
+    scenario('grocery_get', 'GET', '/api/grocery_items/1'),
+    scenario('grocery_update', 'PUT', '/api/grocery_items/1', lambda ctx, i: {'quantity': str(i)}),
+    scenario('grocery_clear_completed', 'DELETE', '/api/grocery_items/completed', server=False),
+    scenario('grocery_delete', 'DELETE', '/api/grocery_items/%d', disposable=('grocery_items', {
+        'name': 'doomed', 'category': 'Other', 'is_completed': 0, 'family_id': 1})),
+    scenario('thought_create', 'POST', '/api/thoughts', lambda ctx, i: {'content': 'bench thought'}),
+    scenario('thoughts_list', 'GET', '/api/thoughts'),
+    scenario('sync_full', 'GET', '/api/sync'),
+    scenario('archive_tasks', 'GET', '/api/archive?collection=tasks'),
+    scenario('search', 'GET', '/api/search?q=task'),
+    scenario('metrics', 'GET', '/metrics'),
+    scenario('root', 'GET', '/'),
+]
+
+# Endpoints deliberately left out, with the reason.
+SKIPPED = {
+    'api.stream': 'Server-Sent Events; the response never ends',
+}
+
+def seed(args):
+    """Insert families with their users, tasks, meals, recipes, groceries and thoughts."""
+    password_hash = hash_password(PASSWORD)
+    families = range(1, args.families + 1)
+    db.session.execute(text('INSERT INTO families (id, name) VALUES (:id, :name)'),
+                       [{'id': f, 'name': 'family-%d' % f} for f in families])
+    db.session.execute(text('INSERT INTO users (username, password_hash, email, is_accepted, family_id) '
+                            "VALUES (:username, :hash, 'bench@example.com', 1, :f)"),
+                       [{'username': 'user-%d-%d' % (f, n), 'hash': password_hash, 'f': f}
+                        for f in families for n in range(args.users)])
+    first_user = dict(db.session.execute(text('SELECT family_id, min(id) FROM users GROUP BY family_id')).fetchall())
+
+    def per_family(count):
+        return [(f, n) for f in families for n in range(count)]
+    db.session.execute(text('INSERT INTO tasks (title, description, completed, due_date, family_id, author_id, assigned_user_id, recurrence) '
+                            "VALUES (:title, 'seeded task', :completed, '2025-01-01 10:00:00.000000', :f, :u, :u, :recurrence)"),
+                       [{'title': 'task %d' % n, 'completed': n % 3 == 0, 'f': f, 'u': first_user[f],
+                         'recurrence': 'FREQ=WEEKLY;BYDAY=MO,TH' if n % 10 == 0 else None}
+                        for f, n in per_family(args.tasks)])
+    db.session.execute(text('INSERT INTO recipes (name, instructions, family_id) '
+                            "VALUES (:name, '[\"chop\", \"stir\", \"serve\"]', :f)"),
+                       [{'name': 'recipe %d' % n, 'f': f} for f, n in per_family(args.recipes)])
+    for name, quantity, amount, unit in (('flour', '200 g', 200, 'g'), ('salt', '1 tsp', 1, 'tsp')):
+        db.session.execute(text('INSERT INTO ingredients (family_id, name, normalized_name) VALUES (:f, :name, :name)'),
+                           [{'f': f, 'name': name} for f in families])
+        db.session.execute(text('INSERT INTO recipe_ingredients (recipe_id, name, quantity, ingredient_id, amount, unit) '
+                                'SELECT recipes.id, :name, :quantity, ingredients.id, :amount, :unit FROM recipes '
+                                'JOIN ingredients ON ingredients.family_id = recipes.family_id AND ingredients.name = :name'),
+                           {'name': name, 'quantity': quantity, 'amount': amount, 'unit': unit})
+    db.session.execute(text('INSERT INTO meals (name, date, meal_time, recipe_id, family_id) '
+                            "SELECT name, '2025-01-0' || (id % 7 + 1), 'dinner', id, family_id FROM recipes"))
+    db.session.execute(text('INSERT INTO grocery_items (name, quantity, category, is_completed, family_id) '
+                            "VALUES (:name, '2', 'Produce', :completed, :f)"),
+                       [{'name': 'item %d' % n, 'completed': n % 2 == 0, 'f': f} for f, n in per_family(args.grocery_items)]
+                       + [{'name': 'flour', 'completed': False, 'f': f} for f in families])
+    db.session.execute(text('INSERT INTO thoughts (content, timestamp, user_id, family_id) '
+                            "VALUES (:content, '2025-01-01 10:00:00', :u, :f)"),
+                       [{'content': 'thought %d about the week' % n, 'u': first_user[f], 'f': f} for f, n in per_family(args.thoughts)])
+    db.session.commit()
+    return first_user[1]
+
+def _request_kwargs(ctx, scenario, i):
+    kwargs = {'headers': dict(ctx.headers)}
+    if scenario.body is not None:
+        body = scenario.body(ctx, i)
+        if isinstance(body, str):
+            kwargs['data'] = body
+            kwargs['headers']['Content-Type'] = 'application/x-ndjson'
+        else:
+            kwargs['json'] = body
+    return kwargs
+
+def percentiles(latencies):
+    ordered = sorted(latencies)
+    def pick(pct):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] * 1000, 3) if ordered else None
+    return {'p50_ms': pick(50), 'p95_ms': pick(95), 'p99_ms': pick(99)}
+
+def run_client(app, ctx, scenarios, iterations):
+    client = app.test_client()
+    statements = [0]
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements[0] += 1
+    event.listen(Engine, 'after_cursor_execute', count)
+    results = {}
+    try:
+        for scenario in scenarios:
+            if scenario.disposable:
+                with app.app_context():
+                    _insert_disposable(ctx, scenario, iterations + 1)
+            latencies, sql, statuses = [], 0, collections.Counter()
+            for i in range(iterations + 1):
+                target = scenario.path % ctx.disposable[scenario.name][i] if scenario.disposable else scenario.path
+                kwargs = _request_kwargs(ctx, scenario, i)
+                statements[0] = 0
+                start = time.perf_counter()
+                response = client.open(target, method=scenario.method, **kwargs)
+                response.get_data()
+                elapsed = time.perf_counter() - start
+                if i == 0:
+                    continue  # warm-up
+                latencies.append(elapsed)
+                sql += statements[0]
+                statuses[response.status_code] += 1
+            results[scenario.name] = dict(percentiles(latencies), **{
+                'requests': iterations,
+                'rps': round(iterations / sum(latencies), 1),
+                'sql_per_request': round(sql / iterations, 2),
+                'status': {str(code): n for code, n in sorted(statuses.items())},
+            })
+            print('client %-20s %8.1f req/s  p50 %7.2f ms  p99 %7.2f ms  %5.1f sql/req' % (
+                scenario.name, results[scenario.name]['rps'], results[scenario.name]['p50_ms'],
+                results[scenario.name]['p99_ms'], results[scenario.name]['sql_per_request']))
+    finally:
+        event.remove(Engine, 'after_cursor_execute', count)
+    return results
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def _start_server(path, args):
+    port = _free_port()
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + path, GUNICORN_BIND='127.0.0.1:%d' % port,
+               GUNICORN_WORKERS=str(args.workers))
+    if args.worker_class:
+        env['GUNICORN_WORKER_CLASS'] = args.worker_class
+    server = subprocess.Popen(['gunicorn', '-c', 'gunicorn.conf.py'], cwd=BACKEND, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return server, port
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError('gunicorn did not start')
+
+def _drive(port, ctx, scenario, stop, latencies, statuses):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    i = 0
+    while not stop.is_set():
+        kwargs = _request_kwargs(ctx, scenario, i)
+        body = kwargs.get('data')
+        if 'json' in kwargs:
+            body = json.dumps(kwargs['json'])
+            kwargs['headers']['Content-Type'] = 'application/json'
+        start = time.perf_counter()
+        conn.request(scenario.method, scenario.path, body=body, headers=kwargs['headers'])
+        response = conn.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - start)
+        statuses[response.status] += 1
+        i += 1
+
+def run_server(path, ctx, scenarios, args):
+    server, port = _start_server(path, args)
+    results = {}
+    try:
+        for scenario in scenarios:
+            if not scenario.server:
+                continue
+            stop = threading.Event()
+            latencies, statuses = [], collections.Counter()
+            threads = [threading.Thread(target=_drive, args=(port, ctx, scenario, stop, latencies, statuses))
+                       for _ in range(args.concurrency)]
+            for thread in threads:
+                thread.start()
+            time.sleep(args.seconds)
+            stop.set()
+            for thread in threads:
+                thread.join()
+            results[scenario.name] = dict(percentiles(latencies), **{
+                'requests': len(latencies),
+                'rps': round(len(latencies) / args.seconds, 1),
+                'status': {str(code): n for code, n in sorted(statuses.items())},
+            })
+            print('server %-20s %8.1f req/s  p50 %7.2f ms  p99 %7.2f ms' % (
+                scenario.name, results[scenario.name]['rps'], results[scenario.name]['p50_ms'],
+                results[scenario.name]['p99_ms']))
+    finally:
+        server.terminate()
+        server.wait()
+    return results
+
+def uncovered_endpoints(app):
+    driven = set()
+    adapter = app.url_map.bind('localhost')
+    for scenario in SCENARIOS:
+        path = scenario.path % 1 if scenario.disposable else scenario.path
+        driven.add(adapter.match(path.split('?')[0], method=scenario.method)[0])
+    return sorted(rule.endpoint for rule in app.url_map.iter_rules()
+                  if rule.endpoint not in driven and rule.endpoint not in SKIPPED and rule.endpoint != 'static')
+
+def compare(old, new, threshold):
+    """Print metrics that got worse by more than `threshold`; return how many."""
+    regressions = 0
+    for mode in ('client', 'server'):
+        for name, result in sorted(new.get(mode, {}).items()):
+            before = old.get(mode, {}).get(name)
+            if not before:
+                continue
+            for key, worse_if_higher in (('p50_ms', True), ('p95_ms', True), ('p99_ms', True),
+                                         ('rps', False), ('sql_per_request', True)):
+                if before.get(key) is None or result.get(key) is None:
+                    continue
+                a, b = before[key], result[key]
+                if key == 'sql_per_request':
+                    worse = b > a
+                elif worse_if_higher:
+                    worse = b > a * (1 + threshold)
+                else:
+                    worse = b < a / (1 + threshold)
+                if worse:
+                    regressions += 1
+                    print('REGRESSION %s %-20s %-16s %10s -> %s' % (mode, name, key, a, b))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=['client', 'server', 'both'], default='both')
+    parser.add_argument('--families', type=int, default=50)
+    parser.add_argument('--users', type=int, default=3, help='users per family')
+    parser.add_argument('--tasks', type=int, default=200, help='per family')
+    parser.add_argument('--recipes', type=int, default=50, help='per family')
+    parser.add_argument('--grocery-items', type=int, default=100, help='per family')
+    parser.add_argument('--thoughts', type=int, default=200, help='per family')
+    parser.add_argument('--iterations', type=int, default=100, help='client-mode requests per endpoint')
+    parser.add_argument('--seconds', type=float, default=5, help='server-mode time per endpoint')
+    parser.add_argument('--concurrency', type=int, default=16, help='server-mode client connections')
+    parser.add_argument('--workers', type=int, default=4, help='server-mode gunicorn workers')
+    parser.add_argument('--worker-class', help='server-mode gunicorn worker class (default: gunicorn.conf.py)')
+    parser.add_argument('--only', help='comma-separated scenario names')
+    parser.add_argument('--output', help='write results as JSON here')
+    parser.add_argument('--compare', help='JSON from an earlier run; exit 1 on regressions')
+    parser.add_argument('--threshold', type=float, default=0.2, help='tolerated slowdown for --compare')
+    args = parser.parse_args()
+
+    scenarios = [s for s in SCENARIOS if not args.only or s.name in args.only.split(',')]
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    app = create_app()
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+    try:
+        with app.app_context():
+            upgrade(directory=os.path.join(BACKEND, 'migrations'))
+            user_id = seed(args)
+        token = jwt.encode({'id': user_id, 'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=6)},
+                           app.config['SECRET_KEY'], algorithm='HS256')
+        ctx = Context(token)
+        report = {
+            'meta': {
+                'python': platform.python_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'commit': subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND,
+                                         capture_output=True, text=True).stdout.strip() or None,
+                'seed': {key: getattr(args, key) for key in ('families', 'users', 'tasks', 'recipes', 'grocery_items', 'thoughts')},
+                'client': {'iterations': args.iterations},
+                'server': {'seconds': args.seconds, 'concurrency': args.concurrency, 'workers': args.workers,
+                           'worker_class': args.worker_class},
+            },
+            'uncovered': uncovered_endpoints(app),
+        }
+        if report['uncovered']:
+            print('endpoints without a scenario: %s' % ', '.join(report['uncovered']))
+        if args.mode in ('client', 'both'):
+            report['client'] = run_client(app, ctx, scenarios, args.iterations)
+        if args.mode in ('server', 'both'):
+            report['server'] = run_server(path, ctx, scenarios, args)
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        print('%d regression(s) against %s' % (regressions, args.compare))
+        sys.exit(1 if regressions else 0)
+
+if __name__ == '__main__':
+    main()
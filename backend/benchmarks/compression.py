@@ -0,0 +1,62 @@
+"""Bytes on the wire and compression CPU cost per list endpoint, for
+identity, gzip and brotli responses.
+
+    python benchmarks/compression.py --rows 2000
+"""
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import jwt
+from app import create_app
+from database import db
+from serialization import seed
+
+ENDPOINTS = ['/api/tasks', '/api/grocery_items', '/api/meals', '/api/recipes', '/api/thoughts?limit=500', '/api/family/users']
+ENCODINGS = ['identity', 'gzip', 'br']
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    app = create_app()
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+    try:
+        with app.app_context():
+            db.create_all()
+            seed(args.rows)
+        token = jwt.encode({'id': 1, 'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=1)},
+                           app.config['SECRET_KEY'], algorithm='HS256')
+        client = app.test_client()
+        print('%-26s %-9s %10s %8s %10s' % ('endpoint', 'encoding', 'bytes', 'ratio', 'ms/req'))
+        for endpoint in ENDPOINTS:
+            baseline = None
+            for encoding in ENCODINGS:
+                headers = {'Authorization': 'Bearer ' + token, 'Accept-Encoding': encoding}
+                client.get(endpoint, headers=headers)
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    response = client.get(endpoint, headers=headers)
+                elapsed = (time.perf_counter() - start) / args.repeat
+                size = len(response.data)
+                baseline = baseline or size
+                print('%-26s %-9s %10d %7.1f%% %10.2f' % (
+                    endpoint, response.headers.get('Content-Encoding', 'identity'), size,
+                    100.0 * size / baseline, elapsed * 1000))
+    finally:
+        os.remove(path)
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""Latency of a normal endpoint while a login storm hits the same server.
+
+Starts gunicorn (gunicorn.conf.py, so gevent by default) on a temporary
+SQLite database once per profile, then runs --stormers threads hammering
+/api/login next to --readers threads reading /api/tasks, and reports the
+readers' p50/p95/p99 and what the logins got back.
+
+    python benchmarks/login_storm.py --seconds 10 --stormers 8 --readers 4
+"""
+import argparse
+import collections
+import datetime
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BACKEND)
+
+import jwt
+from app import create_app
+from database import db
+from serialization import seed
+
+PROFILES = {
+    'no storm': None,
+    'inline hashing': {'PASSWORD_HASH_WORKERS': '0', 'RATELIMIT_ENABLED': '0'},
+    'hash pool': {'PASSWORD_HASH_WORKERS': '2', 'RATELIMIT_ENABLED': '0'},
+    'rate limited': {'PASSWORD_HASH_WORKERS': '0', 'RATELIMIT_ENABLED': '1'},
+}
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_server(path, port, env_overrides):
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + path, GUNICORN_BIND='127.0.0.1:%d' % port,
+               **(env_overrides or {}))
+    server = subprocess.Popen(['gunicorn', '-c', 'gunicorn.conf.py'], cwd=BACKEND, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError('gunicorn did not start')
+
+def reader(port, token, stop, latencies):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    headers = {'Authorization': 'Bearer ' + token}
+    while not stop.is_set():
+        start = time.perf_counter()
+        conn.request('GET', '/api/tasks?limit=50', headers=headers)
+        conn.getresponse().read()
+        latencies.append(time.perf_counter() - start)
+
+def stormer(port, stop, statuses):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    body = json.dumps({'username': 'bench', 'password': 'bench'})
+    while not stop.is_set():
+        conn.request('POST', '/api/login', body=body, headers={'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        response.read()
+        statuses[response.status] += 1
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] if values else float('nan')
+
+def run(path, token, profile, args):
+    port = free_port()
+    server = start_server(path, port, PROFILES[profile] or {})
+    stop = threading.Event()
+    latencies, statuses = [], collections.Counter()
+    threads = [threading.Thread(target=reader, args=(port, token, stop, latencies)) for _ in range(args.readers)]
+    if PROFILES[profile] is not None:
+        threads += [threading.Thread(target=stormer, args=(port, stop, statuses)) for _ in range(args.stormers)]
+    try:
+        for thread in threads:
+            thread.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+    finally:
+        server.terminate()
+        server.wait()
+    print('%-15s reads: %6.0f/s  p50 %7.1f ms  p95 %7.1f ms  p99 %7.1f ms   logins: %s' % (
+        profile, len(latencies) / args.seconds,
+        percentile(latencies, 50) * 1000, percentile(latencies, 95) * 1000, percentile(latencies, 99) * 1000,
+        ', '.join('%d x%d' % item for item in sorted(statuses.items())) or '-'))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--stormers', type=int, default=8)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--rows', type=int, default=500)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    app = create_app()
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+    try:
+        with app.app_context():
+            db.create_all()
+            seed(args.rows)
+            from models import User
+            user = User.query.get(1)
+            user.set_password('bench')
+            db.session.commit()
+        token = jwt.encode({'id': 1, 'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=1)},
+                           app.config['SECRET_KEY'], algorithm='HS256')
+        for profile in PROFILES:
+            run(path, token, profile, args)
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Compare query plans and timings of the family-scoped list queries with and
+without the composite indexes from migration 12990d5de6e5.
+
+    python benchmarks/query_plans.py --families 5000 --rows 20
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sqlalchemy import create_engine, text
+from database import db
+import models  # noqa: F401  registers the tables on db.metadata
+
+QUERIES = {
+    'users': "SELECT * FROM users WHERE family_id = :family_id ORDER BY id",
+    'tasks': "SELECT * FROM tasks WHERE family_id = :family_id AND completed = 0 ORDER BY id",
+    'grocery_items': "SELECT * FROM grocery_items WHERE family_id = :family_id AND is_completed = 0 AND category = 'Produce' ORDER BY id",
+    'meals': "SELECT * FROM meals WHERE family_id = :family_id AND date BETWEEN '2025-01-01' AND '2025-01-07' ORDER BY id",
+    'recipes': "SELECT * FROM recipes WHERE family_id = :family_id ORDER BY id",
+    'recipe_ingredients': "SELECT * FROM recipe_ingredients WHERE recipe_id IN (SELECT id FROM recipes WHERE family_id = :family_id)",
+    'thoughts': "SELECT * FROM thoughts WHERE family_id = :family_id ORDER BY id DESC LIMIT 10",
+}
+
+def seed(conn, families, rows):
+    conn.execute(text("INSERT INTO families (id, name) VALUES (:id, :name)"),
+                 [{'id': f, 'name': 'family-%d' % f} for f in range(1, families + 1)])
+    conn.execute(text("INSERT INTO users (id, username, password_hash, email, is_accepted, family_id) "
+                      "VALUES (:id, :u, 'x', 'x@example.com', 1, :f)"),
+                 [{'id': f, 'u': 'user-%d' % f, 'f': f} for f in range(1, families + 1)])
+    per_family = [(f, n) for f in range(1, families + 1) for n in range(rows)]
+    conn.execute(text("INSERT INTO tasks (title, completed, due_date, family_id, author_id) "
+                      "VALUES ('task', :c, '2025-01-01 00:00:00', :f, :f)"),
+                 [{'f': f, 'c': n % 2} for f, n in per_family])
+    conn.execute(text("INSERT INTO grocery_items (name, category, is_completed, family_id) "
+                      "VALUES ('item', :cat, :c, :f)"),
+                 [{'f': f, 'c': n % 2, 'cat': ('Produce', 'Dairy', 'Other')[n % 3]} for f, n in per_family])
+    conn.execute(text("INSERT INTO meals (name, date, family_id) VALUES ('meal', :d, :f)"),
+                 [{'f': f, 'd': '2025-01-%02d' % (n % 28 + 1)} for f, n in per_family])
+    conn.execute(text("INSERT INTO recipes (name, instructions, family_id) VALUES ('recipe', '[]', :f)"),
+                 [{'f': f} for f, n in per_family])
+    conn.execute(text("INSERT INTO recipe_ingredients (recipe_id, name) SELECT id, 'ingredient' FROM recipes"))
+    conn.execute(text("INSERT INTO thoughts (content, user_id, family_id) VALUES ('thought', :f, :f)"),
+                 [{'f': f} for f, n in per_family])
+
+def measure(conn, families, repeat):
+    results = {}
+    for name, sql in QUERIES.items():
+        plan = conn.execute(text("EXPLAIN QUERY PLAN " + sql), {'family_id': 1}).fetchall()
+        start = time.perf_counter()
+        for i in range(repeat):
+            conn.execute(text(sql), {'family_id': i % families + 1}).fetchall()
+        elapsed = (time.perf_counter() - start) / repeat
+        results[name] = (' | '.join(row[-1] for row in plan), elapsed)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--families', type=int, default=5000)
+    parser.add_argument('--rows', type=int, default=20, help='rows per family in each table')
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        engine = create_engine('sqlite:///' + path)
+        db.metadata.create_all(engine)
+        indexes = [index for table in db.metadata.sorted_tables for index in table.indexes]
+        with engine.begin() as conn:
+            for index in indexes:
+                index.drop(conn)
+            seed(conn, args.families, args.rows)
+            conn.execute(text("ANALYZE"))
+
+        with engine.connect() as conn:
+            before = measure(conn, args.families, args.repeat)
+        with engine.begin() as conn:
+            for index in indexes:
+                index.create(conn)
+            conn.execute(text("ANALYZE"))
+        with engine.connect() as conn:
+            after = measure(conn, args.families, args.repeat)
+    finally:
+        os.remove(path)
+
+    for name in QUERIES:
+        print('%s: %.3f ms -> %.3f ms' % (name, before[name][1] * 1000, after[name][1] * 1000))
+        print('  before: %s' % before[name][0])
+        print('  after:  %s' % after[name][0])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Compare the ORM to_dict + stdlib json path with the column-level
+serializers + orjson path for each collection, per N rows.
+
+    python benchmarks/serialization.py --rows 10000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sqlalchemy import text
+from app import create_app
+from database import db
+from models import Task, Meal, Recipe, GroceryItem, User, Thought
+import serializers
+
+def seed(rows):
+    db.session.execute(text("INSERT INTO families (id, name) VALUES (1, 'bench')"))
+    db.session.execute(text("INSERT INTO users (id, username, password_hash, email, is_accepted, family_id) "
+                            "VALUES (1, 'bench', 'x', 'bench@example.com', 1, 1)"))
+    params = [{'n': n} for n in range(rows)]
+    db.session.execute(text("INSERT INTO tasks (title, description, completed, due_date, family_id, author_id, assigned_user_id) "
+                            "VALUES ('task ' || :n, 'description', 0, '2025-01-01 10:00:00.000000', 1, 1, 1)"), params)
+    db.session.execute(text("INSERT INTO grocery_items (name, quantity, category, is_completed, family_id) "
+                            "VALUES ('item ' || :n, '2', 'Produce', 0, 1)"), params)
+    db.session.execute(text("INSERT INTO meals (name, date, meal_time, family_id) VALUES ('meal ' || :n, '2025-01-01', 'dinner', 1)"), params)
+    db.session.execute(text("INSERT INTO recipes (name, instructions, family_id) "
+                            "VALUES ('recipe ' || :n, '[\"chop\", \"stir\", \"serve\"]', 1)"), params)
+    db.session.execute(text("INSERT INTO recipe_ingredients (recipe_id, name, quantity) SELECT id, 'salt', '1 tsp' FROM recipes"))
+    db.session.execute(text("INSERT INTO recipe_ingredients (recipe_id, name, quantity) SELECT id, 'flour', '200 g' FROM recipes"))
+    db.session.execute(text("INSERT INTO thoughts (content, timestamp, user_id, family_id) "
+                            "VALUES ('thought ' || :n, '2025-01-01 10:00:00', 1, 1)"), params)
+    db.session.commit()
+
+CASES = {
+    'tasks': (lambda: Task.query.options(db.joinedload(Task.assigned_user)),
+              serializers.task_rows, serializers.serialize_tasks),
+    'grocery_items': (lambda: GroceryItem.query, serializers.grocery_item_rows, serializers.serialize_grocery_items),
+    'meals': (lambda: Meal.query, serializers.meal_rows, serializers.serialize_meals),
+    'recipes': (lambda: Recipe.query.options(db.selectinload(Recipe.ingredients)),
+                serializers.recipe_rows, serializers.serialize_recipes),
+    'thoughts': (lambda: Thought.query.options(db.joinedload(Thought.user)),
+                 serializers.thought_rows, serializers.serialize_thoughts),
+    'users': (lambda: User.query, serializers.user_rows, serializers.serialize_users),
+}
+
+def measure(fn):
+    # Timed and memory-traced in separate runs; tracemalloc skews timings.
+    db.session.expunge_all()
+    start = time.perf_counter()
+    payload = fn()
+    elapsed = time.perf_counter() - start
+    db.session.expunge_all()
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, len(payload)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    app = create_app()
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+    try:
+        with app.app_context():
+            db.create_all()
+            seed(args.rows)
+            for name, (orm_query, row_query, serialize) in CASES.items():
+                orm = measure(lambda: json.dumps([obj.to_dict() for obj in orm_query().all()],
+                                                 sort_keys=True, separators=(',', ':')).encode())
+                rows = measure(lambda: app.json.dumps(serialize(row_query().all())).encode())
+                print('%-14s orm+json: %7.1f ms %7.1f MiB   rows+orjson: %7.1f ms %7.1f MiB   (%d bytes)' % (
+                    name, orm[0] * 1000, orm[1] / 2 ** 20, rows[0] * 1000, rows[1] / 2 ** 20, rows[2]))
+            db.session.remove()
+    finally:
+        os.remove(path)
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""Concurrent-connection capacity of sync workers versus the gevent entry point.
+
+For each serving profile, gunicorn is started on a temporary SQLite
+database and measured twice:
+
+  load     N connections each requesting /api/tasks back to back, for N in
+           --levels: req/s, p50/p99 and requests that failed or timed out.
+  streams  --streams idle /api/stream connections held open while
+           --probes connections request /api/tasks: how many streams were
+           accepted and what the other requests saw meanwhile.
+
+Clients are asyncio sockets, so one process can hold thousands of them.
+
+    python benchmarks/serving_capacity.py --levels 10,100,500 --streams 200
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BACKEND)
+
+import jwt
+from app import create_app
+from database import db
+from serialization import seed
+
+REQUEST_TIMEOUT = 10
+
+def profiles(args):
+    return {
+        'sync x%d' % args.sync_workers: {'GUNICORN_WORKER_CLASS': 'sync', 'GUNICORN_WORKERS': str(args.sync_workers)},
+        'gevent x%d' % args.gevent_workers: {'GUNICORN_WORKER_CLASS': 'gevent', 'GUNICORN_WORKERS': str(args.gevent_workers)},
+    }
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_server(path, port, env_overrides):
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + path, GUNICORN_BIND='127.0.0.1:%d' % port,
+               GUNICORN_TIMEOUT='120', **env_overrides)
+    server = subprocess.Popen(['gunicorn', '-c', 'gunicorn.conf.py', '--backlog', '4096'], cwd=BACKEND, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError('gunicorn did not start')
+
+class Connection:
+    """Minimal HTTP/1.1 client that reconnects when the server closes."""
+
+    def __init__(self, port, headers):
+        self.port = port
+        self.request_head = ''.join('%s: %s\r\n' % item for item in dict(headers, Host='localhost').items())
+        self.reader = self.writer = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection('127.0.0.1', self.port)
+
+    async def _head(self, path):
+        if self.writer is None:
+            await self.connect()
+        self.writer.write(('GET %s HTTP/1.1\r\n%s\r\n' % (path, self.request_head)).encode())
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = (await self.reader.readline()).decode().strip()
+            if not line:
+                return status, headers
+            name, _, value = line.partition(':')
+            headers[name.lower()] = value.strip()
+
+    async def get(self, path):
+        status, headers = await self._head(path)
+        await self.reader.readexactly(int(headers.get('content-length', 0)))
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status
+
+    async def open_stream(self, path):
+        status, _ = await self._head(path)
+        return status
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+async def connect_all(port, headers, count):
+    # Connections are opened before timing starts, so a burst of SYNs
+    # overflowing the listen queue isn't counted as request latency.
+    conns = [Connection(port, headers) for _ in range(count)]
+    await asyncio.gather(*[asyncio.wait_for(conn.connect(), REQUEST_TIMEOUT) for conn in conns], return_exceptions=True)
+    return conns
+
+async def hammer(conn, deadline, latencies, failures):
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            status = await asyncio.wait_for(conn.get('/api/tasks?limit=20'), REQUEST_TIMEOUT)
+            if status != 200:
+                failures.append(status)
+            latencies.append(time.perf_counter() - start)
+        except (asyncio.TimeoutError, OSError, ValueError, IndexError, asyncio.IncompleteReadError):
+            failures.append('error')
+            conn.close()
+    conn.close()
+
+async def hold_stream(port, headers, opened):
+    conn = Connection(port, headers)
+    try:
+        if await asyncio.wait_for(conn.open_stream('/api/stream'), REQUEST_TIMEOUT) == 200:
+            opened.append(conn)
+            return
+    except (asyncio.TimeoutError, OSError, ValueError, IndexError):
+        pass
+    conn.close()
+
+def summary(latencies, failures, seconds):
+    ordered = sorted(latencies)
+    def pick(pct):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] * 1000 if ordered else float('nan')
+    return '%7.0f req/s  p50 %8.1f ms  p99 %8.1f ms  failed %d' % (len(latencies) / seconds, pick(50), pick(99), len(failures))
+
+async def measure_load(port, headers, level, seconds):
+    conns = await connect_all(port, headers, level)
+    latencies, failures = [], []
+    deadline = time.monotonic() + seconds
+    await asyncio.gather(*[hammer(conn, deadline, latencies, failures) for conn in conns])
+    return summary(latencies, failures, seconds)
+
+async def measure_streams(port, headers, streams, probes, seconds):
+    opened = []
+    await asyncio.gather(*[hold_stream(port, headers, opened) for _ in range(streams)])
+    conns = await connect_all(port, headers, probes)
+    latencies, failures = [], []
+    deadline = time.monotonic() + seconds
+    await asyncio.gather(*[hammer(conn, deadline, latencies, failures) for conn in conns])
+    for conn in opened:
+        conn.close()
+    return '%d/%d streams open, requests: %s' % (len(opened), streams, summary(latencies, failures, seconds))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--levels', default='10,100,500', help='comma-separated connection counts')
+    parser.add_argument('--streams', type=int, default=200)
+    parser.add_argument('--probes', type=int, default=10)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--sync-workers', type=int, default=4)
+    parser.add_argument('--gevent-workers', type=int, default=1)
+    parser.add_argument('--rows', type=int, default=200)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    app = create_app()
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+    try:
+        with app.app_context():
+            db.create_all()
+            seed(args.rows)
+        token = jwt.encode({'id': 1, 'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=1)},
+                           app.config['SECRET_KEY'], algorithm='HS256')
+        headers = {'Authorization': 'Bearer ' + token}
+        for name, env in profiles(args).items():
+            port = free_port()
+            server = start_server(path, port, env)
+            try:
+                for level in [int(level) for level in args.levels.split(',')]:
+                    print('%-10s load    %5d conns  %s' % (name, level, asyncio.run(measure_load(port, headers, level, args.seconds))))
+                print('%-10s streams %s' % (name, asyncio.run(measure_streams(port, headers, args.streams, args.probes, args.seconds))))
+            finally:
+                server.terminate()
+                server.wait()
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+if __name__ == '__main__':
+    main()
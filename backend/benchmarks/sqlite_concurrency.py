@@ -0,0 +1,96 @@
+"""Measure read/write throughput of concurrent worker processes on one SQLite
+file, with SQLite's defaults versus the production pragma profile.
+
+    python benchmarks/sqlite_concurrency.py --readers 4 --writers 2 --seconds 5
+"""
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from database import DEFAULT_SQLITE_PRAGMAS, apply_sqlite_pragmas
+
+PROFILES = {
+    'default': {'journal_mode': 'DELETE', 'synchronous': 'FULL', 'busy_timeout': 0},
+    'tuned': DEFAULT_SQLITE_PRAGMAS,
+}
+
+def setup(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE grocery_items (id INTEGER PRIMARY KEY, name TEXT NOT NULL, "
+                 "is_completed BOOLEAN NOT NULL, family_id INTEGER NOT NULL)")
+    conn.execute("CREATE INDEX ix_grocery_items_family_id ON grocery_items (family_id)")
+    conn.executemany("INSERT INTO grocery_items (name, is_completed, family_id) VALUES ('item', 0, ?)",
+                     [(n % 100,) for n in range(rows)])
+    conn.commit()
+    conn.close()
+
+def worker(path, pragmas, role, seconds, result_queue):
+    conn = sqlite3.connect(path, timeout=0)
+    apply_sqlite_pragmas(conn, pragmas)
+    ops = errors = 0
+    deadline = time.monotonic() + seconds
+    n = 0
+    while time.monotonic() < deadline:
+        n += 1
+        try:
+            if role == 'reader':
+                conn.execute("SELECT * FROM grocery_items WHERE family_id = ?", (n % 100,)).fetchall()
+            else:
+                conn.execute("UPDATE grocery_items SET is_completed = NOT is_completed WHERE id = ?", (n % 1000 + 1,))
+                conn.commit()
+            ops += 1
+        except sqlite3.OperationalError:  # "database is locked"
+            errors += 1
+            if conn.in_transaction:
+                conn.rollback()
+    conn.close()
+    result_queue.put((role, ops, errors))
+
+def run(profile, args):
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    os.remove(path)
+    try:
+        setup(path, args.rows)
+        results = multiprocessing.Queue()
+        roles = ['reader'] * args.readers + ['writer'] * args.writers
+        procs = [multiprocessing.Process(target=worker, args=(path, PROFILES[profile], role, args.seconds, results))
+                 for role in roles]
+        for proc in procs:
+            proc.start()
+        totals = {'reader': [0, 0], 'writer': [0, 0]}
+        for _ in procs:
+            role, ops, errors = results.get()
+            totals[role][0] += ops
+            totals[role][1] += errors
+        for proc in procs:
+            proc.join()
+    finally:
+        for suffix in ('', '-wal', '-shm', '-journal'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    return totals
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--rows', type=int, default=10000)
+    args = parser.parse_args()
+
+    for profile in PROFILES:
+        totals = run(profile, args)
+        print('%-8s reads: %8.0f/s (%d locked)   writes: %8.0f/s (%d locked)' % (
+            profile,
+            totals['reader'][0] / args.seconds, totals['reader'][1],
+            totals['writer'][0] / args.seconds, totals['writer'][1]))
+
+if __name__ == '__main__':
+    main()
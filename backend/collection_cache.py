@@ -0,0 +1,234 @@
+"""Serialized collection responses, cached per (family_id, collection).
+
+Each entry is the JSON body of one GET (one per distinct query string) and
+the collection version it was rendered at. It is only served while that
+version is still current, so a write committing during a slow render can't
+leave stale bytes behind, and workers with their own memory cache stay
+correct. Writes name the collections they touch through bump_version; once
+the transaction commits those entries are dropped so memory goes to live
+data.
+
+Backends: `memory` is a per-process LRU capped in bytes; `sqlite:///path`
+shares one cache between every worker on the host through a local file.
+"""
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from functools import wraps
+from flask import request, g, current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from database import apply_sqlite_pragmas
+
+# Rough per-entry bookkeeping cost on top of the body, so many tiny bodies
+# can't exceed the cap unnoticed.
+ENTRY_OVERHEAD = 200
+
+class MemoryBackend:
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._variants = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def get(self, family_id, collection, variant):
+        key = (family_id, collection, variant)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, family_id, collection, variant, entry):
+        key = (family_id, collection, variant)
+        cost = len(entry[1]) + ENTRY_OVERHEAD
+        if cost > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = entry
+            self._variants[key[:2]].add(variant)
+            self.size += cost
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, family_id, collection):
+        with self._lock:
+            for variant in list(self._variants.get((family_id, collection), ())):
+                self._remove((family_id, collection, variant))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.size -= len(entry[1]) + ENTRY_OVERHEAD
+        variants = self._variants[key[:2]]
+        variants.discard(key[2])
+        if not variants:
+            del self._variants[key[:2]]
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self.size, 'max_bytes': self.max_bytes,
+                    'evictions': self.evictions}
+
+class SQLiteBackend:
+    PRUNE_EVERY = 100
+    # Hits only refresh an entry's recency this often, so reads stay reads.
+    TOUCH_AFTER = 60
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self.conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        apply_sqlite_pragmas(self.conn, {'busy_timeout': 5000, 'journal_mode': 'WAL', 'synchronous': 'OFF'})
+        self.conn.execute('CREATE TABLE IF NOT EXISTS collection_cache ('
+                          'family_id INTEGER NOT NULL, collection TEXT NOT NULL, variant TEXT NOT NULL, '
+                          'version INTEGER NOT NULL, body BLOB NOT NULL, next_cursor TEXT, '
+                          'size INTEGER NOT NULL, used REAL NOT NULL, '
+                          'PRIMARY KEY (family_id, collection, variant))')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS ix_collection_cache_used ON collection_cache (used)')
+        self.lock = threading.Lock()
+        self.sets = 0
+
+    def get(self, family_id, collection, variant):
+        with self.lock:
+            row = self.conn.execute('SELECT version, body, next_cursor, used FROM collection_cache '
+                                    'WHERE family_id = ? AND collection = ? AND variant = ?',
+                                    (family_id, collection, variant)).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if now - row[3] > self.TOUCH_AFTER:
+                self.conn.execute('UPDATE collection_cache SET used = ? WHERE family_id = ? AND collection = ? AND variant = ?',
+                                  (now, family_id, collection, variant))
+        return row[0], bytes(row[1]), row[2]
+
+    def set(self, family_id, collection, variant, entry):
+        version, body, next_cursor = entry
+        cost = len(body) + ENTRY_OVERHEAD
+        if cost > self.max_bytes:
+            return
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO collection_cache '
+                              '(family_id, collection, variant, version, body, next_cursor, size, used) '
+                              'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                              (family_id, collection, variant, version, body, next_cursor, cost, time.time()))
+            self.sets += 1
+            if self.sets % self.PRUNE_EVERY == 0:
+                self._prune()
+
+    def _prune(self):
+        excess = self.conn.execute('SELECT coalesce(sum(size), 0) FROM collection_cache').fetchone()[0] - self.max_bytes
+        if excess <= 0:
+            return
+        doomed = []
+        for rowid, size in self.conn.execute('SELECT rowid, size FROM collection_cache ORDER BY used'):
+            doomed.append((rowid,))
+            excess -= size
+            if excess <= 0:
+                break
+        self.conn.executemany('DELETE FROM collection_cache WHERE rowid = ?', doomed)
+        self.evictions += len(doomed)
+
+    def invalidate(self, family_id, collection):
+        with self.lock:
+            self.conn.execute('DELETE FROM collection_cache WHERE family_id = ? AND collection = ?', (family_id, collection))
+
+    def stats(self):
+        with self.lock:
+            entries, size = self.conn.execute('SELECT count(*), coalesce(sum(size), 0) FROM collection_cache').fetchone()
+        return {'entries': entries, 'bytes': size, 'max_bytes': self.max_bytes, 'evictions': self.evictions}
+
+def backend_from_url(url, max_bytes):
+    if url == 'memory':
+        return MemoryBackend(max_bytes)
+    if url.startswith('sqlite:///'):
+        return SQLiteBackend(url[len('sqlite:///'):], max_bytes)
+    raise ValueError('Unsupported COLLECTION_CACHE_STORAGE: %s' % url)
+
+class CollectionCache:
+    def __init__(self, backend=None):
+        self.backend = backend or MemoryBackend()
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def get(self, family_id, collection, variant, version):
+        entry = self.backend.get(family_id, collection, variant)
+        hit = entry is not None and entry[0] == version
+        with self._lock:
+            if hit:
+                self.hits[collection] += 1
+            else:
+                self.misses[collection] += 1
+        return entry if hit else None
+
+    def set(self, family_id, collection, variant, version, body, next_cursor=None):
+        self.backend.set(family_id, collection, variant, (version, body, next_cursor))
+
+    def invalidate(self, family_id, collection):
+        with self._lock:
+            self.invalidations += 1
+        self.backend.invalidate(family_id, collection)
+
+    def stats(self):
+        stats = self.backend.stats()
+        with self._lock:
+            stats.update(hits=dict(self.hits), misses=dict(self.misses), invalidations=self.invalidations)
+        return stats
+
+collection_cache = CollectionCache()
+
+def init_app(app):
+    app.config.setdefault('COLLECTION_CACHE_ENABLED', True)
+    app.config.setdefault('COLLECTION_CACHE_STORAGE', 'memory')
+    app.config.setdefault('COLLECTION_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+    collection_cache.backend = backend_from_url(app.config['COLLECTION_CACHE_STORAGE'],
+                                                app.config['COLLECTION_CACHE_MAX_BYTES'])
+
+# bump_version records what each transaction changed; the entries go once it
+# commits, and a rolled-back transaction changed nothing.
+@event.listens_for(Session, 'after_commit')
+def _invalidate_changed_collections(session):
+    for family_id, collection in session.info.pop('changed_collections', ()):
+        collection_cache.invalidate(family_id, collection)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changed_collections(session):
+    session.info.pop('changed_collections', None)
+
+def cached(collection):
+    """Serve the view's 200 JSON response from collection_cache.
+
+    Must be applied below conditional, which reads the collection version
+    the entry is checked against. Streamed responses are never cached.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if not current_app.config['COLLECTION_CACHE_ENABLED'] or request.args.get('stream'):
+                return f(*args, **kwargs)
+            family_id, version = g.current_user.family_id, g.collection_version
+            variant = request.query_string.decode('latin-1')
+            entry = collection_cache.get(family_id, collection, variant, version)
+            if entry is not None:
+                response = current_app.response_class(entry[1], mimetype='application/json')
+                if entry[2]:
+                    response.headers['X-Next-Cursor'] = entry[2]
+                return response
+
+            response = current_app.make_response(f(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed and response.mimetype == 'application/json':
+                collection_cache.set(family_id, collection, variant, version, response.get_data(),
+                                     response.headers.get('X-Next-Cursor'))
+            return response
+
+        return decorated
+
+    return decorator
@@ -1,8 +1,100 @@
-from flask_sqlalchemy import SQLAlchemy
+import sqlite3
+from flask import has_request_context, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, orm
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
 
-db = SQLAlchemy()
+READ_ONLY_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+REPLICA_BIND = 'replica'
+
+class RoutingSession(SignallingSession):
+    """Sends reads made while serving safe HTTP methods to the read replica.
+
+    Everything else - flushes, mutating requests, CLI commands and
+    migrations - stays on the primary. Without a 'replica' entry in
+    SQLALCHEMY_BINDS this behaves exactly like SignallingSession.
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        if (not self._flushing and has_request_context() and request.method in READ_ONLY_METHODS
+                and REPLICA_BIND in (self.app.config.get('SQLALCHEMY_BINDS') or {})):
+            return self.app.extensions['sqlalchemy'].db.get_engine(self.app, bind=REPLICA_BIND)
+        return SignallingSession.get_bind(self, mapper, clause)
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+db = RoutingSQLAlchemy()
+
+def normalize_database_url(url):
+    # Hosting providers still hand out postgres:// URLs, which SQLAlchemy 1.4
+    # no longer accepts.
+    if url.startswith('postgres://'):
+        return 'postgresql://' + url[len('postgres://'):]
+    return url
+
+# Dialects whose insert() has on_conflict_do_nothing/on_conflict_do_update.
+_UPSERT_INSERTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+def upsert_insert(table):
+    """insert(table) supporting ON CONFLICT on this database, or None."""
+    insert = _UPSERT_INSERTS.get(db.session().get_bind().dialect.name)
+    return insert(table) if insert else None
+
+# Production profile for file-backed SQLite: WAL lets readers proceed while a
+# writer commits, and NORMAL sync is durable in WAL mode except on power loss.
+DEFAULT_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,  # ms to wait on a locked database before failing
+    'cache_size': -64000,  # negative means KiB, so 64 MiB per connection
+    'mmap_size': 268435456,
+    'temp_store': 'MEMORY',
+}
+
+_sqlite_pragmas = dict(DEFAULT_SQLITE_PRAGMAS)
+
+def apply_sqlite_pragmas(dbapi_connection, pragmas):
+    # busy_timeout goes first so switching journal_mode waits out other
+    # workers' locks instead of failing the connection.
+    ordered = sorted(pragmas.items(), key=lambda item: item[0] != 'busy_timeout')
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in ordered:
+            cursor.execute('PRAGMA %s = %s' % (name, value))
+    finally:
+        cursor.close()
+
+@event.listens_for(Engine, 'connect')
+def _on_connect(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        apply_sqlite_pragmas(dbapi_connection, _sqlite_pragmas)
+
+def _is_sqlite_file(uri):
+    return uri.startswith('sqlite') and uri.rstrip('/') not in ('sqlite:', 'sqlite:///:memory:')
 
 def init_app(app):
+    _sqlite_pragmas.clear()
+    _sqlite_pragmas.update(app.config.get('SQLITE_PRAGMAS', DEFAULT_SQLITE_PRAGMAS))
+
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    if _is_sqlite_file(uri):
+        # Flask-SQLAlchemy falls back to NullPool for SQLite files, which
+        # reopens the file and reruns every pragma on each request.
+        options.setdefault('poolclass', QueuePool)
+        connect_args = options.setdefault('connect_args', {})
+        connect_args.setdefault('check_same_thread', False)
+    elif not uri.startswith('sqlite'):
+        options.setdefault('pool_pre_ping', True)
+    if not uri.startswith('sqlite') or _is_sqlite_file(uri):
+        options.setdefault('pool_size', app.config.get('DB_POOL_SIZE', 5))
+        options.setdefault('max_overflow', app.config.get('DB_MAX_OVERFLOW', 10))
+        options.setdefault('pool_timeout', app.config.get('DB_POOL_TIMEOUT', 30))
+
     db.init_app(app)
     # We no longer need db.create_all() here as migrations will handle it.
     # with app.app_context():
@@ -10,4 +10,4 @@ echo "Running database migrations..."
 flask db upgrade
 
 echo "Starting Gunicorn..."
-exec gunicorn --bind 0.0.0.0:8080 wsgi:app
+exec gunicorn -c gunicorn.conf.py
@@ -0,0 +1,79 @@
+import json
+import queue
+import threading
+from collections import defaultdict
+
+class Broker:
+    """In-process fan-out of change events to the family's open streams.
+
+    Only clients connected to the same worker process see an event, which is
+    why the stream is served by a single cooperative worker. A shared broker
+    only needs to provide subscribe/unsubscribe/publish to replace this one.
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, family_id):
+        subscription = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers[family_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, family_id, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(family_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[family_id]
+
+    def publish(self, family_id, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(family_id, ()))
+        for subscription in subscribers:
+            try:
+                subscription.put_nowait(event)
+            except queue.Full:
+                # A client this far behind can't catch up event by event;
+                # replace its backlog with a single request to resync.
+                _drain(subscription)
+                try:
+                    subscription.put_nowait({'type': 'resync'})
+                except queue.Full:
+                    pass
+
+    def connection_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+def _drain(subscription):
+    try:
+        while True:
+            subscription.get_nowait()
+    except queue.Empty:
+        pass
+
+broker = Broker()
+
+def publish_change(family_id, collection, action, record_id=None):
+    """Tell the family's streams that a row changed. Call after the commit."""
+    broker.publish(family_id, {'type': 'change', 'collection': collection, 'action': action, 'id': record_id})
+
+def event_stream(family_id, heartbeat=15):
+    """Yield Server-Sent Events for `family_id` until the client disconnects."""
+    subscription = broker.subscribe(family_id)
+    try:
+        yield 'retry: 5000\n\n'
+        while True:
+            try:
+                event = subscription.get(timeout=heartbeat)
+            except queue.Empty:
+                # Comment lines keep proxies from closing idle connections.
+                yield ': keepalive\n\n'
+                continue
+            yield 'event: %s\ndata: %s\n\n' % (event['type'], json.dumps(event))
+    finally:
+        broker.unsubscribe(family_id, subscription)
@@ -0,0 +1,16 @@
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8080')
+
+# /api/stream keeps one connection open per device. Cooperative gevent
+# workers hold thousands of idle streams cheaply, where a sync worker would
+# be pinned by each one. Change events fan out in-process, so all streams
+# must live in the same worker unless a shared broker is configured.
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+workers = int(os.environ.get('GUNICORN_WORKERS', '1'))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', '2000'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '30'))
+
+# The gevent worker loads the cooperative entry point; any other worker class
+# serves the plain app. An app given on the command line takes precedence.
+wsgi_app = 'wsgi_gevent:app' if worker_class == 'gevent' else 'wsgi:app'
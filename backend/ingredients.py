@@ -0,0 +1,152 @@
+"""Per-family ingredient catalog behind recipe ingredients.
+
+Every recipe ingredient points at the family's catalog entry for its
+normalized name, and the (ingredient_id, recipe_id) index turns "recipes
+using X" into an indexed join. Quantities are also stored parsed into
+(amount, unit), so totals across recipes are summed in SQL. The name and
+quantity text are kept as entered for display and search.
+"""
+from sqlalchemy import literal, bindparam
+from database import db, upsert_insert
+from models import Ingredient, RecipeIngredient
+from quantities import normalize_name, parse_quantity
+
+def catalog_ids(family_id, names):
+    """Return {normalized name: catalog id} for `names`, adding the entries
+    the family doesn't have yet to the current transaction."""
+    wanted = {}
+    for name in names:
+        wanted.setdefault(normalize_name(name), ' '.join(name.split()))
+    if not wanted:
+        return {}
+    lookup = db.session.query(Ingredient.normalized_name, Ingredient.id).filter(Ingredient.family_id == family_id)
+    ids = dict(lookup.filter(Ingredient.normalized_name.in_(list(wanted))))
+    missing = [key for key in wanted if key not in ids]
+    if missing:
+        # Skips entries a concurrent writer added first, where the database can.
+        insert = upsert_insert(Ingredient.__table__)
+        statement = insert.on_conflict_do_nothing() if insert is not None else Ingredient.__table__.insert()
+        db.session.execute(statement, [{'family_id': family_id, 'name': wanted[key], 'normalized_name': key}
+                                       for key in missing])
+        ids.update(lookup.filter(Ingredient.normalized_name.in_(missing)))
+    return ids
+
+def parsed_quantity(text):
+    """(amount, unit) to store for a quantity; (None, None) when it can't be parsed."""
+    parsed = parse_quantity(text)
+    if parsed is None:
+        return None, None
+    return float(parsed[0]), parsed[1]
+
+def ingredient_values(data, catalog):
+    """Column values for a recipe ingredient from its API dict."""
+    amount, unit = parsed_quantity(data.get('quantity'))
+    return {'name': data['name'], 'quantity': data.get('quantity'),
+            'ingredient_id': catalog[normalize_name(data['name'])], 'amount': amount, 'unit': unit}
+
+def _validate(items, replace):
+    if not isinstance(items, list):
+        raise ValueError('ingredients must be a list')
+    ids = set()
+    for item in items:
+        if not isinstance(item, dict):
+            raise ValueError('Invalid ingredient')
+        if 'name' in item and (not isinstance(item['name'], str) or not item['name'].strip()):
+            raise ValueError('Invalid ingredient name')
+        if item.get('quantity') is not None and not isinstance(item['quantity'], str):
+            raise ValueError('Invalid ingredient quantity')
+        if item.get('id') is not None:
+            if item['id'] in ids:
+                raise ValueError('Duplicate ingredient id')
+            ids.add(item['id'])
+        if 'name' not in item and (replace or item.get('id') is None):
+            raise ValueError('Ingredients need a name' if replace else 'Ingredients need an id or a name')
+    return ids
+
+def _match(rows, items, ids):
+    # Pairs each item with the row it edits: the row with its id, else the
+    # first row with the same normalized name that nothing else claimed.
+    by_name = {}
+    for row in rows.values():
+        by_name.setdefault(normalize_name(row.name), []).append(row.id)
+    claimed = set(ids)
+    pairs = []
+    for item in items:
+        if item.get('id') is not None:
+            pairs.append((item, rows[item['id']]))
+            continue
+        row_id = next((row_id for row_id in by_name.get(normalize_name(item['name']), ()) if row_id not in claimed), None)
+        if row_id is not None:
+            claimed.add(row_id)
+        pairs.append((item, rows.get(row_id)))
+    return pairs, claimed
+
+def update_ingredients(recipe_id, family_id, items, delete_ids=None):
+    """Apply ingredient edits to a recipe with one statement per kind of change.
+
+    Each item edits the row with its `id`, else an unclaimed row with the
+    same normalized name, else is added; unchanged rows aren't written, so
+    ids stay stable. With delete_ids None the list is a replacement: every
+    item needs a name, a missing quantity clears it, the list order becomes
+    the ingredient order and rows no item matched are deleted. Otherwise
+    it is a patch: fields an item leaves out keep their values, added rows
+    go last and exactly the delete_ids rows are deleted. Returns whether
+    anything changed. Raises ValueError before writing anything.
+    """
+    replace = delete_ids is None
+    ids = _validate(items, replace)
+    rows = {row.id: row for row in db.session.query(
+        RecipeIngredient.id, RecipeIngredient.name, RecipeIngredient.quantity, RecipeIngredient.ingredient_id,
+        RecipeIngredient.position
+    ).filter(RecipeIngredient.recipe_id == recipe_id).order_by(RecipeIngredient.position, RecipeIngredient.id)}
+    if not replace:
+        if not isinstance(delete_ids, list):
+            raise ValueError('delete must be a list')
+        delete_ids = set(delete_ids)
+        if delete_ids & ids:
+            raise ValueError("An ingredient can't be both edited and deleted")
+        ids |= delete_ids
+    if ids - set(rows):
+        raise ValueError('Unknown ingredient id')
+
+    # Rows being deleted are claimed too, so no name match picks them.
+    pairs, claimed = _match(rows, items, ids)
+    doomed = set(rows) - claimed if replace else delete_ids
+    renamed = [item['name'] for item, row in pairs
+               if row is None or ('name' in item and normalize_name(item['name']) != normalize_name(row.name))]
+    catalog = catalog_ids(family_id, renamed)
+
+    updates, inserts = [], []
+    next_position = max((row.position for row in rows.values()), default=-1) + 1
+    for index, (item, row) in enumerate(pairs):
+        if row is None:
+            position = index if replace else next_position + len(inserts)
+            inserts.append(dict(ingredient_values(item, catalog), recipe_id=recipe_id, position=position))
+            continue
+        if replace:
+            name, quantity, position = item['name'], item.get('quantity'), index
+        else:
+            name, quantity, position = item.get('name', row.name), item.get('quantity', row.quantity), row.position
+        if (name, quantity, position) == (row.name, row.quantity, row.position):
+            continue
+        amount, unit = parsed_quantity(quantity)
+        updates.append({'row_id': row.id, 'name': name, 'quantity': quantity, 'amount': amount, 'unit': unit,
+                        'position': position, 'ingredient_id': catalog.get(normalize_name(name), row.ingredient_id)})
+
+    table = RecipeIngredient.__table__
+    if updates:
+        db.session.execute(table.update().where(table.c.id == bindparam('row_id')), updates)
+    if inserts:
+        db.session.execute(table.insert(), inserts)
+    if doomed:
+        RecipeIngredient.query.filter(RecipeIngredient.id.in_(doomed)).delete(synchronize_session=False)
+    return bool(updates or inserts or doomed)
+
+def recipes_using(family_id, name):
+    """Query of the ids of the family's recipes with an ingredient whose
+    catalog name contains `name` as whole words: 'egg' matches 'egg yolk'
+    but not 'eggplant'."""
+    padded = literal(' ') + Ingredient.normalized_name + literal(' ')
+    entries = db.session.query(Ingredient.id).filter(
+        Ingredient.family_id == family_id, padded.contains(' %s ' % normalize_name(name), autoescape=True))
+    return db.session.query(RecipeIngredient.recipe_id).filter(RecipeIngredient.ingredient_id.in_(entries))
@@ -0,0 +1,303 @@
+"""Durable background jobs with retries and cron-like schedules.
+
+A job is a row in `jobs`, added to the caller's transaction, so a job
+enqueued by a handler exists exactly when the handler's writes commit. Each
+process runs JOBS_WORKERS threads (greenlets under gevent) that claim due
+jobs with a conditional UPDATE, so any number of processes can share the
+table. A job that raises is retried with exponential backoff until
+max_attempts and then kept as 'failed' with its last error. A job's own
+writes commit together with its 'done' status.
+
+Periodic jobs are declared with a five-field cron expression. Their next
+run time lives in job_schedules and is advanced with a conditional UPDATE,
+so each slot is enqueued once however many processes are running.
+
+With JOBS_EAGER, jobs enqueued by a request run in-process right after it,
+before the response is returned. Tests use that, or call run_pending().
+"""
+import datetime
+import json
+import logging
+import threading
+from collections import namedtuple, defaultdict
+import click
+from flask import g, has_request_context, current_app
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from database import db
+from models import Job, JobSchedule
+
+logger = logging.getLogger(__name__)
+
+JobSpec = namedtuple('JobSpec', ['func', 'max_attempts', 'backoff'])
+
+_registry = {}
+_schedules = {}
+
+# Outcomes of the jobs this process ran, by job name, for /metrics.
+outcomes = defaultdict(int)
+_outcomes_lock = threading.Lock()
+
+def job(name=None, max_attempts=5, backoff=30):
+    """Register a function as a job. It is called with the enqueued payload
+    as keyword arguments; `backoff` seconds double after each failure."""
+    def decorator(f):
+        _registry[name or f.__name__] = JobSpec(f, max_attempts, backoff)
+        return f
+    return decorator
+
+def periodic(cron, name=None, max_attempts=3, backoff=60):
+    """Register a job that is enqueued on the cron schedule, in UTC."""
+    schedule = Cron(cron)
+    def decorator(f):
+        job_name = name or f.__name__
+        job(job_name, max_attempts, backoff)(f)
+        _schedules[job_name] = schedule
+        return f
+    return decorator
+
+def enqueue(name, payload=None, delay=0):
+    """Add a job to the current transaction; it runs once that commits."""
+    if name not in _registry:
+        raise KeyError('Unknown job: %s' % name)
+    row = Job(name=name, payload=json.dumps(payload or {}), status='pending', attempts=0,
+              max_attempts=_registry[name].max_attempts,
+              run_at=datetime.datetime.utcnow() + datetime.timedelta(seconds=delay))
+    db.session.add(row)
+    db.session.info['jobs_enqueued'] = True
+    if has_request_context():
+        g.jobs_enqueued = True
+    return row
+
+def _record(name, outcome):
+    with _outcomes_lock:
+        outcomes[(name, outcome)] += 1
+
+def outcome_counts():
+    with _outcomes_lock:
+        return dict(outcomes)
+
+def _claim(now):
+    candidates = db.session.query(Job.id).filter(Job.status == 'pending', Job.run_at <= now).order_by(
+        Job.run_at, Job.id).limit(10).all()
+    for (job_id,) in candidates:
+        # Another worker may have taken it since the SELECT; only one UPDATE wins.
+        claimed = Job.query.filter(Job.id == job_id, Job.status == 'pending').update(
+            {Job.status: 'running', Job.locked_at: now, Job.attempts: Job.attempts + 1}, synchronize_session=False)
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, job_id)
+    return None
+
+def _execute(row):
+    spec = _registry.get(row.name)
+    job_id, name = row.id, row.name
+    try:
+        if spec is None:
+            raise LookupError('Unknown job: %s' % name)
+        spec.func(**json.loads(row.payload))
+        row.status = 'done'
+        row.finished_at = datetime.datetime.utcnow()
+        row.last_error = None
+        db.session.commit()
+        _record(name, 'done')
+    except Exception as e:
+        db.session.rollback()
+        logger.exception('Job %s (%d) failed', name, job_id)
+        row = db.session.get(Job, job_id)
+        now = datetime.datetime.utcnow()
+        row.last_error = '%s: %s' % (type(e).__name__, e)
+        if row.attempts >= row.max_attempts or spec is None:
+            row.status = 'failed'
+            row.finished_at = now
+            _record(name, 'failed')
+        else:
+            row.status = 'pending'
+            row.run_at = now + datetime.timedelta(seconds=spec.backoff * 2 ** (row.attempts - 1))
+            _record(name, 'retried')
+        db.session.commit()
+
+def run_pending(now=None, limit=None):
+    """Run due jobs in the calling thread until none are left; returns how
+    many ran. Needs an app context."""
+    ran = 0
+    while limit is None or ran < limit:
+        row = _claim(now or datetime.datetime.utcnow())
+        if row is None:
+            break
+        _execute(row)
+        ran += 1
+    return ran
+
+def enqueue_scheduled(now=None):
+    """Enqueue every periodic job whose slot has come, and recover jobs left
+    'running' by a process that died."""
+    now = now or datetime.datetime.utcnow()
+    schedules = {row.name: row for row in JobSchedule.query}
+    for name, cron in _schedules.items():
+        row = schedules.get(name)
+        if row is None or row.cron != cron.expression:
+            # New or changed schedule: the next slot counts from now.
+            if row is None:
+                db.session.add(JobSchedule(name=name, cron=cron.expression, next_run_at=cron.next_after(now)))
+            else:
+                row.cron, row.next_run_at = cron.expression, cron.next_after(now)
+            try:
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+            continue
+        if row.next_run_at <= now:
+            advanced = JobSchedule.query.filter(JobSchedule.name == name, JobSchedule.next_run_at == row.next_run_at).update(
+                {JobSchedule.next_run_at: cron.next_after(now)}, synchronize_session=False)
+            if advanced:
+                enqueue(name)
+            db.session.commit()
+
+    stale = now - datetime.timedelta(seconds=_pool.lock_timeout)
+    Job.query.filter(Job.status == 'running', Job.locked_at < stale).update(
+        {Job.status: 'pending', Job.run_at: now}, synchronize_session=False)
+    db.session.commit()
+
+class Cron:
+    """Five-field cron expression: minute hour day-of-month month day-of-week.
+
+    Fields take *, numbers, ranges (1-5), lists (1,15) and steps (*/10,
+    8-18/2); day-of-week counts from Sunday = 0 (7 is Sunday too). As in
+    cron, a restricted day-of-month and day-of-week match either one.
+    """
+    RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError('Cron expressions have five fields: %r' % expression)
+        self.expression = ' '.join(fields)
+        self.minutes, self.hours, self.days, self.months, weekdays = [
+            _parse_field(field, low, high) for field, (low, high) in zip(fields, self.RANGES)]
+        self.weekdays = {day % 7 for day in weekdays}
+        self.any_day, self.any_weekday = fields[2] == '*', fields[4] == '*'
+
+    def _day_matches(self, moment):
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, moment):
+        """The first matching minute strictly after `moment`."""
+        t = moment.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        limit = t.year + 5
+        while t.year <= limit:
+            if t.month not in self.months:
+                t = (t.replace(day=1, hour=0, minute=0) + datetime.timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + datetime.timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = t.replace(minute=0) + datetime.timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                t += datetime.timedelta(minutes=1)
+            else:
+                return t
+        raise ValueError('Cron expression never matches: %s' % self.expression)
+
+def _parse_field(field, low, high):
+    values = set()
+    for part in field.split(','):
+        spec, _, step = part.partition('/')
+        if spec == '*':
+            start, end = low, high
+        elif '-' in spec:
+            start, end = (int(value) for value in spec.split('-', 1))
+        else:
+            start = end = int(spec)
+        step = int(step) if step else 1
+        if not low <= start <= end <= high or step < 1:
+            raise ValueError('Invalid cron field: %r' % field)
+        values.update(range(start, end + 1, step))
+    return values
+
+class WorkerPool:
+    def __init__(self):
+        self.workers = 0
+        self.poll_interval = 5
+        self.lock_timeout = 600
+        self._wake = threading.Event()
+        self._threads = []
+
+    def start(self, app):
+        if self._threads or not self.workers:
+            return
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._loop, args=(app, number == 0), name='jobs-%d' % number, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def wake(self):
+        self._wake.set()
+
+    def _loop(self, app, schedules):
+        while True:
+            ran = 0
+            try:
+                with app.app_context():
+                    if schedules:
+                        enqueue_scheduled()
+                    ran = run_pending(limit=100)
+            except Exception:
+                logger.exception('Job worker iteration failed')
+            if not ran:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+_pool = WorkerPool()
+
+@event.listens_for(Session, 'after_commit')
+def _wake_workers(session):
+    if session.info.pop('jobs_enqueued', False):
+        _pool.wake()
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_enqueued(session):
+    session.info.pop('jobs_enqueued', None)
+
+def _run_eager(response):
+    if g.pop('jobs_enqueued', False):
+        run_pending()
+    return response
+
+def start_workers(app):
+    """Start this process's worker pool; called by the WSGI entry points so
+    CLI commands and tests don't spawn workers."""
+    _pool.start(app)
+
+def init_app(app):
+    app.config.setdefault('JOBS_WORKERS', 2)
+    app.config.setdefault('JOBS_POLL_INTERVAL', 5)
+    app.config.setdefault('JOBS_LOCK_TIMEOUT', 600)
+    app.config.setdefault('JOBS_EAGER', False)
+    _pool.workers = app.config['JOBS_WORKERS']
+    _pool.poll_interval = app.config['JOBS_POLL_INTERVAL']
+    _pool.lock_timeout = app.config['JOBS_LOCK_TIMEOUT']
+    if app.config['JOBS_EAGER']:
+        app.after_request(_run_eager)
+    app.cli.add_command(jobs_cli)
+
+@click.group('jobs', help='Run background jobs outside the web workers.')
+def jobs_cli():
+    pass
+
+@jobs_cli.command('run', help='Enqueue scheduled jobs and run everything due, then exit.')
+def _run_command():
+    enqueue_scheduled()
+    click.echo('Ran %d job(s)' % run_pending())
+
+@jobs_cli.command('work', help='Process jobs until interrupted.')
+@click.option('--workers', default=1, show_default=True)
+def _work_command(workers):
+    _pool.workers = workers
+    _pool.start(current_app._get_current_object())
+    for thread in _pool._threads:
+        thread.join()
@@ -0,0 +1,35 @@
+"""Periodic housekeeping jobs."""
+import datetime
+from flask import current_app
+from sqlalchemy import text
+from database import db
+from jobs import periodic
+from models import Job, Tombstone
+import search
+import archive
+
+@periodic('17 3 * * *')
+def prune_tombstones():
+    # Syncs older than the retention window are answered with a full sync,
+    # so their tombstones are no longer needed.
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=current_app.config['SYNC_TOMBSTONE_RETENTION_DAYS'])
+    Tombstone.query.filter(Tombstone.deleted_at < cutoff).delete(synchronize_session=False)
+
+@periodic('37 3 * * *')
+def prune_finished_jobs():
+    # Failed jobs are kept for inspection.
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=current_app.config['JOBS_RETENTION_DAYS'])
+    Job.query.filter(Job.status == 'done', Job.finished_at < cutoff).delete(synchronize_session=False)
+
+@periodic('27 3 * * *')
+def archive_old_rows():
+    archive.archive_expired()
+
+@periodic('47 3 * * 0')
+def optimize_database():
+    """Merge the search index's segments and refresh SQLite's planner statistics."""
+    if db.session().get_bind().dialect.name != 'sqlite':
+        return
+    if search.fts_available():
+        db.session.execute(text("INSERT INTO search_index (search_index) VALUES ('optimize')"))
+    db.session.execute(text('PRAGMA optimize'))
@@ -0,0 +1,253 @@
+"""Per-endpoint request metrics in Prometheus text format, and an opt-in
+profiler for slow requests.
+
+Every request records its latency, response size, and the number and total
+time of the SQL statements it ran, labelled by URL rule so cardinality stays
+bounded. Metrics live in the worker process; scrape each worker (the default
+deployment runs one) or put them behind a per-worker port. /metrics wants
+METRICS_TOKEN as a bearer token; without one it only answers clients on
+this host.
+"""
+import cProfile
+import ipaddress
+import logging
+import os
+import random
+import threading
+import time
+from flask import g, request, has_request_context, Response, current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from auth import principal_cache
+from collection_cache import collection_cache
+from events import broker
+import jobs
+from database import db
+from models import Job
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SQL_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join('%s="%s"' % (name, value) for (name, _), value in zip(labels, escaped)) + '}'
+
+class Counter:
+    def __init__(self, name, documentation, labelnames):
+        self.name, self.documentation, self.labelnames = name, documentation, labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def expose(self):
+        lines = ['# HELP %s %s' % (self.name, self.documentation), '# TYPE %s counter' % self.name]
+        with self._lock:
+            for labelvalues, value in sorted(self._values.items()):
+                lines.append('%s%s %s' % (self.name, _format_labels(list(zip(self.labelnames, labelvalues))), value))
+        return lines
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames, buckets):
+        self.name, self.documentation, self.labelnames, self.buckets = name, documentation, labelnames, buckets
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        with self._lock:
+            counts, total, count = self._values.get(labelvalues) or ([0] * len(self.buckets), 0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[labelvalues] = (counts, total + value, count + 1)
+
+    def expose(self):
+        lines = ['# HELP %s %s' % (self.name, self.documentation), '# TYPE %s histogram' % self.name]
+        with self._lock:
+            for labelvalues, (counts, total, count) in sorted(self._values.items()):
+                labels = list(zip(self.labelnames, labelvalues))
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append('%s_bucket%s %d' % (self.name, _format_labels(labels + [('le', bound)]), bucket_count))
+                lines.append('%s_bucket%s %d' % (self.name, _format_labels(labels + [('le', '+Inf')]), count))
+                lines.append('%s_sum%s %s' % (self.name, _format_labels(labels), total))
+                lines.append('%s_count%s %d' % (self.name, _format_labels(labels), count))
+        return lines
+
+REQUESTS = Counter('http_requests_total', 'Requests served.', ('endpoint', 'method', 'status'))
+LATENCY = Histogram('http_request_duration_seconds', 'Time spent in the handler, excluding streamed bodies.',
+                    ('endpoint', 'method'), LATENCY_BUCKETS)
+SQL_STATEMENTS = Histogram('http_request_sql_statements', 'SQL statements executed per request.',
+                           ('endpoint', 'method'), SQL_COUNT_BUCKETS)
+SQL_DURATION = Histogram('http_request_sql_duration_seconds', 'Time spent executing SQL per request.',
+                         ('endpoint', 'method'), LATENCY_BUCKETS)
+RESPONSE_SIZE = Histogram('http_response_size_bytes', 'Response body size as sent, when known up front.',
+                          ('endpoint', 'method'), SIZE_BUCKETS)
+
+# Callables returning (name, type, help, [(labels, value)]) for values that
+# are read at scrape time rather than recorded per request.
+collectors = []
+
+def register_collector(collect):
+    collectors.append(collect)
+    return collect
+
+@register_collector
+def _principal_cache_metrics():
+    stats = principal_cache.stats()
+    return [
+        ('auth_principal_cache_entries', 'gauge', 'Principals currently cached.', [([], stats['size'])]),
+        ('auth_principal_cache_hits_total', 'counter', 'Principal cache hits.', [([], stats['hits'])]),
+        ('auth_principal_cache_misses_total', 'counter', 'Principal cache misses.', [([], stats['misses'])]),
+        ('auth_principal_cache_evictions_total', 'counter', 'Principals evicted for space.', [([], stats['evictions'])]),
+    ]
+
+@register_collector
+def _collection_cache_metrics():
+    stats = collection_cache.stats()
+    lookups = sum(stats['hits'].values()) + sum(stats['misses'].values())
+    return [
+        ('collection_cache_entries', 'gauge', 'Collection responses currently cached.', [([], stats['entries'])]),
+        ('collection_cache_bytes', 'gauge', 'Approximate size of the cached responses.', [([], stats['bytes'])]),
+        ('collection_cache_max_bytes', 'gauge', 'Configured size cap.', [([], stats['max_bytes'])]),
+        ('collection_cache_hits_total', 'counter', 'Responses served from the cache.',
+         [([('collection', name)], count) for name, count in sorted(stats['hits'].items())]),
+        ('collection_cache_misses_total', 'counter', 'Lookups that had to render the response.',
+         [([('collection', name)], count) for name, count in sorted(stats['misses'].items())]),
+        ('collection_cache_hit_ratio', 'gauge', 'Hits over lookups since the worker started.',
+         [([], sum(stats['hits'].values()) / lookups if lookups else 0)]),
+        ('collection_cache_evictions_total', 'counter', 'Entries evicted for space.', [([], stats['evictions'])]),
+        ('collection_cache_invalidations_total', 'counter', 'Collections invalidated by committed writes.',
+         [([], stats['invalidations'])]),
+    ]
+
+@register_collector
+def _job_metrics():
+    queued = db.session.query(Job.status, db.func.count()).group_by(Job.status).all()
+    outcomes = sorted(jobs.outcome_counts().items())
+    return [
+        ('jobs_queued', 'gauge', 'Jobs in the queue table by status.', [([('status', status)], count) for status, count in queued]),
+        ('jobs_processed_total', 'counter', 'Job runs in this process by outcome.',
+         [([('job', name), ('outcome', outcome)], count) for (name, outcome), count in outcomes]),
+    ]
+
+@register_collector
+def _stream_metrics():
+    return [('event_stream_connections', 'gauge', 'Open /api/stream connections.', [([], broker.connection_count())])]
+
+def render():
+    lines = []
+    for metric in (REQUESTS, LATENCY, SQL_STATEMENTS, SQL_DURATION, RESPONSE_SIZE):
+        lines.extend(metric.expose())
+    for collect in collectors:
+        for name, kind, documentation, samples in collect():
+            lines.append('# HELP %s %s' % (name, documentation))
+            lines.append('# TYPE %s %s' % (name, kind))
+            lines.extend('%s%s %s' % (name, _format_labels(labels), value) for labels, value in samples)
+    return '\n'.join(lines) + '\n'
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is None or not has_request_context() or 'sql_count' not in g:
+        return
+    g.sql_count += 1
+    g.sql_time += time.perf_counter() - context._metrics_started
+
+# One profile at a time: cProfile can't nest within a thread, and under
+# gevent every greenlet shares it, so a profile also contains whatever
+# other requests ran while it was open.
+_profiler_lock = threading.Lock()
+
+def _should_profile(config):
+    mode = config['PROFILE_MODE']
+    if mode == 'header':
+        return request.headers.get('X-Profile') == '1'
+    if mode == 'sample':
+        return random.random() < config['PROFILE_SAMPLE_RATE']
+    return False
+
+def _start_request():
+    g.request_started = time.perf_counter()
+    g.sql_count = 0
+    g.sql_time = 0.0
+    if _should_profile(current_app.config) and _profiler_lock.acquire(blocking=False):
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+def _record_request(response):
+    elapsed = time.perf_counter() - g.pop('request_started', time.perf_counter())
+    endpoint = request.url_rule.rule if request.url_rule else '<unmatched>'
+    labels = (endpoint, request.method)
+    REQUESTS.inc(endpoint, request.method, response.status_code)
+    LATENCY.observe(elapsed, *labels)
+    SQL_STATEMENTS.observe(g.get('sql_count', 0), *labels)
+    SQL_DURATION.observe(g.get('sql_time', 0.0), *labels)
+    if response.content_length is not None:
+        RESPONSE_SIZE.observe(response.content_length, *labels)
+
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        _finish_profile(profiler, elapsed, endpoint)
+    return response
+
+def _finish_profile(profiler, elapsed, endpoint):
+    try:
+        profiler.disable()
+        config = current_app.config
+        ms = int(elapsed * 1000)
+        if ms >= config['PROFILE_SLOW_MS'] or request.headers.get('X-Profile') == '1':
+            os.makedirs(config['PROFILE_DIR'], exist_ok=True)
+            path = os.path.join(config['PROFILE_DIR'], '%d-%s-%s-%dms.prof' % (
+                time.time() * 1000, request.method, endpoint.strip('/').replace('/', '_') or 'root', ms))
+            profiler.dump_stats(path)
+            logger.warning('Profiled %s %s (%d ms): %s', request.method, request.path, ms, path)
+    finally:
+        _profiler_lock.release()
+
+def _discard_profile(exc):
+    # Requests that never reached after_request must still free the profiler.
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        _profiler_lock.release()
+
+def _is_loopback(address):
+    try:
+        return ipaddress.ip_address(address or '').is_loopback
+    except ValueError:
+        return False
+
+def _metrics_view():
+    token = current_app.config['METRICS_TOKEN']
+    if token:
+        if request.headers.get('Authorization') != 'Bearer ' + token:
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    elif not _is_loopback(request.remote_addr):
+        # Behind a reverse proxy on this host every client looks local, so
+        # such deployments need a token.
+        return Response('Forbidden\n', status=403, mimetype='text/plain')
+    return Response(render(), mimetype='text/plain; version=0.0.4')
+
+def init_app(app):
+    app.config.setdefault('METRICS_TOKEN', None)
+    app.config.setdefault('PROFILE_MODE', 'off')
+    app.config.setdefault('PROFILE_SAMPLE_RATE', 0.01)
+    app.config.setdefault('PROFILE_SLOW_MS', 500)
+    app.config.setdefault('PROFILE_DIR', 'profiles')
+    # Registered before the other middleware so this after_request runs last
+    # and sees the final, compressed response size.
+    app.before_request(_start_request)
+    app.after_request(_record_request)
+    app.teardown_request(_discard_profile)
+    app.add_url_rule('/metrics', 'metrics', _metrics_view)
@@ -0,0 +1,81 @@
+import gzip
+import zlib
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = frozenset(['application/json', 'application/x-ndjson', 'text/plain', 'text/html'])
+
+def init_app(app):
+    app.config.setdefault('COMPRESS_MIN_SIZE', 500)
+    app.config.setdefault('COMPRESS_LEVEL', 6)
+    app.config.setdefault('COMPRESS_BROTLI_QUALITY', 4)
+    app.after_request(_set_cache_headers)
+    app.after_request(_compress)
+
+def _choose_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+def _compress(response):
+    if (response.mimetype not in COMPRESSIBLE_MIMETYPES or response.direct_passthrough
+            or 'Content-Encoding' in response.headers or not 200 <= response.status_code < 300):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = _choose_encoding()
+    if encoding is None:
+        return response
+
+    config = current_app.config
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoding, config)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < config['COMPRESS_MIN_SIZE']:
+            return response
+        if encoding == 'br':
+            response.set_data(brotli.compress(data, quality=config['COMPRESS_BROTLI_QUALITY']))
+        else:
+            response.set_data(gzip.compress(data, compresslevel=config['COMPRESS_LEVEL']))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+def _compress_stream(chunks, encoding, config):
+    # Each upstream chunk is flushed so clients can start parsing rows before
+    # the whole stream has been produced.
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=config['COMPRESS_BROTLI_QUALITY'])
+        compress, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(config['COMPRESS_LEVEL'], zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        compress, flush = compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+        finish = compressor.flush
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        data = compress(chunk) + flush()
+        if data:
+            yield data
+    yield finish()
+
+def _set_cache_headers(response):
+    if not request.path.startswith('/api/'):
+        return response
+    # Responses depend on the caller's token, so shared caches must key on it.
+    response.vary.add('Authorization')
+    if 'Cache-Control' not in response.headers:
+        if request.method in ('GET', 'HEAD') and response.status_code in (200, 304):
+            # Private and always revalidated: clients reuse their copy via
+            # If-None-Match and the collection ETags.
+            response.headers['Cache-Control'] = 'private, no-cache'
+        else:
+            response.headers['Cache-Control'] = 'no-store'
+    return response
@@ -0,0 +1,36 @@
+"""Add family-scoped composite indexes
+
+Revision ID: 12990d5de6e5
+Revises: 501ece5e4f56
+Create Date: 2026-10-18 10:12:41.204518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '12990d5de6e5'
+down_revision = '501ece5e4f56'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_users_family_id', 'users', ['family_id'], unique=False)
+    op.create_index('ix_tasks_family_id_completed_due_date', 'tasks', ['family_id', 'completed', 'due_date'], unique=False)
+    op.create_index('ix_grocery_items_family_id_is_completed_category', 'grocery_items', ['family_id', 'is_completed', 'category'], unique=False)
+    op.create_index('ix_meals_family_id_date', 'meals', ['family_id', 'date'], unique=False)
+    op.create_index('ix_recipes_family_id', 'recipes', ['family_id'], unique=False)
+    op.create_index('ix_recipe_ingredients_recipe_id', 'recipe_ingredients', ['recipe_id'], unique=False)
+    op.create_index('ix_thoughts_family_id_id', 'thoughts', ['family_id', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_thoughts_family_id_id', table_name='thoughts')
+    op.drop_index('ix_recipe_ingredients_recipe_id', table_name='recipe_ingredients')
+    op.drop_index('ix_recipes_family_id', table_name='recipes')
+    op.drop_index('ix_meals_family_id_date', table_name='meals')
+    op.drop_index('ix_grocery_items_family_id_is_completed_category', table_name='grocery_items')
+    op.drop_index('ix_tasks_family_id_completed_due_date', table_name='tasks')
+    op.drop_index('ix_users_family_id', table_name='users')
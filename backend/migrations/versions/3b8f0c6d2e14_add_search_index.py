@@ -0,0 +1,131 @@
+"""Add the FTS5 search index and the triggers that keep it in sync
+
+Revision ID: 3b8f0c6d2e14
+Revises: d4a7e91c05b2
+Create Date: 2026-10-18 14:02:37.540911
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3b8f0c6d2e14'
+down_revision = 'd4a7e91c05b2'
+branch_labels = None
+depends_on = None
+
+# One document per searchable row. The rowid encodes the source row as
+# id * 8 + kind (1 tasks, 2 recipes, 3 thoughts, 4 grocery_items) so
+# triggers update documents by rowid. `family` holds 'f<family_id>' and is
+# matched as a column filter, keeping every query inside one family's
+# postings. `extra` carries a recipe's ingredient names.
+CREATE_INDEX = """
+CREATE VIRTUAL TABLE search_index USING fts5(
+    family, title, body, extra,
+    tokenize = 'porter unicode61'
+)
+"""
+
+RECIPE_INGREDIENTS = "(SELECT coalesce(group_concat(name, ' '), '') FROM recipe_ingredients WHERE recipe_id = %s)"
+
+TRIGGERS = {
+    'tasks_search_insert': """
+        CREATE TRIGGER tasks_search_insert AFTER INSERT ON tasks BEGIN
+            INSERT INTO search_index (rowid, family, title, body, extra)
+            VALUES (NEW.id * 8 + 1, 'f' || NEW.family_id, NEW.title, coalesce(NEW.description, ''), '');
+        END""",
+    'tasks_search_update': """
+        CREATE TRIGGER tasks_search_update AFTER UPDATE OF title, description ON tasks BEGIN
+            UPDATE search_index SET title = NEW.title, body = coalesce(NEW.description, '')
+            WHERE rowid = NEW.id * 8 + 1;
+        END""",
+    'tasks_search_delete': """
+        CREATE TRIGGER tasks_search_delete AFTER DELETE ON tasks BEGIN
+            DELETE FROM search_index WHERE rowid = OLD.id * 8 + 1;
+        END""",
+    'recipes_search_insert': """
+        CREATE TRIGGER recipes_search_insert AFTER INSERT ON recipes BEGIN
+            INSERT INTO search_index (rowid, family, title, body, extra)
+            VALUES (NEW.id * 8 + 2, 'f' || NEW.family_id, NEW.name, coalesce(NEW.instructions, ''),
+                    %s);
+        END""" % (RECIPE_INGREDIENTS % 'NEW.id'),
+    'recipes_search_update': """
+        CREATE TRIGGER recipes_search_update AFTER UPDATE OF name, instructions ON recipes BEGIN
+            UPDATE search_index SET title = NEW.name, body = coalesce(NEW.instructions, '')
+            WHERE rowid = NEW.id * 8 + 2;
+        END""",
+    'recipes_search_delete': """
+        CREATE TRIGGER recipes_search_delete AFTER DELETE ON recipes BEGIN
+            DELETE FROM search_index WHERE rowid = OLD.id * 8 + 2;
+        END""",
+    'recipe_ingredients_search_insert': """
+        CREATE TRIGGER recipe_ingredients_search_insert AFTER INSERT ON recipe_ingredients BEGIN
+            UPDATE search_index SET extra = %s WHERE rowid = NEW.recipe_id * 8 + 2;
+        END""" % (RECIPE_INGREDIENTS % 'NEW.recipe_id'),
+    'recipe_ingredients_search_update': """
+        CREATE TRIGGER recipe_ingredients_search_update AFTER UPDATE OF name, recipe_id ON recipe_ingredients BEGIN
+            UPDATE search_index SET extra = %s WHERE rowid = OLD.recipe_id * 8 + 2;
+            UPDATE search_index SET extra = %s WHERE rowid = NEW.recipe_id * 8 + 2;
+        END""" % (RECIPE_INGREDIENTS % 'OLD.recipe_id', RECIPE_INGREDIENTS % 'NEW.recipe_id'),
+    'recipe_ingredients_search_delete': """
+        CREATE TRIGGER recipe_ingredients_search_delete AFTER DELETE ON recipe_ingredients BEGIN
+            UPDATE search_index SET extra = %s WHERE rowid = OLD.recipe_id * 8 + 2;
+        END""" % (RECIPE_INGREDIENTS % 'OLD.recipe_id'),
+    'thoughts_search_insert': """
+        CREATE TRIGGER thoughts_search_insert AFTER INSERT ON thoughts BEGIN
+            INSERT INTO search_index (rowid, family, title, body, extra)
+            VALUES (NEW.id * 8 + 3, 'f' || NEW.family_id, '', NEW.content, '');
+        END""",
+    'thoughts_search_update': """
+        CREATE TRIGGER thoughts_search_update AFTER UPDATE OF content ON thoughts BEGIN
+            UPDATE search_index SET body = NEW.content WHERE rowid = NEW.id * 8 + 3;
+        END""",
+    'thoughts_search_delete': """
+        CREATE TRIGGER thoughts_search_delete AFTER DELETE ON thoughts BEGIN
+            DELETE FROM search_index WHERE rowid = OLD.id * 8 + 3;
+        END""",
+    'grocery_items_search_insert': """
+        CREATE TRIGGER grocery_items_search_insert AFTER INSERT ON grocery_items BEGIN
+            INSERT INTO search_index (rowid, family, title, body, extra)
+            VALUES (NEW.id * 8 + 4, 'f' || NEW.family_id, NEW.name, NEW.category, '');
+        END""",
+    'grocery_items_search_update': """
+        CREATE TRIGGER grocery_items_search_update AFTER UPDATE OF name, category ON grocery_items BEGIN
+            UPDATE search_index SET title = NEW.name, body = NEW.category WHERE rowid = NEW.id * 8 + 4;
+        END""",
+    'grocery_items_search_delete': """
+        CREATE TRIGGER grocery_items_search_delete AFTER DELETE ON grocery_items BEGIN
+            DELETE FROM search_index WHERE rowid = OLD.id * 8 + 4;
+        END""",
+}
+
+BACKFILL = [
+    "INSERT INTO search_index (rowid, family, title, body, extra) "
+    "SELECT id * 8 + 1, 'f' || family_id, title, coalesce(description, ''), '' FROM tasks",
+    "INSERT INTO search_index (rowid, family, title, body, extra) "
+    "SELECT id * 8 + 2, 'f' || family_id, name, coalesce(instructions, ''), %s FROM recipes"
+    % (RECIPE_INGREDIENTS % 'recipes.id'),
+    "INSERT INTO search_index (rowid, family, title, body, extra) "
+    "SELECT id * 8 + 3, 'f' || family_id, '', content, '' FROM thoughts",
+    "INSERT INTO search_index (rowid, family, title, body, extra) "
+    "SELECT id * 8 + 4, 'f' || family_id, name, category, '' FROM grocery_items",
+]
+
+
+def upgrade():
+    # Other engines have no FTS5; search.py falls back to LIKE matching there.
+    if op.get_context().dialect.name != 'sqlite':
+        return
+    op.execute(CREATE_INDEX)
+    for statement in BACKFILL:
+        op.execute(statement)
+    for trigger in TRIGGERS.values():
+        op.execute(trigger)
+
+
+def downgrade():
+    if op.get_context().dialect.name != 'sqlite':
+        return
+    for name in TRIGGERS:
+        op.execute('DROP TRIGGER IF EXISTS %s' % name)
+    op.execute('DROP TABLE IF EXISTS search_index')
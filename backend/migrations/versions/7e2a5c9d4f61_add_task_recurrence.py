@@ -0,0 +1,38 @@
+"""Add recurrence rules to tasks and the task_occurrences completion table
+
+Revision ID: 7e2a5c9d4f61
+Revises: 3b8f0c6d2e14
+Create Date: 2026-10-18 16:40:12.204518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7e2a5c9d4f61'
+down_revision = '3b8f0c6d2e14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('tasks', sa.Column('recurrence', sa.String(length=200), nullable=True))
+    op.add_column('tasks', sa.Column('recurrence_end', sa.DateTime(), nullable=True))
+    op.create_index('ix_tasks_family_id_due_date', 'tasks', ['family_id', 'due_date'], unique=False)
+    op.create_table('task_occurrences',
+    sa.Column('task_id', sa.Integer(), nullable=False),
+    sa.Column('occurrence', sa.DateTime(), nullable=False),
+    sa.Column('completed_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['task_id'], ['tasks.id'], ),
+    sa.PrimaryKeyConstraint('task_id', 'occurrence')
+    )
+
+
+def downgrade():
+    op.drop_table('task_occurrences')
+    op.drop_index('ix_tasks_family_id_due_date', table_name='tasks')
+    # Plain ALTER TABLE DROP COLUMN (SQLite 3.35+) rather than a batch
+    # rebuild, which would drop the search triggers on tasks.
+    op.drop_column('tasks', 'recurrence_end')
+    op.drop_column('tasks', 'recurrence')
@@ -0,0 +1,30 @@
+"""Add collection_versions for conditional GETs
+
+Revision ID: 8c1f4e2a9b37
+Revises: 12990d5de6e5
+Create Date: 2026-10-18 11:02:17.530941
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c1f4e2a9b37'
+down_revision = '12990d5de6e5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('collection_versions',
+    sa.Column('family_id', sa.Integer(), nullable=False),
+    sa.Column('collection', sa.String(length=50), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['family_id'], ['families.id'], ),
+    sa.PrimaryKeyConstraint('family_id', 'collection')
+    )
+
+
+def downgrade():
+    op.drop_table('collection_versions')
@@ -0,0 +1,29 @@
+"""Add recipe_ingredients.position to keep ingredients in their listed order
+
+Revision ID: b9e4d7a2c316
+Revises: f1c6a2d8b453
+Create Date: 2026-10-18 09:12:40.517203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b9e4d7a2c316'
+down_revision = 'f1c6a2d8b453'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Plain ADD COLUMN; a batch rebuild would drop the search triggers.
+    op.add_column('recipe_ingredients', sa.Column('position', sa.Integer(), server_default='0', nullable=False))
+    # Ingredients were listed in id order until now.
+    op.execute('UPDATE recipe_ingredients SET position = ('
+               'SELECT count(*) FROM recipe_ingredients AS earlier '
+               'WHERE earlier.recipe_id = recipe_ingredients.recipe_id AND earlier.id < recipe_ingredients.id)')
+
+
+def downgrade():
+    op.drop_column('recipe_ingredients', 'position')
@@ -0,0 +1,45 @@
+"""Add updated_at columns and tombstones for delta sync
+
+Revision ID: d4a7e91c05b2
+Revises: 8c1f4e2a9b37
+Create Date: 2026-10-18 12:21:48.117302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4a7e91c05b2'
+down_revision = '8c1f4e2a9b37'
+branch_labels = None
+depends_on = None
+
+SYNCED_TABLES = ['tasks', 'grocery_items', 'meals', 'recipes', 'thoughts']
+
+
+def upgrade():
+    op.create_table('tombstones',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('family_id', sa.Integer(), nullable=False),
+    sa.Column('collection', sa.String(length=50), nullable=False),
+    sa.Column('record_id', sa.Integer(), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['family_id'], ['families.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_tombstones_family_id_deleted_at', 'tombstones', ['family_id', 'deleted_at'], unique=False)
+    # Existing rows keep a NULL updated_at: they only appear in full syncs,
+    # which is where a client first sees them anyway.
+    for table in SYNCED_TABLES:
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=True))
+        op.create_index('ix_%s_family_id_updated_at' % table, table, ['family_id', 'updated_at'], unique=False)
+
+
+def downgrade():
+    for table in reversed(SYNCED_TABLES):
+        op.drop_index('ix_%s_family_id_updated_at' % table, table_name=table)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('updated_at')
+    op.drop_index('ix_tombstones_family_id_deleted_at', table_name='tombstones')
+    op.drop_table('tombstones')
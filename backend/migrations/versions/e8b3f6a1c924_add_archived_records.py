@@ -0,0 +1,35 @@
+"""Add the archived_records table
+
+Revision ID: e8b3f6a1c924
+Revises: c5d81f3a7b20
+Create Date: 2026-10-18 19:12:40.218334
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8b3f6a1c924'
+down_revision = 'c5d81f3a7b20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('archived_records',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('family_id', sa.Integer(), nullable=False),
+    sa.Column('collection', sa.String(length=50), nullable=False),
+    sa.Column('record_id', sa.Integer(), nullable=False),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.ForeignKeyConstraint(['family_id'], ['families.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_archived_records_family_id_collection_id', 'archived_records', ['family_id', 'collection', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_archived_records_family_id_collection_id', table_name='archived_records')
+    op.drop_table('archived_records')
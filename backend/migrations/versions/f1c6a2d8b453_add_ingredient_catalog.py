@@ -0,0 +1,106 @@
+"""Add the per-family ingredient catalog and parsed ingredient quantities
+
+Revision ID: f1c6a2d8b453
+Revises: e8b3f6a1c924
+Create Date: 2026-10-18 20:26:11.904518
+
+"""
+import re
+from fractions import Fraction
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1c6a2d8b453'
+down_revision = 'e8b3f6a1c924'
+branch_labels = None
+depends_on = None
+
+# A copy of quantities.py as of this revision, so later changes to the live
+# parser don't change what this migration writes.
+UNITS = {
+    'g': ('g', 1), 'gram': ('g', 1), 'grams': ('g', 1),
+    'kg': ('g', 1000), 'kilogram': ('g', 1000), 'kilograms': ('g', 1000),
+    'ml': ('ml', 1), 'milliliter': ('ml', 1), 'milliliters': ('ml', 1), 'millilitre': ('ml', 1), 'millilitres': ('ml', 1),
+    'l': ('ml', 1000), 'liter': ('ml', 1000), 'liters': ('ml', 1000), 'litre': ('ml', 1000), 'litres': ('ml', 1000),
+    'tsp': ('tsp', 1), 'teaspoon': ('tsp', 1), 'teaspoons': ('tsp', 1),
+    'tbsp': ('tbsp', 1), 'tablespoon': ('tbsp', 1), 'tablespoons': ('tbsp', 1),
+    'cup': ('cup', 1), 'cups': ('cup', 1),
+    'lb': ('lb', 1), 'lbs': ('lb', 1), 'pound': ('lb', 1), 'pounds': ('lb', 1),
+    'oz': ('oz', 1), 'ounce': ('oz', 1), 'ounces': ('oz', 1),
+}
+
+QUANTITY_RE = re.compile(r'^\s*(\d+\s+\d+/\d+|\d+/\d+|\d+(?:\.\d+)?)\s*([a-zA-Z]*)\.?\s*$')
+
+
+def normalize_name(name):
+    return ' '.join(name.lower().split())
+
+
+def parse_quantity(text):
+    if text is None:
+        return None
+    match = QUANTITY_RE.match(text)
+    if not match:
+        return None
+    number, unit = match.groups()
+    amount = sum(Fraction(part) for part in number.split())
+    if not unit:
+        return amount, None
+    if unit.lower() not in UNITS:
+        return None
+    canonical, factor = UNITS[unit.lower()]
+    return amount * factor, canonical
+
+
+def upgrade():
+    op.create_table('ingredients',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('family_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('normalized_name', sa.String(length=100), nullable=False),
+    sa.ForeignKeyConstraint(['family_id'], ['families.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('family_id', 'normalized_name', name='uq_ingredients_family_id_normalized_name')
+    )
+    # Plain ADD COLUMN rather than a batch rebuild, which would drop the
+    # search triggers on recipe_ingredients; SQLite takes the foreign key
+    # inline.
+    if op.get_context().dialect.name == 'sqlite':
+        op.execute('ALTER TABLE recipe_ingredients ADD COLUMN ingredient_id INTEGER REFERENCES ingredients (id)')
+    else:
+        op.add_column('recipe_ingredients', sa.Column('ingredient_id', sa.Integer(), sa.ForeignKey('ingredients.id'), nullable=True))
+    op.add_column('recipe_ingredients', sa.Column('amount', sa.Float(), nullable=True))
+    op.add_column('recipe_ingredients', sa.Column('unit', sa.String(length=20), nullable=True))
+    op.create_index('ix_recipe_ingredients_ingredient_id_recipe_id', 'recipe_ingredients', ['ingredient_id', 'recipe_id'], unique=False)
+
+    bind = op.get_bind()
+    rows = bind.execute(sa.text(
+        'SELECT recipe_ingredients.id, recipe_ingredients.name, recipe_ingredients.quantity, recipes.family_id '
+        'FROM recipe_ingredients JOIN recipes ON recipes.id = recipe_ingredients.recipe_id')).fetchall()
+    catalog = {}
+    for _, name, _, family_id in rows:
+        catalog.setdefault((family_id, normalize_name(name)), ' '.join(name.split()))
+    if not catalog:
+        return
+    ingredients = sa.table('ingredients', sa.column('family_id'), sa.column('name'), sa.column('normalized_name'))
+    op.bulk_insert(ingredients, [{'family_id': family_id, 'name': name, 'normalized_name': key}
+                                 for (family_id, key), name in catalog.items()])
+    ids = {(family_id, key): ingredient_id for ingredient_id, family_id, key in bind.execute(
+        sa.text('SELECT id, family_id, normalized_name FROM ingredients'))}
+    updates = []
+    for row_id, name, quantity, family_id in rows:
+        parsed = parse_quantity(quantity)
+        updates.append({'row_id': row_id, 'ingredient_id': ids[(family_id, normalize_name(name))],
+                        'amount': float(parsed[0]) if parsed else None, 'unit': parsed[1] if parsed else None})
+    bind.execute(sa.text('UPDATE recipe_ingredients SET ingredient_id = :ingredient_id, amount = :amount, unit = :unit '
+                         'WHERE id = :row_id'), updates)
+
+
+def downgrade():
+    op.drop_index('ix_recipe_ingredients_ingredient_id_recipe_id', table_name='recipe_ingredients')
+    op.drop_column('recipe_ingredients', 'unit')
+    op.drop_column('recipe_ingredients', 'amount')
+    op.drop_column('recipe_ingredients', 'ingredient_id')
+    op.drop_table('ingredients')
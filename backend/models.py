@@ -1,7 +1,13 @@
 from database import db
-from werkzeug.security import generate_password_hash, check_password_hash
+from passwords import hash_password, verify_password
+import datetime
 import json
 
+try:
+    from orjson import loads as _loads
+except ImportError:  # pragma: no cover - orjson is optional
+    _loads = json.loads
+
 class Family(db.Model):
     __tablename__ = 'families'
     id = db.Column(db.Integer, primary_key=True)
@@ -21,6 +27,7 @@ class Family(db.Model):
 
 class User(db.Model):
     __tablename__ = 'users'
+    __table_args__ = (db.Index('ix_users_family_id', 'family_id'),)
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     password_hash = db.Column(db.String(128), nullable=False)
@@ -32,10 +39,10 @@ class User(db.Model):
     thoughts = db.relationship('Thought', backref='user', lazy=True)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
 
     def to_dict(self):
         return {
@@ -50,6 +57,11 @@ USER_ID_FOREIGN_KEY = 'users.id'
 
 class Task(db.Model):
     __tablename__ = 'tasks'
+    __table_args__ = (
+        db.Index('ix_tasks_family_id_completed_due_date', 'family_id', 'completed', 'due_date'),
+        db.Index('ix_tasks_family_id_updated_at', 'family_id', 'updated_at'),
+        db.Index('ix_tasks_family_id_due_date', 'family_id', 'due_date'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text, nullable=True)
@@ -58,6 +70,12 @@ class Task(db.Model):
     family_id = db.Column(db.Integer, db.ForeignKey('families.id'), nullable=False)
     author_id = db.Column(db.Integer, db.ForeignKey(USER_ID_FOREIGN_KEY), nullable=False)
     assigned_user_id = db.Column(db.Integer, db.ForeignKey(USER_ID_FOREIGN_KEY), nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow, nullable=True)
+    # RRULE-style text (see recurrence.py) anchored at due_date; the series'
+    # last possible occurrence is kept alongside, NULL when open-ended.
+    recurrence = db.Column(db.String(200), nullable=True)
+    recurrence_end = db.Column(db.DateTime, nullable=True)
+    occurrences = db.relationship('TaskOccurrence', backref='task', lazy=True, cascade="all, delete-orphan")
 
     def to_dict(self):
         return {
@@ -69,17 +87,31 @@ class Task(db.Model):
             'family_id': self.family_id,
             'author_id': self.author_id,
             'assigned_user_id': self.assigned_user_id,
-            'assigned_user': self.assigned_user.to_dict() if self.assigned_user else None
+            'assigned_user': self.assigned_user.to_dict() if self.assigned_user else None,
+            'recurrence': self.recurrence
         }
 
+class TaskOccurrence(db.Model):
+    # Completed occurrences of recurring tasks; an occurrence without a row
+    # is open, so only the exceptions to the rule are stored.
+    __tablename__ = 'task_occurrences'
+    task_id = db.Column(db.Integer, db.ForeignKey('tasks.id'), primary_key=True)
+    occurrence = db.Column(db.DateTime, primary_key=True)
+    completed_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, nullable=False)
+
 class GroceryItem(db.Model):
     __tablename__ = 'grocery_items'
+    __table_args__ = (
+        db.Index('ix_grocery_items_family_id_is_completed_category', 'family_id', 'is_completed', 'category'),
+        db.Index('ix_grocery_items_family_id_updated_at', 'family_id', 'updated_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     quantity = db.Column(db.String(50), nullable=True)
     category = db.Column(db.String(50), default='Other', nullable=False)
     is_completed = db.Column(db.Boolean, default=False, nullable=False)
     family_id = db.Column(db.Integer, db.ForeignKey('families.id'), nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow, nullable=True)
 
     def to_dict(self):
         return {
@@ -93,12 +125,17 @@ class GroceryItem(db.Model):
 
 class Meal(db.Model):
     __tablename__ = 'meals'
+    __table_args__ = (
+        db.Index('ix_meals_family_id_date', 'family_id', 'date'),
+        db.Index('ix_meals_family_id_updated_at', 'family_id', 'updated_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     date = db.Column(db.String(20), nullable=True)
     recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.id'), nullable=True)
     meal_time = db.Column(db.String(20), nullable=True)
     family_id = db.Column(db.Integer, db.ForeignKey('families.id'), nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow, nullable=True)
 
     def to_dict(self):
         return {
@@ -110,46 +147,99 @@ class Meal(db.Model):
             'family_id': self.family_id
         }
 
+class JSONList(db.TypeDecorator):
+    """A list kept as JSON text and decoded once, when the row is loaded.
+
+    Comparisons such as LIKE match the stored text.
+    """
+    impl = db.Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return json.dumps(value) if value is not None else None
+
+    def process_result_value(self, value, dialect):
+        return _loads(value) if value else []
+
+    def coerce_compared_value(self, op, value):
+        return db.Text()
+
 class Recipe(db.Model):
     __tablename__ = 'recipes'
+    __table_args__ = (
+        db.Index('ix_recipes_family_id', 'family_id'),
+        db.Index('ix_recipes_family_id_updated_at', 'family_id', 'updated_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    instructions = db.Column(db.Text, nullable=True)  # JSON-encoded list of strings
+    instructions = db.Column(JSONList, nullable=True)  # list of strings
     family_id = db.Column(db.Integer, db.ForeignKey('families.id'), nullable=False)
-    ingredients = db.relationship('RecipeIngredient', backref='recipe', lazy=True, cascade="all, delete-orphan")
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow, nullable=True)
+    ingredients = db.relationship('RecipeIngredient', backref='recipe', lazy=True, cascade="all, delete-orphan",
+                                  order_by='[RecipeIngredient.position, RecipeIngredient.id]')
     meals = db.relationship('Meal', backref='recipe', lazy=True)
 
     def to_dict(self):
         return {
             'id': self.id,
             'name': self.name,
-            'instructions': json.loads(self.instructions) if self.instructions else [],
+            'instructions': self.instructions or [],
             'family_id': self.family_id,
             'ingredients': [ingredient.to_dict() for ingredient in self.ingredients]
         }
 
+class Ingredient(db.Model):
+    # Per-family catalog with one entry per normalized ingredient name; see ingredients.py.
+    __tablename__ = 'ingredients'
+    __table_args__ = (db.UniqueConstraint('family_id', 'normalized_name', name='uq_ingredients_family_id_normalized_name'),)
+    id = db.Column(db.Integer, primary_key=True)
+    family_id = db.Column(db.Integer, db.ForeignKey('families.id'), nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    normalized_name = db.Column(db.String(100), nullable=False)
+
 class RecipeIngredient(db.Model):
     __tablename__ = 'recipe_ingredients'
+    __table_args__ = (
+        db.Index('ix_recipe_ingredients_recipe_id', 'recipe_id'),
+        db.Index('ix_recipe_ingredients_ingredient_id_recipe_id', 'ingredient_id', 'recipe_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.id'), nullable=False)
     name = db.Column(db.String(100), nullable=False)
     quantity = db.Column(db.String(50), nullable=True)
+    # Always set by the application; nullable only because the column was
+    # added to a populated table.
+    ingredient_id = db.Column(db.Integer, db.ForeignKey('ingredients.id'), nullable=True)
+    # `quantity` parsed into the unit's base (grams, millilitres, ...); amount
+    # is NULL when the text couldn't be parsed and unit is NULL for counts.
+    amount = db.Column(db.Float, nullable=True)
+    unit = db.Column(db.String(20), nullable=True)
+    # Order within the recipe, as the ingredients were last listed.
+    position = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     def to_dict(self):
         return {
             'id': self.id,
             'recipe_id': self.recipe_id,
             'name': self.name,
-            'quantity': self.quantity
+            'quantity': self.quantity,
+            'ingredient_id': self.ingredient_id,
+            'amount': self.amount,
+            'unit': self.unit
         }
 
 class Thought(db.Model):
     __tablename__ = 'thoughts'
+    __table_args__ = (
+        db.Index('ix_thoughts_family_id_id', 'family_id', 'id'),
+        db.Index('ix_thoughts_family_id_updated_at', 'family_id', 'updated_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, server_default=db.func.now())
     user_id = db.Column(db.Integer, db.ForeignKey(USER_ID_FOREIGN_KEY), nullable=False)
     family_id = db.Column(db.Integer, db.ForeignKey('families.id'), nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow, nullable=True)
 
     def to_dict(self):
         return {
@@ -160,3 +250,51 @@ class Thought(db.Model):
             'family_id': self.family_id,
             'user': self.user.to_dict()
         }
+
+class CollectionVersion(db.Model):
+    __tablename__ = 'collection_versions'
+    family_id = db.Column(db.Integer, db.ForeignKey('families.id'), primary_key=True)
+    collection = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)
+
+class Tombstone(db.Model):
+    __tablename__ = 'tombstones'
+    __table_args__ = (db.Index('ix_tombstones_family_id_deleted_at', 'family_id', 'deleted_at'),)
+    id = db.Column(db.Integer, primary_key=True)
+    family_id = db.Column(db.Integer, db.ForeignKey('families.id'), nullable=False)
+    collection = db.Column(db.String(50), nullable=False)
+    record_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, nullable=False)
+
+class ArchivedRecord(db.Model):
+    # Rows moved out of the live tables by archive.py, each kept as its API
+    # representation in zlib-compressed JSON.
+    __tablename__ = 'archived_records'
+    __table_args__ = (db.Index('ix_archived_records_family_id_collection_id', 'family_id', 'collection', 'id'),)
+    id = db.Column(db.Integer, primary_key=True)
+    family_id = db.Column(db.Integer, db.ForeignKey('families.id'), nullable=False)
+    collection = db.Column(db.String(50), nullable=False)
+    record_id = db.Column(db.Integer, nullable=False)
+    archived_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    __table_args__ = (db.Index('ix_jobs_status_run_at', 'status', 'run_at'),)
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON-encoded keyword arguments
+    status = db.Column(db.String(20), default='pending', nullable=False)  # pending, running, done or failed
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts = db.Column(db.Integer, nullable=False)
+    run_at = db.Column(db.DateTime, nullable=False)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, nullable=False)
+
+class JobSchedule(db.Model):
+    __tablename__ = 'job_schedules'
+    name = db.Column(db.String(100), primary_key=True)
+    cron = db.Column(db.String(100), nullable=False)
+    next_run_at = db.Column(db.DateTime, nullable=False)
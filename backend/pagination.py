@@ -0,0 +1,47 @@
+import base64
+import json
+from sqlalchemy import and_, or_
+
+MAX_PAGE_SIZE = 500
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, columns):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise ValueError('Invalid cursor')
+    return values
+
+def _after(columns, values, descending):
+    # Expands (a, b) > (x, y) into a > x OR (a = x AND b > y) so it can use
+    # a composite index on every backend, row-value support or not.
+    clauses = []
+    for i, (column, value) in enumerate(zip(columns, values)):
+        prefix = [c == v for c, v in zip(columns[:i], values[:i])]
+        step = column < value if descending else column > value
+        clauses.append(and_(*prefix, step))
+    return or_(*clauses)
+
+def keyset_page(query, columns, limit=None, cursor=None, descending=False):
+    """Return (rows, next_cursor) for the page of `query` following `cursor`.
+
+    `columns` must be non-null and identify rows uniquely, e.g. (Task.id,).
+    With no limit every remaining row is returned and next_cursor is None.
+    """
+    if cursor:
+        query = query.filter(_after(columns, decode_cursor(cursor, columns), descending))
+    query = query.order_by(*[c.desc() if descending else c.asc() for c in columns])
+    if limit is None:
+        return query.all(), None
+
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor([getattr(last, c.key) for c in columns])
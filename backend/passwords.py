@@ -0,0 +1,77 @@
+"""Password hashing with a configurable cost and an optional bounded pool.
+
+Hashing is deliberately CPU-heavy. With PASSWORD_HASH_WORKERS > 0 it runs on
+a fixed pool of OS threads (hashlib releases the GIL while it works), so a
+burst of logins queues there instead of tying up every request worker. At
+most PASSWORD_HASH_MAX_PENDING hashes are running or queued; callers that
+can't get a slot within PASSWORD_HASH_WAIT seconds get HashingBusy.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import jsonify
+from werkzeug.security import generate_password_hash, check_password_hash
+
+try:
+    from gevent import monkey
+    from gevent.threadpool import ThreadPool as GeventThreadPool
+except ImportError:  # pragma: no cover - gevent is only needed for the gevent worker
+    monkey = None
+
+class HashingBusy(Exception):
+    pass
+
+class _Hasher:
+    def __init__(self):
+        self.method = 'pbkdf2'
+        self.run = None
+        self.slots = None
+        self.wait = None
+
+    def configure(self, method, workers=0, max_pending=32, wait=5):
+        self.method = method
+        self.wait = wait
+        if not workers:
+            self.run = self.slots = None
+            return
+        if monkey is not None and monkey.is_module_patched('threading'):
+            # Under gevent, threading is green; the hub's real-thread pool
+            # keeps the hash off the event loop while the greenlet waits.
+            pool = GeventThreadPool(workers)
+            self.run = lambda fn, *args: pool.apply(fn, args)
+        else:
+            pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+            self.run = lambda fn, *args: pool.submit(fn, *args).result()
+        self.slots = threading.BoundedSemaphore(max(workers, max_pending))
+
+    def __call__(self, fn, *args):
+        if self.run is None:
+            return fn(*args)
+        if not self.slots.acquire(timeout=self.wait):
+            raise HashingBusy()
+        try:
+            return self.run(fn, *args)
+        finally:
+            self.slots.release()
+
+_hasher = _Hasher()
+
+def init_app(app):
+    app.register_error_handler(HashingBusy, _busy)
+    _hasher.configure(app.config.get('PASSWORD_HASH_METHOD', 'pbkdf2'),
+                      workers=app.config.get('PASSWORD_HASH_WORKERS', 0),
+                      max_pending=app.config.get('PASSWORD_HASH_MAX_PENDING', 32),
+                      wait=app.config.get('PASSWORD_HASH_WAIT', 5))
+
+def _busy(error):
+    response = jsonify({'message': 'Server busy, try again shortly'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+def hash_password(password):
+    return _hasher(generate_password_hash, password, _hasher.method)
+
+def verify_password(pwhash, password):
+    # The stored hash names its own method, so hashes made under an older
+    # profile keep verifying after PASSWORD_HASH_METHOD changes.
+    return _hasher(check_password_hash, pwhash, password)
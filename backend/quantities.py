@@ -0,0 +1,89 @@
+"""Parsing, normalizing and summing free-text ingredient quantities."""
+import re
+from fractions import Fraction
+
+# Alias -> (canonical unit, factor to the unit's base). Units sharing a base
+# are summed together; everything else is kept separate.
+UNITS = {
+    'g': ('g', 1), 'gram': ('g', 1), 'grams': ('g', 1),
+    'kg': ('g', 1000), 'kilogram': ('g', 1000), 'kilograms': ('g', 1000),
+    'ml': ('ml', 1), 'milliliter': ('ml', 1), 'milliliters': ('ml', 1), 'millilitre': ('ml', 1), 'millilitres': ('ml', 1),
+    'l': ('ml', 1000), 'liter': ('ml', 1000), 'liters': ('ml', 1000), 'litre': ('ml', 1000), 'litres': ('ml', 1000),
+    'tsp': ('tsp', 1), 'teaspoon': ('tsp', 1), 'teaspoons': ('tsp', 1),
+    'tbsp': ('tbsp', 1), 'tablespoon': ('tbsp', 1), 'tablespoons': ('tbsp', 1),
+    'cup': ('cup', 1), 'cups': ('cup', 1),
+    'lb': ('lb', 1), 'lbs': ('lb', 1), 'pound': ('lb', 1), 'pounds': ('lb', 1),
+    'oz': ('oz', 1), 'ounce': ('oz', 1), 'ounces': ('oz', 1),
+}
+
+# Larger display unit for a base unit once a total reaches its factor.
+DISPLAY_UNITS = {'g': ('kg', 1000), 'ml': ('l', 1000)}
+
+_QUANTITY_RE = re.compile(r'^\s*(\d+\s+\d+/\d+|\d+/\d+|\d+(?:\.\d+)?)\s*([a-zA-Z]*)\.?\s*$')
+
+def normalize_name(name):
+    return ' '.join(name.lower().split())
+
+def parse_quantity(text):
+    """Return (amount, unit) for text like '1 1/2 cups' or '200g'.
+
+    `unit` is the canonical base unit, or None for a bare count. Returns
+    None when the text can't be parsed.
+    """
+    if text is None:
+        return None
+    match = _QUANTITY_RE.match(text)
+    if not match:
+        return None
+    number, unit = match.groups()
+    amount = sum(Fraction(part) for part in number.split())
+    if not unit:
+        return amount, None
+    if unit.lower() not in UNITS:
+        return None
+    canonical, factor = UNITS[unit.lower()]
+    return amount * factor, canonical
+
+def _format_amount(amount):
+    if amount.denominator == 1:
+        return str(amount.numerator)
+    return ('%.2f' % float(amount)).rstrip('0').rstrip('.')
+
+class QuantityTotal:
+    """Accumulates quantities for one ingredient across recipes."""
+
+    def __init__(self):
+        self.amounts = {}
+        self.unparsed = []
+
+    def add(self, text):
+        if not text or not text.strip():
+            return
+        parsed = parse_quantity(text)
+        if parsed is None:
+            if text.strip() not in self.unparsed:
+                self.unparsed.append(text.strip())
+            return
+        amount, unit = parsed
+        self.amounts[unit] = self.amounts.get(unit, 0) + amount
+
+    def add_amount(self, amount, unit):
+        """Add an amount already in `unit`'s base, as stored on recipe ingredients."""
+        amount = Fraction(amount).limit_denominator(1000)
+        self.amounts[unit] = self.amounts.get(unit, 0) + amount
+
+    def format(self, max_length=None):
+        """The total as text; with max_length, trailing parts that don't fit
+        are replaced by '…'."""
+        parts = []
+        for unit, amount in self.amounts.items():
+            if unit in DISPLAY_UNITS and amount >= DISPLAY_UNITS[unit][1]:
+                unit, amount = DISPLAY_UNITS[unit][0], amount / DISPLAY_UNITS[unit][1]
+            parts.append(_format_amount(amount) + (' ' + unit if unit else ''))
+        parts += self.unparsed
+        text = ' + '.join(parts)
+        if max_length is None or len(text) <= max_length:
+            return text
+        while parts and len(' + '.join(parts + ['…'])) > max_length:
+            parts.pop()
+        return ' + '.join(parts + ['…'])
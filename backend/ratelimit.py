@@ -0,0 +1,124 @@
+"""Token-bucket rate limiting for the auth endpoints.
+
+Each bucket holds up to `capacity` tokens and refills continuously over
+`period` seconds; a request spends one token or is refused with 429 and a
+Retry-After header. Buckets live in a pluggable backend: `memory` limits each
+worker process on its own, `sqlite:///path` shares buckets between every
+worker on the host through a local file.
+"""
+import math
+import sqlite3
+import threading
+import time
+from functools import wraps
+from flask import request, jsonify, current_app
+from cache import LRUCache
+from database import apply_sqlite_pragmas
+
+class MemoryBackend:
+    # Evicting a bucket refills it, so maxsize should comfortably exceed the
+    # number of clients seen within one refill period.
+    def __init__(self, maxsize=100000):
+        self.buckets = LRUCache(maxsize=maxsize)
+        self.lock = threading.Lock()
+
+    def take(self, key, capacity, period):
+        now = time.monotonic()
+        with self.lock:
+            tokens, stamp = self.buckets.get(key, (capacity, now))
+            tokens, retry_after = _spend(tokens, stamp, capacity, period, now)
+            self.buckets.set(key, (tokens, now))
+            return retry_after
+
+class SQLiteBackend:
+    PRUNE_EVERY = 1000
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        apply_sqlite_pragmas(self.conn, {'busy_timeout': 5000, 'journal_mode': 'WAL', 'synchronous': 'NORMAL'})
+        self.conn.execute('CREATE TABLE IF NOT EXISTS rate_limit_buckets ('
+                          'key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, full_at REAL NOT NULL)')
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def take(self, key, capacity, period):
+        # Wall-clock time, since the stamps are compared across processes.
+        now = time.time()
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self.conn.execute('SELECT tokens, updated FROM rate_limit_buckets WHERE key = ?', (key,)).fetchone()
+                tokens, stamp = row if row else (capacity, now)
+                tokens, retry_after = _spend(tokens, stamp, capacity, period, now)
+                full_at = now + (capacity - tokens) * period / capacity
+                self.conn.execute('INSERT OR REPLACE INTO rate_limit_buckets (key, tokens, updated, full_at) '
+                                  'VALUES (?, ?, ?, ?)', (key, tokens, now, full_at))
+                self.calls += 1
+                if self.calls % self.PRUNE_EVERY == 0:
+                    # A bucket that has refilled is the same as no bucket.
+                    self.conn.execute('DELETE FROM rate_limit_buckets WHERE full_at < ?', (now,))
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+        return retry_after
+
+def _spend(tokens, stamp, capacity, period, now):
+    """Return (tokens left, seconds to wait or 0 if a token was spent)."""
+    tokens = min(capacity, tokens + (now - stamp) * capacity / period)
+    if tokens >= 1:
+        return tokens - 1, 0
+    return tokens, (1 - tokens) * period / capacity
+
+def backend_from_url(url):
+    if url == 'memory':
+        return MemoryBackend()
+    if url.startswith('sqlite:///'):
+        return SQLiteBackend(url[len('sqlite:///'):])
+    raise ValueError('Unsupported RATELIMIT_STORAGE: %s' % url)
+
+def parse_limit(value):
+    """'20/60' -> (20, 60.0): 20 requests per 60 seconds."""
+    capacity, period = value.split('/')
+    return int(capacity), float(period)
+
+class RateLimiter:
+    def __init__(self, backend=None):
+        self.backend = backend or MemoryBackend()
+
+    def take(self, key, limit):
+        capacity, period = limit
+        return self.backend.take(key, capacity, period)
+
+limiter = RateLimiter()
+
+def init_app(app):
+    app.config.setdefault('RATELIMIT_ENABLED', True)
+    app.config.setdefault('RATELIMIT_STORAGE', 'memory')
+    app.config.setdefault('RATELIMIT_AUTH_PER_IP', '20/60')
+    app.config.setdefault('RATELIMIT_AUTH_PER_USERNAME', '5/60')
+    limiter.backend = backend_from_url(app.config['RATELIMIT_STORAGE'])
+
+def auth_rate_limited(f):
+    """Limit a view per client IP and per `username` in its JSON body.
+
+    Behind a reverse proxy, wrap the app in werkzeug's ProxyFix so
+    remote_addr is the client rather than the proxy.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if current_app.config['RATELIMIT_ENABLED']:
+            buckets = [('auth:ip:%s' % request.remote_addr, current_app.config['RATELIMIT_AUTH_PER_IP'])]
+            data = request.get_json(silent=True)
+            username = data.get('username') if isinstance(data, dict) else None
+            if isinstance(username, str) and username:
+                buckets.append(('auth:user:%s' % username.lower(), current_app.config['RATELIMIT_AUTH_PER_USERNAME']))
+            for key, limit in buckets:
+                retry_after = limiter.take(key, parse_limit(limit))
+                if retry_after:
+                    response = jsonify({'message': 'Too many requests, try again later'})
+                    response.status_code = 429
+                    response.headers['Retry-After'] = str(math.ceil(retry_after))
+                    return response
+        return f(*args, **kwargs)
+    return decorated
@@ -0,0 +1,195 @@
+"""Parsing and windowed expansion of RRULE-style task recurrences.
+
+A recurring task's due_date anchors the series. Rules are a subset of RFC
+5545 RRULE: FREQ=DAILY|WEEKLY|MONTHLY|YEARLY with INTERVAL, BYDAY (weekly,
+e.g. MO,TH), BYMONTHDAY (monthly, negative counts from the month's end) and
+at most one of COUNT or UNTIL. Expansion jumps straight to the period that
+holds the window start, so its cost follows the occurrences in the window,
+not the age of the series.
+"""
+import calendar
+import datetime
+import functools
+import heapq
+from collections import namedtuple
+
+FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY', 'YEARLY')
+WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+MAX_INTERVAL = 1000
+MAX_COUNT = 1000
+
+Rule = namedtuple('Rule', ['freq', 'interval', 'byday', 'bymonthday', 'count', 'until'])
+
+def _parse_until(value):
+    for fmt in ('%Y%m%dT%H%M%SZ', '%Y%m%dT%H%M%S'):
+        try:
+            return datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    # A bare date includes the whole day.
+    if len(value) in (8, 10):
+        day = datetime.datetime.strptime(value, '%Y%m%d') if len(value) == 8 else datetime.datetime.fromisoformat(value)
+        return datetime.datetime.combine(day.date(), datetime.time.max)
+    return datetime.datetime.fromisoformat(value)
+
+@functools.lru_cache(maxsize=1024)
+def parse_rule(text):
+    """Return the Rule for text like 'FREQ=WEEKLY;BYDAY=MO,TH'.
+
+    Raises ValueError for anything outside the supported subset.
+    """
+    if text.upper().startswith('RRULE:'):
+        text = text[len('RRULE:'):]
+    parts = {}
+    for part in text.split(';'):
+        name, sep, value = part.strip().partition('=')
+        name = name.upper()
+        if not sep or not value or name in parts:
+            raise ValueError('Invalid recurrence')
+        parts[name] = value.strip()
+    if set(parts) - {'FREQ', 'INTERVAL', 'BYDAY', 'BYMONTHDAY', 'COUNT', 'UNTIL'}:
+        raise ValueError('Unsupported recurrence part')
+
+    freq = parts.get('FREQ', '').upper()
+    if freq not in FREQUENCIES:
+        raise ValueError('FREQ must be one of %s' % ', '.join(FREQUENCIES))
+    interval = int(parts.get('INTERVAL', 1))
+    if not 1 <= interval <= MAX_INTERVAL:
+        raise ValueError('Invalid INTERVAL')
+
+    byday = ()
+    if 'BYDAY' in parts:
+        if freq != 'WEEKLY':
+            raise ValueError('BYDAY is only supported with FREQ=WEEKLY')
+        byday = tuple(sorted({WEEKDAYS.index(day.strip().upper()) for day in parts['BYDAY'].split(',')}))
+    bymonthday = ()
+    if 'BYMONTHDAY' in parts:
+        if freq != 'MONTHLY':
+            raise ValueError('BYMONTHDAY is only supported with FREQ=MONTHLY')
+        bymonthday = tuple(sorted({int(day) for day in parts['BYMONTHDAY'].split(',')}))
+        if any(day == 0 or abs(day) > 31 for day in bymonthday):
+            raise ValueError('Invalid BYMONTHDAY')
+
+    if 'COUNT' in parts and 'UNTIL' in parts:
+        raise ValueError('COUNT and UNTIL are mutually exclusive')
+    count = int(parts['COUNT']) if 'COUNT' in parts else None
+    if count is not None and not 1 <= count <= MAX_COUNT:
+        raise ValueError('COUNT must be between 1 and %d' % MAX_COUNT)
+    until = _parse_until(parts['UNTIL']) if 'UNTIL' in parts else None
+    return Rule(freq, interval, byday, bymonthday, count, until)
+
+def format_rule(rule):
+    parts = ['FREQ=' + rule.freq]
+    if rule.interval != 1:
+        parts.append('INTERVAL=%d' % rule.interval)
+    if rule.byday:
+        parts.append('BYDAY=' + ','.join(WEEKDAYS[day] for day in rule.byday))
+    if rule.bymonthday:
+        parts.append('BYMONTHDAY=' + ','.join(str(day) for day in rule.bymonthday))
+    if rule.count:
+        parts.append('COUNT=%d' % rule.count)
+    if rule.until:
+        parts.append('UNTIL=' + rule.until.strftime('%Y%m%dT%H%M%S'))
+    return ';'.join(parts)
+
+def _week_start(day):
+    return day - datetime.timedelta(days=day.weekday())
+
+def _period_index(rule, start, moment):
+    # Index of the period holding `moment`; periods are counted in whole
+    # intervals from the one holding `start`.
+    if moment <= start:
+        return 0
+    if rule.freq == 'DAILY':
+        span = (moment.date() - start.date()).days
+    elif rule.freq == 'WEEKLY':
+        span = (_week_start(moment.date()) - _week_start(start.date())).days // 7
+    elif rule.freq == 'MONTHLY':
+        span = (moment.year - start.year) * 12 + moment.month - start.month
+    else:
+        span = moment.year - start.year
+    return span // rule.interval
+
+def _period(rule, start, index):
+    # Candidate occurrences of one period, in order. Days the period lacks
+    # (the 31st of a short month, Feb 29 outside leap years) are skipped.
+    step = index * rule.interval
+    if rule.freq == 'DAILY':
+        return [start + datetime.timedelta(days=step)]
+    if rule.freq == 'WEEKLY':
+        monday = _week_start(start.date()) + datetime.timedelta(weeks=step)
+        return [datetime.datetime.combine(monday + datetime.timedelta(days=day), start.time())
+                for day in rule.byday or (start.weekday(),)]
+    if rule.freq == 'MONTHLY':
+        year, month = divmod(start.month - 1 + step, 12)
+        year, month = start.year + year, month + 1
+        if year > datetime.MAXYEAR:
+            raise ValueError('Recurrence never occurs')
+        length = calendar.monthrange(year, month)[1]
+        days = sorted({day if day > 0 else length + day + 1 for day in rule.bymonthday or (start.day,) if abs(day) <= length})
+        return [datetime.datetime.combine(datetime.date(year, month, day), start.time()) for day in days]
+    year = start.year + step
+    if year > datetime.MAXYEAR:
+        raise ValueError('Recurrence never occurs')
+    if (start.month, start.day) == (2, 29) and not calendar.isleap(year):
+        return []
+    return [start.replace(year=year)]
+
+def occurrences(rule, start, window_start, window_end, series_end=None):
+    """Yield the occurrences of the series within [window_start, window_end], in order."""
+    window_start = max(window_start, start)
+    for bound in (rule.until, series_end):
+        if bound is not None:
+            window_end = min(window_end, bound)
+    if window_start > window_end:
+        return
+    for index in range(_period_index(rule, start, window_start), _period_index(rule, start, window_end) + 1):
+        for moment in _period(rule, start, index):
+            if moment > window_end:
+                return
+            if moment >= window_start:
+                yield moment
+
+def series_end(rule, start):
+    """The last possible occurrence: UNTIL, the COUNTth occurrence, or None."""
+    if rule.until is not None or rule.count is None:
+        return rule.until
+    seen = 0
+    index = 0
+    while True:
+        # A rule that never matches runs past MAXYEAR and raises ValueError.
+        for moment in _period(rule, start, index):
+            if moment >= start:
+                seen += 1
+                if seen == rule.count:
+                    return moment
+        index += 1
+
+def normalize(text, start):
+    """Return (canonical rule text, series end) to store for a task, or
+    (None, None) when `text` is empty. Raises ValueError."""
+    if not text:
+        return None, None
+    if start is None:
+        raise ValueError('A recurring task needs a due_date')
+    rule = parse_rule(text)
+    return format_rule(rule), series_end(rule, start)
+
+def is_occurrence(text, start, moment, end=None):
+    return next(occurrences(parse_rule(text), start, moment, moment, end), None) == moment
+
+def merge_occurrences(rows, window_start, window_end):
+    """Yield (moment, row) for every occurrence of `rows` in the window,
+    ordered by (moment, row.id).
+
+    Rows need id, due_date, recurrence and recurrence_end; a row without a
+    recurrence occurs once, at its due_date. Each series is expanded lazily,
+    so taking a page only generates the occurrences up to its end.
+    """
+    def expand(row):
+        if row.recurrence:
+            moments = occurrences(parse_rule(row.recurrence), row.due_date, window_start, window_end, row.recurrence_end)
+        else:
+            moments = [row.due_date] if window_start <= row.due_date <= window_end else []
+        return ((moment, row.id, row) for moment in moments)
+    return ((moment, row) for moment, _, row in heapq.merge(*[expand(row) for row in rows]))
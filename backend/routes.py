@@ -1,15 +1,162 @@
-from flask import Blueprint, request, jsonify, g, current_app
-from models import Task, Meal, Recipe, GroceryItem, User, Family, Thought, RecipeIngredient
+from flask import Blueprint, Response, request, jsonify, g, current_app, stream_with_context
+from sqlalchemy import or_, and_, case, func
+from models import (Task, TaskOccurrence, Meal, Recipe, GroceryItem, User, Family, Thought, RecipeIngredient,
+                    Ingredient, ArchivedRecord)
 from database import db
 from auth import token_required
+from ratelimit import auth_rate_limited
+from pagination import keyset_page, encode_cursor, decode_cursor, MAX_PAGE_SIZE
+from versions import bump_version, conditional
+from collection_cache import cached
+from sync import changes_since, decode_sync_token, encode_sync_token
+from events import publish_change, event_stream
+import serializers
+import streaming
+import search
+import recurrence
+import archive
+import ingredients
+from quantities import QuantityTotal, normalize_name
 import jwt
 import datetime
-import json
+import heapq
+import itertools
 
 bp = Blueprint('api', __name__, url_prefix='/api')
 
+def _parse_bool(value):
+    if value.lower() in ('true', '1', 'yes'):
+        return True
+    if value.lower() in ('false', '0', 'no'):
+        return False
+    raise ValueError(value)
+
+def _list_response(query, columns, serialize, descending=False, default_limit=None):
+    # Collections are returned as a plain JSON array; when more rows follow,
+    # the opaque cursor for the next page is sent in the X-Next-Cursor header.
+    stream = request.args.get('stream')
+    if stream:
+        # ?stream=json|ndjson sends every row, a chunk at a time, instead of a page.
+        query = query.order_by(*[c.desc() if descending else c.asc() for c in columns])
+        if stream == 'ndjson':
+            return Response(stream_with_context(streaming.ndjson_stream(query, serialize)), mimetype='application/x-ndjson')
+        return Response(stream_with_context(streaming.json_array_stream(query, serialize)), mimetype='application/json')
+
+    limit = request.args.get('limit', default_limit, type=int)
+    if limit is not None:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+    try:
+        rows, next_cursor = keyset_page(query, columns, limit=limit, cursor=request.args.get('cursor'), descending=descending)
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+
+    response = jsonify(serialize(rows))
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+MAX_BATCH_SIZE = 500
+
+def _run_batch(model, collection, required_field, create, update, loader=None):
+    """Apply a list of create/update/delete operations in one transaction.
+
+    Targets of updates and deletes are fetched with a single family-scoped
+    IN query. Invalid operations are reported in their result slot and
+    skipped; the valid ones are committed together. `update` must raise
+    before changing the row, so a rejected update leaves earlier ones to
+    the same row in place.
+    """
+    payload = request.json or {}
+    operations = payload.get('operations') if isinstance(payload, dict) else None
+    if not isinstance(operations, list) or not operations:
+        return jsonify({"error": "operations must be a non-empty list"}), 400
+    if len(operations) > MAX_BATCH_SIZE:
+        return jsonify({"error": "At most %d operations per batch" % MAX_BATCH_SIZE}), 400
+
+    family_id = g.current_user.family_id
+    target_ids = {op.get('id') for op in operations if isinstance(op, dict) and isinstance(op.get('id'), int)}
+    targets = {row.id: row for row in model.query.filter(model.family_id == family_id, model.id.in_(target_ids))} if target_ids else {}
+
+    results, applied = [], []
+    for op in operations:
+        if not isinstance(op, dict) or op.get('op') not in ('create', 'update', 'delete'):
+            results.append({'status': 400, 'error': 'op must be create, update or delete'})
+            continue
+        data = op.get('data') or {}
+        if not isinstance(data, dict):
+            results.append({'status': 400, 'error': 'data must be an object'})
+            continue
+        if op['op'] == 'create':
+            if required_field not in data:
+                results.append({'status': 400, 'error': '%s is required' % required_field.capitalize()})
+                continue
+            try:
+                row = create(data)
+            except (ValueError, TypeError):
+                results.append({'status': 400, 'error': 'Invalid value'})
+                continue
+            db.session.add(row)
+            results.append({'status': 201})
+            applied.append((len(results) - 1, 'created', row))
+            continue
+
+        if not isinstance(op.get('id'), int):
+            results.append({'status': 400, 'error': 'id must be an integer'})
+            continue
+        row = targets.get(op['id'])
+        if row is None or row in db.session.deleted:
+            results.append({'status': 404, 'id': op.get('id'), 'error': 'Not found'})
+            continue
+        if op['op'] == 'delete':
+            db.session.delete(row)
+            results.append({'status': 200, 'id': row.id})
+            applied.append((len(results) - 1, 'deleted', row))
+        else:
+            try:
+                update(row, data)
+            except (ValueError, TypeError):
+                results.append({'status': 400, 'id': row.id, 'error': 'Invalid value'})
+                continue
+            results.append({'status': 200})
+            applied.append((len(results) - 1, 'updated', row))
+
+    if applied:
+        db.session.flush()
+        changes = [(index, action, row.id) for index, action, row in applied]
+        bump_version(family_id, collection)
+        db.session.commit()
+
+        # Reload everything returned in one query rather than one per row.
+        live_ids = [row_id for _, action, row_id in changes if action != 'deleted']
+        query = model.query.filter(model.id.in_(live_ids))
+        if loader:
+            query = query.options(loader())
+        rows = {row.id: row for row in query} if live_ids else {}
+        for index, action, row_id in changes:
+            if action != 'deleted':
+                results[index]['id'] = row_id
+                results[index]['item'] = rows[row_id].to_dict()
+            publish_change(family_id, collection, action, row_id)
+
+    return jsonify({'results': results})
+
+def _clear_completed(model, collection, completed_column):
+    # One set-based delete instead of a request per row; the ids are read
+    # first for the tombstones and change events, and a row reopened since
+    # is kept.
+    family_id = g.current_user.family_id
+    ids = [row_id for (row_id,) in db.session.query(model.id).filter(
+        model.family_id == family_id, completed_column.is_(True))]
+    deleted = archive.delete_rows(model, family_id, ids, completed_column.is_(True)) if ids else []
+    if deleted:
+        db.session.commit()
+        for row_id in deleted:
+            publish_change(family_id, collection, 'deleted', row_id)
+    return jsonify({'deleted': len(deleted)})
+
 # --- Auth Endpoints ---
 @bp.route('/register', methods=['POST'])
+@auth_rate_limited
 def register():
     data = request.get_json()
     
@@ -35,11 +182,14 @@ def register():
     new_user = User(username=username, email=email, family_id=family.id, is_accepted=is_accepted_status)
     new_user.set_password(password)
     db.session.add(new_user)
+    bump_version(family.id, 'users', 'tasks', 'thoughts')
     db.session.commit()
+    publish_change(family.id, 'users', 'created', new_user.id)
 
     return jsonify(new_user.to_dict()), 201
 
 @bp.route('/login', methods=['POST'])
+@auth_rate_limited
 def login():
     auth = request.get_json()
 
@@ -61,9 +211,39 @@ def login():
 
 @bp.route('/family/users', methods=['GET'])
 @token_required
+@conditional('users')
+@cached('users')
 def get_family_users():
-    users = User.query.filter_by(family_id=g.current_user.family_id).all()
-    return jsonify([user.to_dict() for user in users])
+    users = serializers.user_rows().filter(User.family_id == g.current_user.family_id)
+    return _list_response(users, (User.id,), serializers.serialize_users)
+
+@bp.route('/family/export', methods=['GET'])
+@token_required
+def export_family():
+    if not g.current_user.is_accepted:
+        return jsonify({'message': 'You must be an accepted family member to export family data.'}), 403
+    return Response(stream_with_context(streaming.export_family(g.current_user.family_id)), mimetype='application/x-ndjson',
+                    headers={'Content-Disposition': 'attachment; filename=family-export.ndjson'})
+
+@bp.route('/family/import', methods=['POST'])
+@token_required
+def import_family():
+    if not g.current_user.is_accepted:
+        return jsonify({'message': 'You must be an accepted family member to import family data.'}), 403
+
+    importer = streaming.FamilyImporter(g.current_user.family_id, g.current_user.id)
+    try:
+        counts = importer.feed(line.decode('utf-8') for line in request.stream)
+    except (streaming.InvalidImport, UnicodeDecodeError) as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
+
+    bump_version(g.current_user.family_id, *[name for name, _, _, _ in streaming.EXPORT_COLLECTIONS if name != 'users'])
+    db.session.commit()
+    for name, count in counts.items():
+        if count and name != 'users':
+            publish_change(g.current_user.family_id, name, 'imported')
+    return jsonify({'imported': counts}), 201
 
 @bp.route('/family/users/<int:user_id>/accept', methods=['PUT'])
 @token_required
@@ -79,16 +259,184 @@ def accept_family_user(user_id):
         return jsonify({'message': 'User is already accepted.'}), 400
 
     target_user.is_accepted = True
+    bump_version(target_user.family_id, 'users', 'tasks', 'thoughts')
     db.session.commit()
+    publish_change(target_user.family_id, 'users', 'updated', target_user.id)
     
     return jsonify({'message': 'User accepted successfully!'}), 200
 
+def _check_types(data, field_types):
+    # Values a column can't store would otherwise only fail at flush, taking
+    # the whole transaction with them.
+    for field, types in field_types.items():
+        value = data.get(field)
+        if field in data and (not isinstance(value, types) or (isinstance(value, bool) and bool not in types)):
+            raise ValueError('Invalid %s' % field)
+
 # --- Task Endpoints ---
+TASK_FIELD_TYPES = {'title': (str,), 'description': (str, type(None)), 'completed': (bool,),
+                    'due_date': (str, type(None)), 'recurrence': (str, type(None)),
+                    'assigned_user_id': (int, type(None))}
+
+def _parse_datetime(value):
+    # Stored times are naive UTC, so offsets (and a Z suffix, which
+    # fromisoformat only takes from Python 3.11) are converted to that.
+    if value.endswith(('Z', 'z')):
+        value = value[:-1] + '+00:00'
+    moment = datetime.datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return moment
+
+def _new_task(data):
+    _check_types(data, TASK_FIELD_TYPES)
+    task = Task(
+        title=data['title'],
+        description=data.get('description', ''),
+        completed=data.get('completed', False),
+        due_date=_parse_datetime(data['due_date']) if data.get('due_date') else None,
+        family_id=g.current_user.family_id,
+        author_id=g.current_user.id,
+        assigned_user_id=data.get('assigned_user_id')
+    )
+    task.recurrence, task.recurrence_end = recurrence.normalize(data.get('recurrence'), task.due_date)
+    return task
+
+def _update_task_fields(task, updated_data):
+    # Values are parsed before any is assigned, so a bad one leaves the task as it was.
+    _check_types(updated_data, TASK_FIELD_TYPES)
+    due_date = task.due_date
+    if 'due_date' in updated_data:
+        due_date = _parse_datetime(updated_data['due_date']) if updated_data.get('due_date') else None
+    rule = None
+    if 'recurrence' in updated_data or ('due_date' in updated_data and task.recurrence):
+        rule = recurrence.normalize(updated_data.get('recurrence', task.recurrence), due_date)
+    if 'due_date' in updated_data:
+        task.due_date = due_date
+    if rule is not None:
+        task.recurrence, task.recurrence_end = rule
+    if 'title' in updated_data:
+        task.title = updated_data['title']
+    if 'description' in updated_data:
+        task.description = updated_data['description']
+    if 'completed' in updated_data:
+        task.completed = updated_data['completed']
+    if 'assigned_user_id' in updated_data:
+        task.assigned_user_id = updated_data['assigned_user_id']
+
+def _window_bound(value, end_of_day=False):
+    moment = _parse_datetime(value)
+    if end_of_day and len(value) == 10:
+        # A bare date as the upper bound includes that whole day.
+        return datetime.datetime.combine(moment.date(), datetime.time.max)
+    return moment
+
+def _completed_in(chunk):
+    recurring = {row.id for _, row in chunk if row.recurrence}
+    if not recurring:
+        return set()
+    return set(db.session.query(TaskOccurrence.task_id, TaskOccurrence.occurrence).filter(
+        TaskOccurrence.task_id.in_(recurring),
+        TaskOccurrence.occurrence.between(chunk[0][0], chunk[-1][0])).all())
+
+def _completed_stream(rows, window_start, window_end):
+    # Completions are sparse next to the occurrences a series generates, so
+    # ?completed=true reads them from task_occurrences instead of expanding.
+    # Rows left behind by an earlier rule no longer match and are skipped.
+    by_id = {row.id: row for row in rows}
+    one_off = sorted((row.due_date, row.id, row) for row in rows if not row.recurrence and row.completed)
+    stored = db.session.query(TaskOccurrence.occurrence, TaskOccurrence.task_id).join(Task).filter(
+        Task.family_id == g.current_user.family_id, Task.recurrence.isnot(None),
+        TaskOccurrence.occurrence.between(window_start, window_end)
+    ).order_by(TaskOccurrence.occurrence, TaskOccurrence.task_id)
+    recurring = ((moment, task_id, by_id[task_id]) for moment, task_id in stored.yield_per(MAX_PAGE_SIZE)
+                 if task_id in by_id and recurrence.is_occurrence(by_id[task_id].recurrence, by_id[task_id].due_date,
+                                                                  moment, by_id[task_id].recurrence_end))
+    return ((moment, row) for moment, _, row in heapq.merge(one_off, recurring))
+
+def _task_occurrences(tasks):
+    """Answer GET /tasks?from=&to= with the occurrences due in the window.
+
+    One-off tasks appear once; recurring tasks are expanded lazily and merged
+    in (due_date, id) order, so only as many occurrences as the page needs
+    are generated. Occurrence completion is read from task_occurrences for
+    just the generated span, or drives the scan with ?completed=true.
+    """
+    try:
+        window_start = _window_bound(request.args['from'])
+        window_end = _window_bound(request.args['to'], end_of_day=True)
+        completed = request.args.get('completed')
+        completed = _parse_bool(completed) if completed is not None else None
+        after = None
+        if request.args.get('cursor'):
+            moment, task_id = decode_cursor(request.args['cursor'], ('due_date', 'id'))
+            after = (datetime.datetime.fromisoformat(moment), int(task_id))
+    except KeyError:
+        return jsonify({"error": "from and to are required together"}), 400
+    except (ValueError, TypeError):
+        return jsonify({"error": "Invalid filter value"}), 400
+    limit = max(1, min(request.args.get('limit', MAX_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+
+    scan_start = max(window_start, after[0]) if after else window_start
+    rows = tasks.add_columns(Task.recurrence_end).filter(
+        Task.due_date <= window_end,
+        or_(and_(Task.recurrence.is_(None), Task.due_date >= scan_start),
+            and_(Task.recurrence.isnot(None), or_(Task.recurrence_end.is_(None), Task.recurrence_end >= scan_start)))
+    ).all()
+    if completed:
+        stream = _completed_stream(rows, scan_start, window_end)
+    else:
+        stream = recurrence.merge_occurrences(rows, scan_start, window_end)
+    if after:
+        stream = itertools.dropwhile(lambda item: (item[0], item[1].id) <= after, stream)
+
+    page = []
+    while len(page) <= limit:
+        chunk = list(itertools.islice(stream, limit + 1))
+        if not chunk:
+            break
+        done = set() if completed else _completed_in(chunk)
+        for moment, row in chunk:
+            is_done = completed or ((row.id, moment) in done if row.recurrence else row.completed)
+            if completed is None or is_done == completed:
+                page.append((moment, row, is_done))
+
+    next_cursor = encode_cursor([page[limit - 1][0].isoformat(), page[limit - 1][1].id]) if len(page) > limit else None
+    page = page[:limit]
+    items = serializers.serialize_tasks([row for _, row, _ in page])
+    for item, (moment, row, is_done) in zip(items, page):
+        item['due_date'] = moment.isoformat()
+        item['completed'] = is_done
+        item['occurrence'] = moment.isoformat() if row.recurrence else None
+    response = jsonify(items)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
 @bp.route('/tasks', methods=['GET'])
 @token_required
+@conditional('tasks')
+@cached('tasks')
 def get_tasks():
-    tasks = Task.query.filter_by(family_id=g.current_user.family_id).all()
-    return jsonify([task.to_dict() for task in tasks])
+    tasks = serializers.task_rows().filter(Task.family_id == g.current_user.family_id)
+    try:
+        if 'assigned_user_id' in request.args:
+            tasks = tasks.filter(Task.assigned_user_id == int(request.args['assigned_user_id']))
+    except ValueError:
+        return jsonify({"error": "Invalid filter value"}), 400
+    if 'from' in request.args or 'to' in request.args:
+        return _task_occurrences(tasks)
+    try:
+        completed = request.args.get('completed')
+        if completed is not None:
+            tasks = tasks.filter(Task.completed == _parse_bool(completed))
+        if request.args.get('due_from'):
+            tasks = tasks.filter(Task.due_date >= _parse_datetime(request.args['due_from']))
+        if request.args.get('due_to'):
+            tasks = tasks.filter(Task.due_date <= _parse_datetime(request.args['due_to']))
+    except ValueError:
+        return jsonify({"error": "Invalid filter value"}), 400
+    return _list_response(tasks, (Task.id,), serializers.serialize_tasks)
 
 @bp.route('/tasks', methods=['POST'])
 @token_required
@@ -99,19 +447,23 @@ def add_task():
     if not new_task_data or 'title' not in new_task_data:
         return jsonify({"error": "Title is required"}), 400
     
-    task = Task(
-        title=new_task_data['title'],
-        description=new_task_data.get('description', ''),
-        completed=new_task_data.get('completed', False),
-        due_date=datetime.datetime.fromisoformat(new_task_data['due_date']) if new_task_data.get('due_date') else None,
-        family_id=g.current_user.family_id,
-        author_id=g.current_user.id,
-        assigned_user_id=new_task_data.get('assigned_user_id')
-    )
+    try:
+        task = _new_task(new_task_data)
+    except (ValueError, TypeError):
+        return jsonify({"error": "Invalid value"}), 400
     db.session.add(task)
+    bump_version(g.current_user.family_id, 'tasks')
     db.session.commit()
+    publish_change(g.current_user.family_id, 'tasks', 'created', task.id)
     return jsonify(task.to_dict()), 201
 
+@bp.route('/tasks/batch', methods=['POST'])
+@token_required
+def batch_tasks():
+    if not g.current_user.is_accepted:
+        return jsonify({'message': 'You must be an accepted family member to modify tasks.'}), 403
+    return _run_batch(Task, 'tasks', 'title', _new_task, _update_task_fields, lambda: db.joinedload(Task.assigned_user))
+
 @bp.route('/tasks/<int:task_id>', methods=['GET'])
 @token_required
 def get_task(task_id):
@@ -129,21 +481,46 @@ def update_task(task_id):
     if not task:
         return jsonify({"error": "Task not found"}), 404
         
-    updated_data = request.json
-    if 'title' in updated_data:
-        task.title = updated_data['title']
-    if 'description' in updated_data:
-        task.description = updated_data['description']
-    if 'completed' in updated_data:
-        task.completed = updated_data['completed']
-    if 'due_date' in updated_data:
-        task.due_date = datetime.datetime.fromisoformat(updated_data['due_date']) if updated_data.get('due_date') else None
-    if 'assigned_user_id' in updated_data:
-        task.assigned_user_id = updated_data['assigned_user_id']
-    
+    try:
+        _update_task_fields(task, request.json)
+    except (ValueError, TypeError):
+        db.session.rollback()
+        return jsonify({"error": "Invalid value"}), 400
+    bump_version(g.current_user.family_id, 'tasks')
     db.session.commit()
+    publish_change(g.current_user.family_id, 'tasks', 'updated', task.id)
     return jsonify(task.to_dict())
 
+@bp.route('/tasks/<int:task_id>/occurrences/<occurrence>', methods=['PUT'])
+@token_required
+def update_task_occurrence(task_id, occurrence):
+    if not g.current_user.is_accepted:
+        return jsonify({'message': 'You must be an accepted family member to update tasks.'}), 403
+    task = Task.query.filter_by(id=task_id, family_id=g.current_user.family_id).first()
+    if not task:
+        return jsonify({"error": "Task not found"}), 404
+    try:
+        moment = _parse_datetime(occurrence)
+    except ValueError:
+        return jsonify({"error": "Invalid occurrence"}), 400
+    if not task.recurrence or not recurrence.is_occurrence(task.recurrence, task.due_date, moment, task.recurrence_end):
+        return jsonify({"error": "Occurrence not found"}), 404
+    completed = (request.json or {}).get('completed')
+    if not isinstance(completed, bool):
+        return jsonify({"error": "completed must be true or false"}), 400
+
+    # Only completed occurrences are stored, so reopening deletes the row.
+    existing = TaskOccurrence.query.get((task.id, moment))
+    if completed and existing is None:
+        db.session.add(TaskOccurrence(task_id=task.id, occurrence=moment))
+    elif not completed and existing is not None:
+        db.session.delete(existing)
+    task.updated_at = datetime.datetime.utcnow()
+    bump_version(g.current_user.family_id, 'tasks')
+    db.session.commit()
+    publish_change(g.current_user.family_id, 'tasks', 'updated', task.id)
+    return jsonify({'task_id': task.id, 'occurrence': moment.isoformat(), 'completed': completed})
+
 @bp.route('/tasks/<int:task_id>', methods=['DELETE'])
 @token_required
 def delete_task(task_id):
@@ -154,15 +531,39 @@ def delete_task(task_id):
         return jsonify({"error": "Task not found"}), 404
     
     db.session.delete(task)
+    bump_version(g.current_user.family_id, 'tasks')
     db.session.commit()
+    publish_change(g.current_user.family_id, 'tasks', 'deleted', task_id)
     return jsonify({"message": "Task deleted successfully"})
 
+@bp.route('/tasks/completed', methods=['DELETE'])
+@token_required
+def clear_completed_tasks():
+    if not g.current_user.is_accepted:
+        return jsonify({'message': 'You must be an accepted family member to delete tasks.'}), 403
+    return _clear_completed(Task, 'tasks', Task.completed)
+
 # --- Meal Endpoints ---
+def _own_recipe(recipe_id):
+    # Meals may only point at the family's own recipes, or at none.
+    if recipe_id is None:
+        return True
+    if not isinstance(recipe_id, int) or isinstance(recipe_id, bool):
+        return False
+    return db.session.query(Recipe.query.filter_by(id=recipe_id, family_id=g.current_user.family_id).exists()).scalar()
+
 @bp.route('/meals', methods=['GET'])
 @token_required
+@conditional('meals')
+@cached('meals')
 def get_meals():
-    meals = Meal.query.filter_by(family_id=g.current_user.family_id).all()
-    return jsonify([meal.to_dict() for meal in meals])
+    meals = serializers.meal_rows().filter(Meal.family_id == g.current_user.family_id)
+    # Meal dates are ISO strings, so range filters compare lexically.
+    if request.args.get('from'):
+        meals = meals.filter(Meal.date >= request.args['from'])
+    if request.args.get('to'):
+        meals = meals.filter(Meal.date <= request.args['to'])
+    return _list_response(meals, (Meal.id,), serializers.serialize_meals)
 
 @bp.route('/meals', methods=['POST'])
 @token_required
@@ -173,6 +574,9 @@ def add_meal():
     if not new_meal_data or 'name' not in new_meal_data:
         return jsonify({"error": "Meal name is required"}), 400
     
+    if not _own_recipe(new_meal_data.get('recipe_id')):
+        return jsonify({"error": "Recipe not found"}), 400
+
     meal = Meal(
         name=new_meal_data['name'],
         date=new_meal_data.get('date', ''),
@@ -181,7 +585,9 @@ def add_meal():
         family_id=g.current_user.family_id
     )
     db.session.add(meal)
+    bump_version(g.current_user.family_id, 'meals')
     db.session.commit()
+    publish_change(g.current_user.family_id, 'meals', 'created', meal.id)
     return jsonify(meal.to_dict()), 201
 
 @bp.route('/meals/<int:meal_id>', methods=['GET'])
@@ -202,6 +608,8 @@ def update_meal(meal_id):
         return jsonify({"error": "Meal not found"}), 404
 
     updated_data = request.json
+    if 'recipe_id' in updated_data and not _own_recipe(updated_data['recipe_id']):
+        return jsonify({"error": "Recipe not found"}), 400
     if 'name' in updated_data:
         meal.name = updated_data['name']
     if 'date' in updated_data:
@@ -211,7 +619,9 @@ def update_meal(meal_id):
     if 'meal_time' in updated_data:
         meal.meal_time = updated_data['meal_time']
         
+    bump_version(g.current_user.family_id, 'meals')
     db.session.commit()
+    publish_change(g.current_user.family_id, 'meals', 'updated', meal.id)
     return jsonify(meal.to_dict())
 
 @bp.route('/meals/<int:meal_id>', methods=['DELETE'])
@@ -224,15 +634,66 @@ def delete_meal(meal_id):
         return jsonify({"error": "Meal not found"}), 404
         
     db.session.delete(meal)
+    bump_version(g.current_user.family_id, 'meals')
     db.session.commit()
+    publish_change(g.current_user.family_id, 'meals', 'deleted', meal_id)
     return jsonify({"message": "Meal deleted successfully"})
 
 # --- Recipe Endpoints ---
 @bp.route('/recipes', methods=['GET'])
 @token_required
+@conditional('recipes')
+@cached('recipes')
 def get_recipes():
-    recipes = Recipe.query.filter_by(family_id=g.current_user.family_id).all()
-    return jsonify([recipe.to_dict() for recipe in recipes])
+    recipes = serializers.recipe_rows().filter(Recipe.family_id == g.current_user.family_id)
+    # Each ?ingredient= narrows the list to recipes that use it, via the catalog.
+    for name in request.args.getlist('ingredient'):
+        if name.strip():
+            recipes = recipes.filter(Recipe.id.in_(ingredients.recipes_using(g.current_user.family_id, name)))
+    return _list_response(recipes, (Recipe.id,), serializers.serialize_recipes)
+
+@bp.route('/recipes/cookable', methods=['GET'])
+@token_required
+def get_cookable_recipes():
+    """Recipes whose ingredients are on the grocery list, but for at most
+    ?max_missing of them, fewest missing first.
+
+    Only items not yet checked off count unless ?is_completed=true, which
+    uses the checked-off ones instead.
+    """
+    family_id = g.current_user.family_id
+    max_missing = max(0, request.args.get('max_missing', 0, type=int))
+    try:
+        is_completed = _parse_bool(request.args.get('is_completed', 'false'))
+    except ValueError:
+        return jsonify({"error": "Invalid filter value"}), 400
+    items = db.session.query(GroceryItem.name).filter(
+        GroceryItem.family_id == family_id, GroceryItem.is_completed == is_completed)
+    names = {normalize_name(name) for (name,) in items}
+    on_list = [ingredient_id for (ingredient_id,) in db.session.query(Ingredient.id).filter(
+        Ingredient.family_id == family_id, Ingredient.normalized_name.in_(names))] if names else []
+    if not on_list:
+        return jsonify([])
+
+    # Only recipes using something on the list are counted, found through
+    # the reverse index.
+    have = func.sum(case((RecipeIngredient.ingredient_id.in_(on_list), 1), else_=0))
+    total = func.count(RecipeIngredient.id)
+    counts = {recipe_id: (total_count - have_count, have_count) for recipe_id, have_count, total_count in db.session.query(
+        RecipeIngredient.recipe_id, have, total
+    ).filter(
+        RecipeIngredient.recipe_id.in_(db.session.query(RecipeIngredient.recipe_id).filter(RecipeIngredient.ingredient_id.in_(on_list)))
+    ).group_by(RecipeIngredient.recipe_id).having(total - have <= max_missing)}
+    if not counts:
+        return jsonify([])
+
+    on_list = set(on_list)
+    recipes = serializers.serialize_recipes(serializers.recipe_rows().filter(
+        Recipe.family_id == family_id, Recipe.id.in_(list(counts))).all())
+    for recipe in recipes:
+        recipe['missing'] = [ingredient['name'] for ingredient in recipe['ingredients'] if ingredient['ingredient_id'] not in on_list]
+    recipes.sort(key=lambda recipe: (counts[recipe['id']][0], -counts[recipe['id']][1], recipe['id']))
+    return jsonify(recipes)
 
 @bp.route('/recipes', methods=['POST'])
 @token_required
@@ -245,20 +706,19 @@ def add_recipe():
     
     recipe = Recipe(
         name=new_recipe_data['name'],
-        instructions=json.dumps(new_recipe_data.get('instructions', [])),
+        instructions=new_recipe_data.get('instructions', []),
         family_id=g.current_user.family_id
     )
 
     if 'ingredients' in new_recipe_data:
-        for ing_data in new_recipe_data['ingredients']:
-            ingredient = RecipeIngredient(
-                name=ing_data['name'],
-                quantity=ing_data.get('quantity')
-            )
-            recipe.ingredients.append(ingredient)
+        catalog = ingredients.catalog_ids(g.current_user.family_id, [ing['name'] for ing in new_recipe_data['ingredients']])
+        for position, ing_data in enumerate(new_recipe_data['ingredients']):
+            recipe.ingredients.append(RecipeIngredient(position=position, **ingredients.ingredient_values(ing_data, catalog)))
 
     db.session.add(recipe)
+    bump_version(g.current_user.family_id, 'recipes')
     db.session.commit()
+    publish_change(g.current_user.family_id, 'recipes', 'created', recipe.id)
     return jsonify(recipe.to_dict()), 201
 
 @bp.route('/recipes/<int:recipe_id>', methods=['GET'])
@@ -283,19 +743,52 @@ def update_recipe(recipe_id):
     if 'name' in updated_data:
         recipe.name = updated_data['name']
     if 'instructions' in updated_data:
-        recipe.instructions = json.dumps(updated_data['instructions'])
+        recipe.instructions = updated_data['instructions']
     
     if 'ingredients' in updated_data:
-        # Clear existing ingredients and add new ones
-        recipe.ingredients.clear()
-        for ing_data in updated_data['ingredients']:
-            ingredient = RecipeIngredient(
-                name=ing_data['name'],
-                quantity=ing_data.get('quantity')
-            )
-            recipe.ingredients.append(ingredient)
+        # The list replaces the recipe's ingredients, reconciled by id or name.
+        try:
+            changed = ingredients.update_ingredients(recipe.id, g.current_user.family_id, updated_data['ingredients'])
+        except (ValueError, TypeError):
+            return jsonify({"error": "Invalid ingredients"}), 400
+        if changed:
+            # Ingredient edits don't dirty the recipe row, so stamp it for sync.
+            recipe.updated_at = datetime.datetime.utcnow()
 
+    bump_version(g.current_user.family_id, 'recipes')
     db.session.commit()
+    publish_change(g.current_user.family_id, 'recipes', 'updated', recipe.id)
+    return jsonify(recipe.to_dict())
+
+@bp.route('/recipes/<int:recipe_id>/ingredients', methods=['PATCH'])
+@token_required
+def patch_recipe_ingredients(recipe_id):
+    """Edit some of a recipe's ingredients: {"ingredients": [...], "delete": [ids]}.
+
+    Items edit the ingredient with their id, or with the same name, else
+    are added after the others; fields an item leaves out and ingredients
+    not mentioned are left alone.
+    """
+    if not g.current_user.is_accepted:
+        return jsonify({'message': 'You must be an accepted family member to update recipes.'}), 403
+
+    recipe = Recipe.query.filter_by(id=recipe_id, family_id=g.current_user.family_id).first()
+    if not recipe:
+        return jsonify({"error": "Recipe not found"}), 404
+
+    patch = request.json or {}
+    if not isinstance(patch, dict):
+        return jsonify({"error": "Invalid ingredients"}), 400
+    try:
+        changed = ingredients.update_ingredients(recipe.id, g.current_user.family_id, patch.get('ingredients', []),
+                                                 delete_ids=patch.get('delete', []))
+    except (ValueError, TypeError):
+        return jsonify({"error": "Invalid ingredients"}), 400
+    if changed:
+        recipe.updated_at = datetime.datetime.utcnow()
+        bump_version(g.current_user.family_id, 'recipes')
+        db.session.commit()
+        publish_change(g.current_user.family_id, 'recipes', 'updated', recipe.id)
     return jsonify(recipe.to_dict())
 
 @bp.route('/recipes/<int:recipe_id>', methods=['DELETE'])
@@ -308,15 +801,50 @@ def delete_recipe(recipe_id):
         return jsonify({"error": "Recipe not found"}), 404
         
     db.session.delete(recipe)
+    bump_version(g.current_user.family_id, 'recipes')
     db.session.commit()
+    publish_change(g.current_user.family_id, 'recipes', 'deleted', recipe_id)
     return jsonify({"message": "Recipe deleted successfully"})
 
 # --- Grocery Item Endpoints ---
+GROCERY_ITEM_FIELD_TYPES = {'name': (str,), 'quantity': (str, type(None)), 'category': (str,), 'is_completed': (bool,)}
+
+def _new_grocery_item(data):
+    _check_types(data, GROCERY_ITEM_FIELD_TYPES)
+    return GroceryItem(
+        name=data['name'],
+        quantity=data.get('quantity', ''),
+        category=data.get('category', 'Other'),
+        is_completed=data.get('is_completed', False),
+        family_id=g.current_user.family_id
+    )
+
+def _update_grocery_item_fields(item, updated_data):
+    _check_types(updated_data, GROCERY_ITEM_FIELD_TYPES)
+    if 'name' in updated_data:
+        item.name = updated_data['name']
+    if 'quantity' in updated_data:
+        item.quantity = updated_data['quantity']
+    if 'category' in updated_data:
+        item.category = updated_data['category']
+    if 'is_completed' in updated_data:
+        item.is_completed = updated_data['is_completed']
+
 @bp.route('/grocery_items', methods=['GET'])
 @token_required
+@conditional('grocery_items')
+@cached('grocery_items')
 def get_grocery_items():
-    items = GroceryItem.query.filter_by(family_id=g.current_user.family_id).all()
-    return jsonify([item.to_dict() for item in items])
+    items = serializers.grocery_item_rows().filter(GroceryItem.family_id == g.current_user.family_id)
+    is_completed = request.args.get('is_completed')
+    if is_completed is not None:
+        try:
+            items = items.filter(GroceryItem.is_completed == _parse_bool(is_completed))
+        except ValueError:
+            return jsonify({"error": "Invalid filter value"}), 400
+    if request.args.get('category'):
+        items = items.filter(GroceryItem.category == request.args['category'])
+    return _list_response(items, (GroceryItem.id,), serializers.serialize_grocery_items)
 
 @bp.route('/grocery_items', methods=['POST'])
 @token_required
@@ -328,17 +856,90 @@ def add_grocery_item():
     if not new_item_data or 'name' not in new_item_data:
         return jsonify({"error": "Name is required"}), 400
     
-    item = GroceryItem(
-        name=new_item_data['name'],
-        quantity=new_item_data.get('quantity', ''),
-        category=new_item_data.get('category', 'Other'),
-        is_completed=new_item_data.get('is_completed', False),
-        family_id=g.current_user.family_id
-    )
+    try:
+        item = _new_grocery_item(new_item_data)
+    except ValueError:
+        return jsonify({"error": "Invalid value"}), 400
     db.session.add(item)
+    bump_version(g.current_user.family_id, 'grocery_items')
     db.session.commit()
+    publish_change(g.current_user.family_id, 'grocery_items', 'created', item.id)
     return jsonify(item.to_dict()), 201
 
+@bp.route('/grocery_items/batch', methods=['POST'])
+@token_required
+def batch_grocery_items():
+    if not g.current_user.is_accepted:
+        return jsonify({'message': 'You must be an accepted family member to modify grocery items.'}), 403
+    return _run_batch(GroceryItem, 'grocery_items', 'name', _new_grocery_item, _update_grocery_item_fields)
+
+# Merged totals are cut to fit the column; PostgreSQL rejects longer text.
+QUANTITY_LENGTH = GroceryItem.quantity.type.length
+
+@bp.route('/grocery_items/from_meals', methods=['POST'])
+@token_required
+def grocery_items_from_meals():
+    """Add the ingredients of the meals planned from ?from to ?to to the
+    grocery list, merged into matching items that aren't checked off.
+
+    Additive: nothing records which meals were added, so calling it again
+    for the same dates adds their ingredients again.
+    """
+    if not g.current_user.is_accepted:
+        return jsonify({'message': 'You must be an accepted family member to add grocery items.'}), 403
+    date_from, date_to = request.args.get('from'), request.args.get('to')
+    if not date_from or not date_to:
+        return jsonify({"error": "from and to dates are required"}), 400
+
+    family_id = g.current_user.family_id
+    # Every ingredient of every planned meal in the range, summed per
+    # catalog entry and unit in one join. A recipe planned twice contributes
+    # its ingredients twice; text that didn't parse is carried as is. The
+    # recipe must be the family's own too, whatever a meal row points at.
+    planned = db.session.query(Ingredient.name, Ingredient.normalized_name).join(
+        RecipeIngredient, RecipeIngredient.ingredient_id == Ingredient.id
+    ).join(Recipe, Recipe.id == RecipeIngredient.recipe_id).join(Meal, Meal.recipe_id == Recipe.id).filter(
+        Meal.family_id == family_id, Recipe.family_id == family_id, Meal.date >= date_from, Meal.date <= date_to)
+    parsed = planned.add_columns(RecipeIngredient.unit, func.sum(RecipeIngredient.amount)).filter(
+        RecipeIngredient.amount.isnot(None)).group_by(Ingredient.id, RecipeIngredient.unit)
+    unparsed = planned.add_columns(RecipeIngredient.quantity).filter(RecipeIngredient.amount.is_(None))
+
+    totals, display_names = {}, {}
+    for name, key, unit, amount in parsed:
+        display_names.setdefault(key, name)
+        totals.setdefault(key, QuantityTotal()).add_amount(amount, unit)
+    for name, key, quantity in unparsed:
+        display_names.setdefault(key, name)
+        totals.setdefault(key, QuantityTotal()).add(quantity)
+
+    # Merge into items still on the list rather than adding duplicates.
+    open_items = {}
+    for item in GroceryItem.query.filter_by(family_id=family_id, is_completed=False):
+        open_items.setdefault(normalize_name(item.name), item)
+
+    created, updated = [], []
+    for key, total in totals.items():
+        item = open_items.get(key)
+        if item is None:
+            item = GroceryItem(name=display_names[key], quantity=total.format(QUANTITY_LENGTH), category='Other', family_id=family_id)
+            db.session.add(item)
+            created.append(item)
+        else:
+            total.add(item.quantity)
+            item.quantity = total.format(QUANTITY_LENGTH)
+            updated.append(item)
+
+    if not created and not updated:
+        return jsonify({'created': [], 'updated': []})
+    db.session.flush()
+    response = {'created': [item.to_dict() for item in created], 'updated': [item.to_dict() for item in updated]}
+    bump_version(family_id, 'grocery_items')
+    db.session.commit()
+    for action, items in (('created', response['created']), ('updated', response['updated'])):
+        for item in items:
+            publish_change(family_id, 'grocery_items', action, item['id'])
+    return jsonify(response), 201 if created else 200
+
 @bp.route('/grocery_items/<int:item_id>', methods=['GET'])
 @token_required
 def get_grocery_item(item_id):
@@ -357,17 +958,13 @@ def update_grocery_item(item_id):
     if not item:
         return jsonify({"error": "Grocery item not found"}), 404
 
-    updated_data = request.json
-    if 'name' in updated_data:
-        item.name = updated_data['name']
-    if 'quantity' in updated_data:
-        item.quantity = updated_data['quantity']
-    if 'category' in updated_data:
-        item.category = updated_data['category']
-    if 'is_completed' in updated_data:
-        item.is_completed = updated_data['is_completed']
-        
+    try:
+        _update_grocery_item_fields(item, request.json)
+    except ValueError:
+        return jsonify({"error": "Invalid value"}), 400
+    bump_version(g.current_user.family_id, 'grocery_items')
     db.session.commit()
+    publish_change(g.current_user.family_id, 'grocery_items', 'updated', item.id)
     return jsonify(item.to_dict())
 
 @bp.route('/grocery_items/<int:item_id>', methods=['DELETE'])
@@ -380,9 +977,18 @@ def delete_grocery_item(item_id):
         return jsonify({"error": "Grocery item not found"}), 404
         
     db.session.delete(item)
+    bump_version(g.current_user.family_id, 'grocery_items')
     db.session.commit()
+    publish_change(g.current_user.family_id, 'grocery_items', 'deleted', item_id)
     return jsonify({"message": "Grocery item deleted successfully"})
 
+@bp.route('/grocery_items/completed', methods=['DELETE'])
+@token_required
+def clear_completed_grocery_items():
+    if not g.current_user.is_accepted:
+        return jsonify({'message': 'You must be an accepted family member to delete grocery items.'}), 403
+    return _clear_completed(GroceryItem, 'grocery_items', GroceryItem.is_completed)
+
 # --- Thought Endpoints ---
 @bp.route('/thoughts', methods=['POST'])
 @token_required
@@ -399,13 +1005,111 @@ def add_thought():
         family_id=g.current_user.family_id
     )
     db.session.add(thought)
+    bump_version(g.current_user.family_id, 'thoughts')
     db.session.commit()
+    publish_change(g.current_user.family_id, 'thoughts', 'created', thought.id)
     return jsonify(thought.to_dict()), 201
 
 @bp.route('/thoughts', methods=['GET'])
 @token_required
+@conditional('thoughts')
+@cached('thoughts')
 def get_thoughts():
+    thoughts = serializers.thought_rows().filter(Thought.family_id == g.current_user.family_id)
     page = request.args.get('page', 1, type=int)
-    limit = request.args.get('limit', 10, type=int)
-    thoughts = Thought.query.filter_by(family_id=g.current_user.family_id).order_by(Thought.timestamp.desc()).paginate(page=page, per_page=limit, error_out=False)
-    return jsonify([thought.to_dict() for thought in thoughts.items])
+    if page > 1 and 'cursor' not in request.args:
+        # Legacy page-number clients; new clients should follow X-Next-Cursor.
+        limit = max(1, min(request.args.get('limit', 10, type=int), MAX_PAGE_SIZE))
+        thoughts = thoughts.order_by(Thought.id.desc()).offset((page - 1) * limit).limit(limit).all()
+        return jsonify(serializers.serialize_thoughts(thoughts))
+    # Ids are assigned in insertion order, matching the server-set timestamp,
+    # so newest-first by id is a stable keyset that needs no tie-breaker.
+    return _list_response(thoughts, (Thought.id,), serializers.serialize_thoughts, descending=True, default_limit=10)
+
+# --- Search Endpoint ---
+SEARCH_PAGE_SIZE = 20
+
+@bp.route('/search', methods=['GET'])
+@token_required
+def search_family():
+    terms = search.search_terms(request.args.get('q'))
+    if not terms:
+        return jsonify({"error": "Missing search query"}), 400
+    kinds = request.args.get('types')
+    kinds = kinds.split(',') if kinds else list(search.KINDS)
+    if any(kind not in search.KINDS for kind in kinds):
+        return jsonify({"error": "Invalid types"}), 400
+    limit = max(1, min(request.args.get('limit', SEARCH_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    offset = 0
+    if request.args.get('cursor'):
+        # Results are ordered by rank, which has no stable keyset; the cursor
+        # carries an offset instead.
+        try:
+            offset = decode_cursor(request.args['cursor'], ('offset',))[0]
+        except ValueError:
+            return jsonify({"error": "Invalid cursor"}), 400
+        if not isinstance(offset, int) or offset < 0:
+            return jsonify({"error": "Invalid cursor"}), 400
+
+    results = search.search(g.current_user.family_id, terms, kinds, limit + 1, offset)
+    response = jsonify(results[:limit])
+    if len(results) > limit:
+        response.headers['X-Next-Cursor'] = encode_cursor([offset + limit])
+    return response
+
+# --- Archive Endpoint ---
+ARCHIVE_PAGE_SIZE = 50
+
+@bp.route('/archive', methods=['GET'])
+@token_required
+def get_archive():
+    collection = request.args.get('collection')
+    if collection not in archive.ARCHIVED_COLLECTIONS:
+        return jsonify({"error": "collection must be one of %s" % ', '.join(archive.ARCHIVED_COLLECTIONS)}), 400
+    records = db.session.query(ArchivedRecord.id, ArchivedRecord.archived_at, ArchivedRecord.data).filter(
+        ArchivedRecord.family_id == g.current_user.family_id, ArchivedRecord.collection == collection)
+    try:
+        # from/to select by when rows were archived.
+        if request.args.get('from'):
+            records = records.filter(ArchivedRecord.archived_at >= _window_bound(request.args['from']))
+        if request.args.get('to'):
+            records = records.filter(ArchivedRecord.archived_at <= _window_bound(request.args['to'], end_of_day=True))
+    except ValueError:
+        return jsonify({"error": "Invalid filter value"}), 400
+    return _list_response(records, (ArchivedRecord.id,), archive.serialize_archived, descending=True,
+                          default_limit=ARCHIVE_PAGE_SIZE)
+
+# --- Sync Endpoint ---
+@bp.route('/sync', methods=['GET'])
+@token_required
+def sync():
+    since = None
+    if request.args.get('since'):
+        try:
+            since = decode_sync_token(request.args['since'])
+        except ValueError:
+            return jsonify({"error": "Invalid sync token"}), 400
+        # Tombstones older than the retention window are pruned, so older
+        # clients can't be given a complete delta and get everything instead.
+        retention = datetime.timedelta(days=current_app.config['SYNC_TOMBSTONE_RETENTION_DAYS'])
+        if since < datetime.datetime.utcnow() - retention:
+            since = None
+
+    # Taken before reading so anything committed mid-sync is in the next delta.
+    sync_started = datetime.datetime.utcnow()
+    upserts, deletions = changes_since(g.current_user.family_id, since)
+    return jsonify({
+        'sync_token': encode_sync_token(sync_started),
+        'full': since is None,
+        'upserts': upserts,
+        'deletions': deletions
+    })
+
+# --- Stream Endpoint ---
+@bp.route('/stream', methods=['GET'])
+@token_required
+def stream():
+    return Response(event_stream(g.current_user.family_id), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
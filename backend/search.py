@@ -0,0 +1,141 @@
+"""Family-scoped full-text search over tasks, recipes, thoughts and grocery items.
+
+On SQLite the `search_index` FTS5 table, created and kept in sync by
+triggers in migration 3b8f0c6d2e14, is queried directly. Other engines, or
+a database built with `create_all`, fall back to LIKE matching over the
+source tables with the same result shape.
+"""
+import html
+import re
+from sqlalchemy import inspect, text, or_, and_, type_coerce
+from database import db
+from models import Task, Recipe, RecipeIngredient, Thought, GroceryItem
+
+# Kind codes match the rowid encoding used by the search_index triggers.
+KINDS = {'tasks': 1, 'recipes': 2, 'thoughts': 3, 'grocery_items': 4}
+KIND_NAMES = {code: name for name, code in KINDS.items()}
+ROWID_FACTOR = 8
+
+MARK_START, MARK_END = '<mark>', '</mark>'
+# Matches are first delimited with these control characters; the text is
+# then HTML-escaped and only they become markup.
+_START, _END = '\x02', '\x03'
+SNIPPET_WORDS = 12
+MAX_TERMS = 8
+# Column weights for bm25: family, title, body, extra (ingredients).
+WEIGHTS = (0.0, 10.0, 1.0, 5.0)
+# The fallback ranks in Python, so it only considers this many matches per kind.
+FALLBACK_SCAN_LIMIT = 1000
+
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+_fts_tables = {}
+
+def search_terms(q):
+    return _TERM_RE.findall((q or '').lower())[:MAX_TERMS]
+
+def fts_available():
+    bind = db.session().get_bind()
+    key = str(bind.url)
+    if key not in _fts_tables:
+        _fts_tables[key] = bind.dialect.name == 'sqlite' and inspect(bind).has_table('search_index')
+    return _fts_tables[key]
+
+def search(family_id, terms, kinds, limit, offset=0):
+    """Return up to `limit` results after `offset`, best match first.
+
+    Every term must match some field: as a word prefix on FTS5, as a
+    substring in the fallback. Results are
+    dicts with type, id, title and snippet, which are HTML-escaped with the
+    matches wrapped in MARK_START/MARK_END.
+    """
+    if fts_available():
+        return _fts_search(family_id, terms, kinds, limit, offset)
+    return _fallback_search(family_id, terms, kinds, limit, offset)
+
+def _fts_search(family_id, terms, kinds, limit, offset):
+    # Terms are \w+ runs, so quoting them is enough to keep user input out of
+    # the FTS5 query syntax.
+    match = 'family : "f%d" AND {title body extra} : (%s)' % (
+        family_id, ' '.join('"%s"*' % term for term in terms))
+    sql = text(
+        "SELECT rowid, highlight(search_index, 1, :start, :end), "
+        "snippet(search_index, 2, :start, :end, '…', :words), "
+        "snippet(search_index, 3, :start, :end, '…', :words) "
+        "FROM search_index WHERE search_index MATCH :match AND rowid %% %d IN (%s) "
+        "ORDER BY bm25(search_index, %s) LIMIT :limit OFFSET :offset" % (
+            ROWID_FACTOR, ', '.join(str(KINDS[kind]) for kind in kinds), ', '.join(str(w) for w in WEIGHTS)))
+    rows = db.session.execute(sql, {'start': _START, 'end': _END, 'words': SNIPPET_WORDS,
+                                    'match': match, 'limit': limit, 'offset': offset})
+    results = []
+    for rowid, title, body, extra in rows:
+        kind = KIND_NAMES[rowid % ROWID_FACTOR]
+        # The family column always matches, so snippet(-1) could pick it;
+        # prefer whichever of body and ingredients actually matched.
+        snippet = next((field for field in (body, extra) if _START in field), title)
+        results.append({'type': kind, 'id': rowid // ROWID_FACTOR,
+                        'title': _markup(title) if kind != 'thoughts' else None, 'snippet': _markup(snippet)})
+    return results
+
+def _matches_all(terms, columns):
+    return and_(*[or_(*[column.ilike('%' + term + '%') for column in columns]) for term in terms])
+
+def _fallback_query(kind, family_id, terms):
+    if kind == 'tasks':
+        return db.session.query(Task.id, Task.title, Task.description).filter(
+            Task.family_id == family_id, _matches_all(terms, [Task.title, Task.description])), Task.id
+    if kind == 'recipes':
+        ingredients = db.session.query(RecipeIngredient.id).filter(RecipeIngredient.recipe_id == Recipe.id)
+        # The raw JSON text, as the search_index triggers index it.
+        return db.session.query(Recipe.id, Recipe.name, type_coerce(Recipe.instructions, db.Text)).filter(
+            Recipe.family_id == family_id,
+            *[or_(Recipe.name.ilike('%' + term + '%'), Recipe.instructions.ilike('%' + term + '%'),
+                  ingredients.filter(RecipeIngredient.name.ilike('%' + term + '%')).exists())
+              for term in terms]), Recipe.id
+    if kind == 'thoughts':
+        return db.session.query(Thought.id, db.literal(''), Thought.content).filter(
+            Thought.family_id == family_id, _matches_all(terms, [Thought.content])), Thought.id
+    return db.session.query(GroceryItem.id, GroceryItem.name, GroceryItem.category).filter(
+        GroceryItem.family_id == family_id, _matches_all(terms, [GroceryItem.name, GroceryItem.category])), GroceryItem.id
+
+def _fallback_search(family_id, terms, kinds, limit, offset):
+    pattern = re.compile(r'\w*(?:%s)\w*' % '|'.join(re.escape(term) for term in terms), re.IGNORECASE | re.UNICODE)
+    candidates = []
+    for kind in kinds:
+        query, id_column = _fallback_query(kind, family_id, terms)
+        rows = query.order_by(id_column.desc()).limit(FALLBACK_SCAN_LIMIT).all()
+        ingredients = _ingredient_names([row[0] for row in rows]) if kind == 'recipes' else {}
+        for record_id, title, body in rows:
+            fields = (title or '', body or '', ingredients.get(record_id, ''))
+            score = sum(weight * len(pattern.findall(field)) for weight, field in zip(WEIGHTS[1:], fields))
+            candidates.append((-score, KINDS[kind], -record_id, fields))
+    candidates.sort(key=lambda candidate: candidate[:3])
+
+    results = []
+    for _, code, record_id, (title, body, extra) in candidates[offset:offset + limit]:
+        kind = KIND_NAMES[code]
+        best = next((field for field in (body, extra) if pattern.search(field)), title)
+        results.append({'type': kind, 'id': -record_id,
+                        'title': _markup(_highlight(pattern, title)) if kind != 'thoughts' else None,
+                        'snippet': _markup(_snippet(pattern, best))})
+    return results
+
+def _ingredient_names(recipe_ids):
+    names = {}
+    if recipe_ids:
+        for recipe_id, name in db.session.query(RecipeIngredient.recipe_id, RecipeIngredient.name).filter(
+                RecipeIngredient.recipe_id.in_(recipe_ids)).order_by(RecipeIngredient.id):
+            names[recipe_id] = (names[recipe_id] + ' ' + name) if recipe_id in names else name
+    return names
+
+def _highlight(pattern, value):
+    return pattern.sub(lambda match: _START + match.group(0) + _END, value)
+
+def _snippet(pattern, value):
+    words = value.split()
+    first = next((i for i, word in enumerate(words) if pattern.search(word)), 0)
+    start = max(0, min(first - SNIPPET_WORDS // 4, len(words) - SNIPPET_WORDS))
+    window = ' '.join(words[start:start + SNIPPET_WORDS])
+    return ('…' if start > 0 else '') + _highlight(pattern, window) + ('…' if start + SNIPPET_WORDS < len(words) else '')
+
+def _markup(value):
+    return html.escape(value).replace(_START, MARK_START).replace(_END, MARK_END)
@@ -0,0 +1,101 @@
+"""Column-level serializers for the collection endpoints.
+
+List endpoints select exactly the columns a response needs and build dicts
+straight from result rows, skipping ORM object hydration and identity-map
+bookkeeping. Each `*_rows()` query yields rows whose serialized form matches
+the model's `to_dict()`; each `serialize_*` turns a page of rows into that
+list.
+"""
+from sqlalchemy.orm import aliased
+from database import db
+from models import Task, Meal, Recipe, GroceryItem, User, Thought, RecipeIngredient
+
+_USER_FIELDS = ('id', 'username', 'email', 'is_accepted', 'family_id')
+
+def _user_columns(entity, prefix):
+    return [getattr(entity, field).label(prefix + field) for field in _USER_FIELDS]
+
+def _user_dict(row, prefix):
+    if getattr(row, prefix + 'id') is None:
+        return None
+    return {field: getattr(row, prefix + field) for field in _USER_FIELDS}
+
+def user_rows():
+    return db.session.query(*[getattr(User, field) for field in _USER_FIELDS])
+
+def serialize_users(rows):
+    return [{field: getattr(row, field) for field in _USER_FIELDS} for row in rows]
+
+_AssignedUser = aliased(User)
+
+def task_rows():
+    return db.session.query(
+        Task.id, Task.title, Task.description, Task.completed, Task.due_date,
+        Task.family_id, Task.author_id, Task.assigned_user_id, Task.recurrence,
+        *_user_columns(_AssignedUser, 'assigned_user_')
+    ).outerjoin(_AssignedUser, Task.assigned_user_id == _AssignedUser.id)
+
+def serialize_tasks(rows):
+    return [{
+        'id': row.id,
+        'title': row.title,
+        'description': row.description,
+        'completed': row.completed,
+        'due_date': row.due_date.isoformat() if row.due_date else None,
+        'family_id': row.family_id,
+        'author_id': row.author_id,
+        'assigned_user_id': row.assigned_user_id,
+        'assigned_user': _user_dict(row, 'assigned_user_'),
+        'recurrence': row.recurrence
+    } for row in rows]
+
+_GROCERY_ITEM_FIELDS = ('id', 'name', 'quantity', 'category', 'is_completed', 'family_id')
+_MEAL_FIELDS = ('id', 'name', 'date', 'recipe_id', 'meal_time', 'family_id')
+
+def grocery_item_rows():
+    return db.session.query(*[getattr(GroceryItem, field) for field in _GROCERY_ITEM_FIELDS])
+
+def serialize_grocery_items(rows):
+    return [row._asdict() for row in rows]
+
+def meal_rows():
+    return db.session.query(*[getattr(Meal, field) for field in _MEAL_FIELDS])
+
+def serialize_meals(rows):
+    return [row._asdict() for row in rows]
+
+def recipe_rows():
+    return db.session.query(Recipe.id, Recipe.name, Recipe.instructions, Recipe.family_id)
+
+def serialize_recipes(rows):
+    # One query for the whole page's ingredients instead of one per recipe.
+    ingredients = {row.id: [] for row in rows}
+    if ingredients:
+        for ingredient in db.session.query(
+                RecipeIngredient.id, RecipeIngredient.recipe_id, RecipeIngredient.name, RecipeIngredient.quantity,
+                RecipeIngredient.ingredient_id, RecipeIngredient.amount, RecipeIngredient.unit
+        ).filter(RecipeIngredient.recipe_id.in_(list(ingredients))).order_by(RecipeIngredient.position, RecipeIngredient.id):
+            ingredients[ingredient.recipe_id].append(ingredient._asdict())
+    return [{
+        'id': row.id,
+        'name': row.name,
+        'instructions': row.instructions,
+        'family_id': row.family_id,
+        'ingredients': ingredients[row.id]
+    } for row in rows]
+
+def thought_rows():
+    return db.session.query(
+        Thought.id, Thought.content, Thought.timestamp, Thought.user_id, Thought.family_id,
+        *_user_columns(User, 'user_')
+    ).join(User, Thought.user_id == User.id)
+
+def serialize_thoughts(rows):
+    return [{
+        'id': row.id,
+        'content': row.content,
+        'timestamp': row.timestamp.isoformat(),
+        'user_id': row.user_id,
+        'family_id': row.family_id,
+        'user': _user_dict(row, 'user_')
+    } for row in rows]
@@ -0,0 +1,168 @@
+"""Constant-memory streaming of collections and whole-family export/import.
+
+Rows are read through server-side cursors (`yield_per`) and serialized a
+chunk at a time, so a response never holds more than one chunk of rows.
+Generators here must be wrapped in `stream_with_context` by the caller so
+the database session outlives the view function.
+"""
+import datetime
+import json
+from flask import current_app
+from database import db
+from models import Task, Meal, Recipe, GroceryItem, User, Thought, RecipeIngredient, Family
+import serializers
+import recurrence
+import ingredients
+from quantities import normalize_name
+
+CHUNK_SIZE = 500
+EXPORT_FORMAT = 1
+
+def iter_chunks(query, chunk_size=CHUNK_SIZE):
+    chunk = []
+    for row in query.yield_per(chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def json_array_stream(query, serialize):
+    dumps = current_app.json.dumps
+    yield '['
+    first = True
+    for chunk in iter_chunks(query):
+        items = [dumps(item) for item in serialize(chunk)]
+        yield ('' if first else ',') + ','.join(items)
+        first = False
+    yield ']\n'
+
+def ndjson_stream(query, serialize):
+    dumps = current_app.json.dumps
+    for chunk in iter_chunks(query):
+        yield ''.join(dumps(item) + '\n' for item in serialize(chunk))
+
+# Export order matters: importers resolve users and recipes before the rows
+# that reference them.
+EXPORT_COLLECTIONS = (
+    ('users', User, serializers.user_rows, serializers.serialize_users),
+    ('recipes', Recipe, serializers.recipe_rows, serializers.serialize_recipes),
+    ('meals', Meal, serializers.meal_rows, serializers.serialize_meals),
+    ('tasks', Task, serializers.task_rows, serializers.serialize_tasks),
+    ('grocery_items', GroceryItem, serializers.grocery_item_rows, serializers.serialize_grocery_items),
+    ('thoughts', Thought, serializers.thought_rows, serializers.serialize_thoughts),
+)
+
+def export_family(family_id):
+    """Yield the family as NDJSON: a header line, then one line per row."""
+    dumps = current_app.json.dumps
+    family = db.session.query(Family.name).filter(Family.id == family_id).scalar()
+    yield dumps({'type': 'export', 'format': EXPORT_FORMAT, 'family': family,
+                 'exported_at': datetime.datetime.utcnow().isoformat()}) + '\n'
+    for name, model, rows, serialize in EXPORT_COLLECTIONS:
+        query = rows().filter(model.family_id == family_id).order_by(model.id)
+        for chunk in iter_chunks(query):
+            yield ''.join(dumps({'type': name, 'data': item}) + '\n' for item in serialize(chunk))
+
+class InvalidImport(ValueError):
+    pass
+
+class FamilyImporter:
+    """Bulk-insert an NDJSON export into `family_id`, remapping ids.
+
+    Users are matched by username within the target family and fall back to
+    the importing user; no accounts or credentials are created. Rows are
+    buffered per table and written with executemany every CHUNK_SIZE rows,
+    all in the caller's transaction.
+    """
+
+    def __init__(self, family_id, user_id):
+        self.family_id = family_id
+        self.user_id = user_id
+        self.usernames = dict(db.session.query(User.username, User.id).filter(User.family_id == family_id))
+        self.user_map = {}
+        self.recipe_map = {}
+        self.catalog = {}
+        self.buffers = {Task: [], Meal: [], GroceryItem: [], Thought: [], RecipeIngredient: []}
+        self.counts = {name: 0 for name, _, _, _ in EXPORT_COLLECTIONS}
+
+    def feed(self, lines):
+        for number, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+                kind = record['type']
+                if kind == 'export':
+                    if record.get('format') != EXPORT_FORMAT:
+                        raise InvalidImport('Unsupported export format')
+                    continue
+                handler = getattr(self, '_import_' + kind)
+                handler(record['data'])
+            except InvalidImport as e:
+                raise InvalidImport('Line %d: %s' % (number, e))
+            except (ValueError, KeyError, TypeError, AttributeError):
+                raise InvalidImport('Line %d: invalid record' % number)
+            self.counts[kind] += 1
+        self.flush()
+        return self.counts
+
+    def flush(self):
+        for model, rows in self.buffers.items():
+            if rows:
+                db.session.execute(model.__table__.insert(), rows)
+                rows.clear()
+
+    def _buffer(self, model, row):
+        rows = self.buffers[model]
+        rows.append(row)
+        if len(rows) >= CHUNK_SIZE:
+            db.session.execute(model.__table__.insert(), rows)
+            rows.clear()
+
+    def _user(self, old_id):
+        if old_id is None:
+            return None
+        return self.user_map.get(old_id, self.user_id)
+
+    def _import_users(self, data):
+        self.user_map[data['id']] = self.usernames.get(data['username'], self.user_id)
+
+    def _import_recipes(self, data):
+        # Recipes are inserted one by one because meals need their new ids.
+        result = db.session.execute(Recipe.__table__.insert().values(
+            name=data['name'], instructions=data.get('instructions') or [], family_id=self.family_id))
+        self.recipe_map[data['id']] = result.inserted_primary_key[0]
+        recipe_ingredients = data.get('ingredients') or []
+        unknown = [ingredient['name'] for ingredient in recipe_ingredients
+                   if normalize_name(ingredient['name']) not in self.catalog]
+        if unknown:
+            self.catalog.update(ingredients.catalog_ids(self.family_id, unknown))
+        for position, ingredient in enumerate(recipe_ingredients):
+            self._buffer(RecipeIngredient, dict(ingredients.ingredient_values(ingredient, self.catalog),
+                                                recipe_id=self.recipe_map[data['id']], position=position))
+
+    def _import_meals(self, data):
+        self._buffer(Meal, {'name': data['name'], 'date': data.get('date'), 'meal_time': data.get('meal_time'),
+                            'recipe_id': self.recipe_map.get(data.get('recipe_id')), 'family_id': self.family_id})
+
+    def _import_tasks(self, data):
+        due_date = datetime.datetime.fromisoformat(data['due_date']) if data.get('due_date') else None
+        rule, rule_end = recurrence.normalize(data.get('recurrence'), due_date)
+        self._buffer(Task, {
+            'title': data['title'], 'description': data.get('description'), 'completed': bool(data.get('completed')),
+            'due_date': due_date, 'recurrence': rule, 'recurrence_end': rule_end,
+            'family_id': self.family_id, 'author_id': self._user(data.get('author_id')) or self.user_id,
+            'assigned_user_id': self._user(data.get('assigned_user_id'))})
+
+    def _import_grocery_items(self, data):
+        self._buffer(GroceryItem, {'name': data['name'], 'quantity': data.get('quantity'),
+                                   'category': data.get('category') or 'Other',
+                                   'is_completed': bool(data.get('is_completed')), 'family_id': self.family_id})
+
+    def _import_thoughts(self, data):
+        self._buffer(Thought, {'content': data['content'], 'user_id': self._user(data.get('user_id')) or self.user_id,
+                               'timestamp': datetime.datetime.fromisoformat(data['timestamp']),
+                               'family_id': self.family_id})
@@ -0,0 +1,70 @@
+import base64
+import datetime
+from sqlalchemy import event
+from database import db
+from models import Task, Meal, Recipe, GroceryItem, Thought, Tombstone
+
+# Collections returned by GET /api/sync, with the loader options their
+# to_dict needs so a delta never falls back to per-row lazy loads.
+SYNC_COLLECTIONS = {
+    'tasks': (Task, lambda: db.joinedload(Task.assigned_user)),
+    'meals': (Meal, None),
+    'recipes': (Recipe, lambda: db.selectinload(Recipe.ingredients)),
+    'grocery_items': (GroceryItem, None),
+    'thoughts': (Thought, lambda: db.joinedload(Thought.user)),
+}
+
+# Writers stamp updated_at before they commit, so a row can become visible
+# slightly after a sync that started later than its timestamp. Deltas are
+# re-read over this window; clients apply upserts idempotently by id.
+SYNC_OVERLAP = datetime.timedelta(seconds=5)
+
+def encode_sync_token(moment):
+    return base64.urlsafe_b64encode(moment.isoformat().encode()).decode().rstrip('=')
+
+def decode_sync_token(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        return datetime.datetime.fromisoformat(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, TypeError):
+        raise ValueError('Invalid sync token')
+
+def changes_since(family_id, since=None):
+    """Return (upserts, deletions) per collection changed after `since`.
+
+    With no `since` every live row is returned and there are no deletions.
+    """
+    upserts, deletions = {}, {}
+    window_start = since - SYNC_OVERLAP if since else None
+    for name, (model, loader) in SYNC_COLLECTIONS.items():
+        query = model.query.filter_by(family_id=family_id)
+        if loader:
+            query = query.options(loader())
+        if window_start:
+            query = query.filter(model.updated_at > window_start)
+        upserts[name] = [row.to_dict() for row in query.order_by(model.id).all()]
+        deletions[name] = []
+
+    if window_start:
+        tombstones = db.session.query(Tombstone.collection, Tombstone.record_id).filter(
+            Tombstone.family_id == family_id, Tombstone.deleted_at > window_start)
+        for collection, record_id in tombstones:
+            deletions[collection].append(record_id)
+    return upserts, deletions
+
+def _record_tombstone(mapper, connection, target):
+    connection.execute(Tombstone.__table__.insert().values(
+        family_id=target.family_id,
+        collection=target.__tablename__,
+        record_id=target.id,
+        deleted_at=datetime.datetime.utcnow()))
+
+def record_tombstones(family_id, collection, record_ids):
+    """Tombstones for rows removed by set-based deletes, which skip after_delete."""
+    deleted_at = datetime.datetime.utcnow()
+    db.session.execute(Tombstone.__table__.insert(), [
+        {'family_id': family_id, 'collection': collection, 'record_id': record_id, 'deleted_at': deleted_at}
+        for record_id in record_ids])
+
+for _model, _ in SYNC_COLLECTIONS.values():
+    event.listen(_model, 'after_delete', _record_tombstone)
@@ -0,0 +1,69 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from auth import principal_cache  # noqa: E402
+from database import db  # noqa: E402
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+
+@pytest.fixture
+def make_app(tmp_path, monkeypatch):
+    """Build an app on a fresh SQLite file; extra env vars are applied first.
+
+    Tables come from db.create_all(), or from the migrations with
+    migrated=True, which is what creates the FTS search index.
+    """
+    apps = []
+
+    def make(migrated=False, **env):
+        monkeypatch.setenv('DATABASE_URL', 'sqlite:///%s' % (tmp_path / ('app%d.db' % len(apps))))
+        monkeypatch.setenv('RATELIMIT_ENABLED', '0')
+        monkeypatch.setenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+        monkeypatch.setenv('PROFILE_DIR', str(tmp_path / 'profiles'))
+        for key, value in env.items():
+            monkeypatch.setenv(key, value)
+        app = create_app()
+        app.config['TESTING'] = True
+        principal_cache.clear()  # user ids repeat across test databases
+        with app.app_context():
+            if migrated:
+                import flask_migrate
+                flask_migrate.upgrade(directory=MIGRATIONS)
+            else:
+                db.create_all()
+        apps.append(app)
+        return app
+
+    yield make
+    for app in apps:
+        with app.app_context():
+            db.session.remove()
+            db.get_engine(app).dispose()
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def register(client):
+    """Register a user (and their family) and return Authorization headers."""
+    def register(username, family_name='Family'):
+        response = client.post('/api/register', json={
+            'family_name': family_name, 'username': username, 'password': 'secret', 'email': username + '@example.com'})
+        assert response.status_code == 201, response.json
+        token = client.post('/api/login', json={'username': username, 'password': 'secret'}).json['token']
+        return {'Authorization': 'Bearer ' + token}
+    return register
@@ -0,0 +1,95 @@
+"""Set-based deletes keep tombstones, collection versions and the search
+index in step with the rows they remove."""
+import datetime
+
+import pytest
+
+import archive
+from database import db
+from models import Task, TaskOccurrence, GroceryItem, Tombstone, ArchivedRecord
+from search import KINDS, ROWID_FACTOR
+from versions import get_version
+
+
+@pytest.fixture
+def app(make_app):
+    # Migrations create the FTS search index and its triggers.
+    return make_app(migrated=True)
+
+
+@pytest.fixture
+def headers(register):
+    return register('alice')
+
+
+def _indexed(collection, record_id):
+    rowid = record_id * ROWID_FACTOR + KINDS[collection]
+    return db.session.execute(db.text('SELECT count(*) FROM search_index WHERE rowid = :rowid'),
+                              {'rowid': rowid}).scalar() == 1
+
+
+def _tombstoned(collection):
+    return sorted(row.record_id for row in Tombstone.query.filter_by(collection=collection))
+
+
+@pytest.mark.parametrize('collection, name_field, done_field', [
+    ('tasks', 'title', 'completed'),
+    ('grocery_items', 'name', 'is_completed'),
+])
+def test_clearing_completed_rows(app, client, headers, collection, name_field, done_field):
+    done = client.post('/api/%s' % collection, headers=headers, json={name_field: 'done', done_field: True}).json['id']
+    open_ = client.post('/api/%s' % collection, headers=headers, json={name_field: 'open'}).json['id']
+    with app.app_context():
+        assert _indexed(collection, done) and _indexed(collection, open_)
+        version = get_version(1, collection)
+
+    response = client.delete('/api/%s/completed' % collection, headers=headers)
+    assert response.json == {'deleted': 1}
+
+    with app.app_context():
+        assert _tombstoned(collection) == [done]
+        assert get_version(1, collection) == version + 1
+        assert not _indexed(collection, done)
+        assert _indexed(collection, open_)
+    assert [item['id'] for item in client.get('/api/%s' % collection, headers=headers).json] == [open_]
+
+
+def test_archiving_expired_rows(app, client, headers):
+    task = client.post('/api/tasks', headers=headers, json={'title': 'done', 'completed': True}).json['id']
+    item = client.post('/api/grocery_items', headers=headers, json={'name': 'milk', 'is_completed': True}).json['id']
+    kept = client.post('/api/tasks', headers=headers, json={'title': 'open'}).json['id']
+    with app.app_context():
+        versions = get_version(1, 'tasks'), get_version(1, 'grocery_items')
+        assert archive.archive_expired(datetime.datetime.utcnow() + datetime.timedelta(days=100)) == 2
+
+        assert (_tombstoned('tasks'), _tombstoned('grocery_items')) == ([task], [item])
+        assert (get_version(1, 'tasks'), get_version(1, 'grocery_items')) == (versions[0] + 1, versions[1] + 1)
+        assert not _indexed('tasks', task) and not _indexed('grocery_items', item)
+        assert _indexed('tasks', kept)
+        assert sorted((row.collection, row.record_id) for row in ArchivedRecord.query) == [
+            ('grocery_items', item), ('tasks', task)]
+
+
+def test_rows_that_stopped_matching_are_not_deleted(app, client, headers):
+    due = '2025-01-06T10:00:00'
+    reopened = client.post('/api/tasks', headers=headers, json={
+        'title': 'reopened', 'due_date': due, 'recurrence': 'FREQ=DAILY'}).json['id']
+    done = client.post('/api/tasks', headers=headers, json={
+        'title': 'done', 'completed': True, 'due_date': due, 'recurrence': 'FREQ=DAILY'}).json['id']
+    for task_id in (reopened, done):
+        assert client.put('/api/tasks/%d/occurrences/%s' % (task_id, due), headers=headers,
+                          json={'completed': True}).status_code == 200
+    with app.app_context():
+        version = get_version(1, 'tasks')
+        # `reopened` was read as completed, then reopened before the delete.
+        assert archive.delete_rows(Task, 1, [reopened, done], Task.completed.is_(True)) == [done]
+        db.session.commit()
+
+        assert [task.id for task in Task.query] == [reopened]
+        assert [row.task_id for row in TaskOccurrence.query] == [reopened]
+        assert _tombstoned('tasks') == [done]
+        assert get_version(1, 'tasks') == version + 1
+
+        assert archive.delete_rows(GroceryItem, 1, [reopened], GroceryItem.is_completed.is_(True)) == []
+        db.session.commit()
+        assert get_version(1, 'grocery_items') == 0
@@ -0,0 +1,43 @@
+import auth
+from auth import load_principal, principal_cache
+from models import User
+
+
+def _user_id(client, headers, username):
+    return next(user['id'] for user in client.get('/api/family/users', headers=headers).json
+                if user['username'] == username)
+
+
+def test_accepting_a_user_takes_effect_immediately(client, register):
+    alice = register('alice')
+    bob = register('bob')
+    assert client.post('/api/tasks', headers=bob, json={'title': 'x'}).status_code == 403
+
+    bob_id = _user_id(client, alice, 'bob')
+    assert client.put('/api/family/users/%d/accept' % bob_id, headers=alice).status_code == 200
+    assert client.post('/api/tasks', headers=bob, json={'title': 'x'}).status_code == 201
+
+
+def test_a_load_racing_a_commit_is_not_cached(app, client, register, monkeypatch):
+    alice = register('alice')
+    register('bob')
+    bob_id = _user_id(client, alice, 'bob')
+    principal_cache.clear()
+
+    class RacingUser:
+        class query:
+            @staticmethod
+            def get(user_id):
+                user = User.query.get(user_id)
+                # The accept commits after the row was read, before it's cached.
+                auth.invalidate_principal(user_id)
+                return user
+
+    with app.app_context():
+        monkeypatch.setattr(auth, 'User', RacingUser)
+        assert load_principal(bob_id).is_accepted is False
+        assert principal_cache.get(bob_id) is None
+
+        monkeypatch.setattr(auth, 'User', User)
+        assert load_principal(bob_id).is_accepted is False
+        assert principal_cache.get(bob_id) is not None
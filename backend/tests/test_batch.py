@@ -0,0 +1,82 @@
+import pytest
+
+
+def _batch(client, headers, operations, collection='tasks'):
+    return client.post('/api/%s/batch' % collection, headers=headers, json={'operations': operations})
+
+
+def test_rejected_update_keeps_earlier_updates_to_the_same_row(client, register):
+    headers = register('alice')
+    task = client.post('/api/tasks', headers=headers, json={'title': 'r'}).json
+
+    response = _batch(client, headers, [
+        {'op': 'update', 'id': task['id'], 'data': {'title': 'new'}},
+        {'op': 'update', 'id': task['id'], 'data': {'due_date': 'garbage'}},
+    ])
+    assert response.status_code == 200
+    assert [result['status'] for result in response.json['results']] == [200, 400]
+    assert response.json['results'][0]['item']['title'] == 'new'
+    assert client.get('/api/tasks', headers=headers).json[0]['title'] == 'new'
+
+
+def test_rejected_recurrence_leaves_the_task_untouched(client, register):
+    headers = register('alice')
+    task = client.post('/api/tasks', headers=headers, json={'title': 'r'}).json
+
+    response = _batch(client, headers, [
+        {'op': 'update', 'id': task['id'], 'data': {'title': 'new', 'due_date': '2025-01-01T10:00:00', 'recurrence': 'bogus'}},
+    ])
+    assert response.json['results'][0]['status'] == 400
+    listed = client.get('/api/tasks', headers=headers).json[0]
+    assert (listed['title'], listed['due_date']) == ('r', None)
+
+
+def test_body_must_be_an_object(client, register):
+    headers = register('alice')
+    response = client.post('/api/tasks/batch', headers=headers, json=[{'op': 'create', 'data': {'title': 'x'}}])
+    assert response.status_code == 400
+
+
+def test_malformed_operations_are_rejected_in_their_slot(client, register):
+    headers = register('alice')
+    task = client.post('/api/tasks', headers=headers, json={'title': 'r'}).json
+
+    response = _batch(client, headers, [
+        {'op': 'update', 'id': [task['id']], 'data': {'title': 'x'}},
+        {'op': 'delete', 'id': {'id': task['id']}},
+        {'op': 'update', 'id': task['id'], 'data': ['title', 'x']},
+        {'op': 'create', 'data': 'x'},
+        'create',
+        {'op': 'create', 'data': {'name': 'milk'}},
+    ], collection='grocery_items')
+    assert response.status_code == 200
+    assert [result['status'] for result in response.json['results']] == [400, 400, 400, 400, 400, 201]
+
+
+@pytest.mark.parametrize('collection, field, bad', [
+    ('tasks', 'completed', 'yes'),
+    ('tasks', 'title', None),
+    ('tasks', 'description', 5),
+    ('tasks', 'due_date', 20250101),
+    ('tasks', 'assigned_user_id', True),
+    ('grocery_items', 'is_completed', 'yes'),
+    ('grocery_items', 'is_completed', None),
+    ('grocery_items', 'name', ['milk']),
+    ('grocery_items', 'category', None),
+])
+def test_badly_typed_values_fail_only_their_operation(client, register, collection, field, bad):
+    headers = register('alice')
+    name_field = 'title' if collection == 'tasks' else 'name'
+    row = client.post('/api/%s' % collection, headers=headers, json={name_field: 'r'}).json
+
+    response = _batch(client, headers, [
+        {'op': 'update', 'id': row['id'], 'data': {field: bad}},
+        {'op': 'create', 'data': {name_field: 'x', field: bad}},
+        {'op': 'update', 'id': row['id'], 'data': {name_field: 'renamed'}},
+    ], collection=collection)
+    assert response.status_code == 200
+    assert [result['status'] for result in response.json['results']] == [400, 400, 200]
+    assert [item[name_field] for item in client.get('/api/%s' % collection, headers=headers).json] == ['renamed']
+
+    assert client.post('/api/%s' % collection, headers=headers, json={name_field: 'y', field: bad}).status_code == 400
+    assert client.put('/api/%s/%d' % (collection, row['id']), headers=headers, json={field: bad}).status_code == 400
@@ -0,0 +1,82 @@
+import shutil
+
+from database import db, normalize_database_url, REPLICA_BIND
+from models import Task
+
+
+def test_normalize_database_url_rewrites_the_postgres_scheme():
+    assert normalize_database_url('postgres://u:p@host:5432/db') == 'postgresql://u:p@host:5432/db'
+    assert normalize_database_url('postgresql://u:p@host:5432/db') == 'postgresql://u:p@host:5432/db'
+    assert normalize_database_url('postgresql+psycopg2://host/db') == 'postgresql+psycopg2://host/db'
+    assert normalize_database_url('sqlite:////data/app/database.db') == 'sqlite:////data/app/database.db'
+
+
+def _replicated_app(make_app, tmp_path):
+    app = make_app(DATABASE_READ_URL='sqlite:///%s' % (tmp_path / 'replica.db'))
+    assert app.config['SQLALCHEMY_BINDS'] == {REPLICA_BIND: 'sqlite:///%s' % (tmp_path / 'replica.db')}
+    return app
+
+
+def _engines(app):
+    return db.get_engine(app), db.get_engine(app, bind=REPLICA_BIND)
+
+
+def test_get_requests_read_from_the_replica(make_app, tmp_path):
+    app = _replicated_app(make_app, tmp_path)
+    primary, replica = _engines(app)
+    for method in ('GET', 'HEAD', 'OPTIONS'):
+        with app.test_request_context(method=method):
+            assert db.session().get_bind() is replica
+            assert db.session().get_bind(Task.__mapper__) is replica
+        db.session.remove()
+
+
+def test_everything_else_uses_the_primary(make_app, tmp_path):
+    app = _replicated_app(make_app, tmp_path)
+    primary, replica = _engines(app)
+    for method in ('POST', 'PUT', 'PATCH', 'DELETE'):
+        with app.test_request_context(method=method):
+            assert db.session().get_bind(Task.__mapper__) is primary
+        db.session.remove()
+    with app.app_context():
+        assert db.session().get_bind(Task.__mapper__) is primary
+        db.session.remove()
+
+
+def test_flushes_during_get_requests_go_to_the_primary(make_app, tmp_path):
+    app = _replicated_app(make_app, tmp_path)
+    primary, replica = _engines(app)
+    with app.test_request_context(method='GET'):
+        db.session()._flushing = True
+        try:
+            assert db.session().get_bind(Task.__mapper__) is primary
+        finally:
+            db.session()._flushing = False
+        db.session.remove()
+
+
+def test_without_a_replica_everything_uses_the_primary(app):
+    with app.test_request_context(method='GET'):
+        assert db.session().get_bind(Task.__mapper__) is db.get_engine(app)
+        db.session.remove()
+
+
+def test_requests_are_routed_end_to_end(make_app, tmp_path):
+    app = _replicated_app(make_app, tmp_path)
+    client = app.test_client()
+    response = client.post('/api/register', json={
+        'family_name': 'Family', 'username': 'alice', 'password': 'secret', 'email': 'alice@example.com'})
+    assert response.status_code == 201
+    headers = {'Authorization': 'Bearer ' + client.post(
+        '/api/login', json={'username': 'alice', 'password': 'secret'}).json['token']}
+
+    # The replica starts as a copy of the primary, then stops following it.
+    primary, replica = _engines(app)
+    primary.dispose()
+    replica.dispose()
+    shutil.copyfile(primary.url.database, replica.url.database)
+
+    assert client.post('/api/tasks', headers=headers, json={'title': 'written'}).status_code == 201
+    assert client.get('/api/tasks', headers=headers).json == []
+    with app.app_context():
+        assert [task.title for task in Task.query] == ['written']
@@ -0,0 +1,124 @@
+import pytest
+
+
+def _add_recipe(client, headers, name, ingredients):
+    response = client.post('/api/recipes', headers=headers, json={
+        'name': name, 'ingredients': [{'name': ingredient, 'quantity': '1'} for ingredient in ingredients]})
+    assert response.status_code == 201
+    return response.json['id']
+
+
+def test_cookable_counts_items_not_checked_off(client, register):
+    headers = register('alice')
+    pancakes = _add_recipe(client, headers, 'pancakes', ['Flour', 'egg'])
+    _add_recipe(client, headers, 'omelette', ['egg', 'cheese'])
+    client.post('/api/grocery_items', headers=headers, json={'name': 'flour'})
+    client.post('/api/grocery_items', headers=headers, json={'name': 'Egg', 'is_completed': True})
+
+    assert client.get('/api/recipes/cookable', headers=headers).json == []
+    cookable = client.get('/api/recipes/cookable?max_missing=1', headers=headers).json
+    assert [(recipe['id'], recipe['missing']) for recipe in cookable] == [(pancakes, ['egg'])]
+
+    checked = client.get('/api/recipes/cookable?max_missing=1&is_completed=true', headers=headers).json
+    assert sorted(recipe['name'] for recipe in checked) == ['omelette', 'pancakes']
+    assert client.get('/api/recipes/cookable?is_completed=maybe', headers=headers).status_code == 400
+
+
+def _recipe(client, headers, recipe_id):
+    return [(ingredient['id'], ingredient['name'], ingredient['quantity'])
+            for ingredient in client.get('/api/recipes/%d' % recipe_id, headers=headers).json['ingredients']]
+
+
+def _setup(client, register):
+    headers = register('alice')
+    recipe_id = client.post('/api/recipes', headers=headers, json={'name': 'bread', 'ingredients': [
+        {'name': 'flour', 'quantity': '500 g'}, {'name': 'water', 'quantity': '300 ml'}, {'name': 'salt', 'quantity': '1 tsp'},
+    ]}).json['id']
+    return headers, recipe_id, [ingredient[0] for ingredient in _recipe(client, headers, recipe_id)]
+
+
+def _put(client, headers, recipe_id, items):
+    return client.put('/api/recipes/%d' % recipe_id, headers=headers, json={'ingredients': items})
+
+
+def _patch(client, headers, recipe_id, body):
+    return client.patch('/api/recipes/%d/ingredients' % recipe_id, headers=headers, json=body)
+
+
+def test_put_matches_by_id_and_replaces_every_field(client, register):
+    headers, recipe_id, (flour, water, salt) = _setup(client, register)
+    response = _put(client, headers, recipe_id, [
+        {'id': flour, 'name': 'rye flour', 'quantity': '450 g'}, {'id': water, 'name': 'water'}])
+    assert response.status_code == 200
+    assert _recipe(client, headers, recipe_id) == [(flour, 'rye flour', '450 g'), (water, 'water', None)]
+    assert response.json['ingredients'][1]['amount'] is None
+
+
+def test_put_matches_by_name_then_adds(client, register):
+    headers, recipe_id, (flour, water, salt) = _setup(client, register)
+    assert _put(client, headers, recipe_id, [
+        {'name': 'Salt ', 'quantity': '2 tsp'}, {'name': 'yeast', 'quantity': '7 g'}, {'name': 'FLOUR', 'quantity': '500 g'},
+    ]).status_code == 200
+    ingredients = _recipe(client, headers, recipe_id)
+    assert [ingredient[1:] for ingredient in ingredients] == [('Salt ', '2 tsp'), ('yeast', '7 g'), ('FLOUR', '500 g')]
+    assert (ingredients[0][0], ingredients[2][0]) == (salt, flour)
+    assert ingredients[1][0] not in (flour, water, salt)
+
+
+def test_put_keeps_the_listed_order(client, register):
+    headers, recipe_id, (flour, water, salt) = _setup(client, register)
+    items = [{'id': salt, 'name': 'salt', 'quantity': '1 tsp'}, {'id': flour, 'name': 'flour', 'quantity': '500 g'},
+             {'id': water, 'name': 'water', 'quantity': '300 ml'}]
+    assert _put(client, headers, recipe_id, items).status_code == 200
+    assert [ingredient[0] for ingredient in _recipe(client, headers, recipe_id)] == [salt, flour, water]
+    listed = client.get('/api/recipes', headers=headers).json[0]['ingredients']
+    assert [ingredient['id'] for ingredient in listed] == [salt, flour, water]
+
+
+def test_repeated_names_each_claim_their_own_row(client, register):
+    headers = register('alice')
+    recipe_id = client.post('/api/recipes', headers=headers, json={'name': 'two eggs', 'ingredients': [
+        {'name': 'egg', 'quantity': 'for the dough'}, {'name': 'egg', 'quantity': 'for the wash'}]}).json['id']
+    ids = [ingredient[0] for ingredient in _recipe(client, headers, recipe_id)]
+    assert _put(client, headers, recipe_id, [{'name': 'egg', 'quantity': '1'}, {'name': 'egg', 'quantity': '2'}]).status_code == 200
+    assert _recipe(client, headers, recipe_id) == [(ids[0], 'egg', '1'), (ids[1], 'egg', '2')]
+
+
+def test_patch_keeps_omitted_fields_and_appends(client, register):
+    headers, recipe_id, (flour, water, salt) = _setup(client, register)
+    response = _patch(client, headers, recipe_id, {
+        'ingredients': [{'name': 'yeast', 'quantity': '7 g'}, {'id': water, 'quantity': '320 ml'}], 'delete': [salt]})
+    assert response.status_code == 200
+    ingredients = _recipe(client, headers, recipe_id)
+    assert ingredients[:2] == [(flour, 'flour', '500 g'), (water, 'water', '320 ml')]
+    assert ingredients[2][1:] == ('yeast', '7 g')
+
+
+@pytest.mark.parametrize('items', [
+    lambda ids: [{'id': ids[0], 'name': 'a'}, {'id': ids[0], 'name': 'b'}],  # duplicate id
+    lambda ids: [{'id': 999999, 'name': 'a'}],  # unknown id
+    lambda ids: [{'id': ids[0]}],  # a replacement needs every name
+    lambda ids: [{'name': ''}],
+    lambda ids: [{'name': 'a', 'quantity': 3}],
+    lambda ids: {'name': 'a'},
+])
+def test_put_rejects_invalid_lists(client, register, items):
+    headers, recipe_id, ids = _setup(client, register)
+    before = _recipe(client, headers, recipe_id)
+    assert _put(client, headers, recipe_id, items(ids)).status_code == 400
+    assert _recipe(client, headers, recipe_id) == before
+
+
+@pytest.mark.parametrize('body', [
+    lambda ids: {'ingredients': [{'id': ids[0], 'quantity': '1'}, {'id': ids[0], 'quantity': '2'}]},
+    lambda ids: {'ingredients': [{'id': ids[0], 'quantity': '1'}], 'delete': [ids[0]]},  # edit and delete
+    lambda ids: {'delete': [999999]},
+    lambda ids: {'delete': ids[0]},
+    lambda ids: {'ingredients': [{'quantity': '1'}]},  # neither id nor name
+    lambda ids: [{'name': 'yeast'}],
+])
+def test_patch_rejects_invalid_edits(client, register, body):
+    headers, recipe_id, ids = _setup(client, register)
+    before = _recipe(client, headers, recipe_id)
+    assert _patch(client, headers, recipe_id, body(ids)).status_code == 400
+    assert _recipe(client, headers, recipe_id) == before
@@ -0,0 +1,157 @@
+import datetime
+
+import pytest
+
+import jobs
+from database import db
+from jobs import Cron
+from models import Job
+
+calls = []
+
+
+@jobs.job('test_record')
+def _record(value):
+    calls.append(value)
+
+
+@jobs.job('test_fail', max_attempts=3, backoff=10)
+def _fail():
+    raise RuntimeError('boom')
+
+
+@jobs.periodic('0 * * * *', name='test_hourly')
+def _hourly():
+    calls.append('hourly')
+
+
+@pytest.fixture(autouse=True)
+def _reset_calls():
+    del calls[:]
+
+
+def test_eager_jobs_run_before_the_response(make_app):
+    app = make_app(JOBS_EAGER='1')
+
+    @app.route('/test-enqueue', methods=['POST'])
+    def _enqueue_view():
+        jobs.enqueue('test_record', {'value': 'eager'})
+        db.session.commit()
+        return 'ok'
+
+    assert app.test_client().post('/test-enqueue').status_code == 200
+    assert calls == ['eager']
+    with app.app_context():
+        assert [(row.status, row.attempts) for row in Job.query] == [('done', 1)]
+
+
+def test_enqueued_jobs_wait_for_run_pending(app):
+    with app.app_context():
+        jobs.enqueue('test_record', {'value': 'later'})
+        db.session.commit()
+        jobs.enqueue('test_record', {'value': 'rolled back'})
+        db.session.rollback()
+        assert calls == []
+        assert jobs.run_pending() == 1
+        assert calls == ['later']
+        assert jobs.run_pending() == 0
+
+
+def test_failing_jobs_back_off_then_fail(app):
+    with app.app_context():
+        row = jobs.enqueue('test_fail')
+        db.session.commit()
+        job_id = row.id
+        later = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+        for attempt, backoff in ((1, 10), (2, 20)):
+            before = datetime.datetime.utcnow()
+            assert jobs.run_pending(now=later, limit=1) == 1
+            row = db.session.get(Job, job_id)
+            assert (row.status, row.attempts) == ('pending', attempt)
+            assert before + datetime.timedelta(seconds=backoff) <= row.run_at
+            assert row.run_at <= datetime.datetime.utcnow() + datetime.timedelta(seconds=backoff)
+            # Not due again until the backoff has passed.
+            assert jobs.run_pending(now=before) == 0
+
+        assert jobs.run_pending(now=later) == 1
+        row = db.session.get(Job, job_id)
+        assert (row.status, row.attempts, row.last_error) == ('failed', 3, 'RuntimeError: boom')
+        assert row.finished_at is not None
+        assert jobs.run_pending(now=later) == 0
+
+
+def test_stale_running_jobs_are_claimed_again(app):
+    now = datetime.datetime(2025, 1, 1, 12, 0)
+    timeout = datetime.timedelta(seconds=app.config['JOBS_LOCK_TIMEOUT'])
+    with app.app_context():
+        stale = jobs.enqueue('test_record', {'value': 'stale'})
+        live = jobs.enqueue('test_record', {'value': 'live'})
+        for row, locked_at in ((stale, now - timeout - datetime.timedelta(seconds=1)), (live, now - timeout / 2)):
+            row.status, row.attempts, row.locked_at = 'running', 1, locked_at
+        db.session.commit()
+        stale_id, live_id = stale.id, live.id
+
+        jobs.enqueue_scheduled(now)
+        assert (db.session.get(Job, stale_id).status, db.session.get(Job, live_id).status) == ('pending', 'running')
+        assert jobs.run_pending(now=now) == 1
+        assert calls == ['stale']
+        assert (db.session.get(Job, stale_id).status, db.session.get(Job, stale_id).attempts) == ('done', 2)
+
+
+def test_scheduled_slots_are_enqueued_once(app):
+    start = datetime.datetime(2025, 1, 1, 11, 40)
+    with app.app_context():
+        def hourly_jobs():
+            return Job.query.filter(Job.name == 'test_hourly').count()
+
+        jobs.enqueue_scheduled(start)
+        assert hourly_jobs() == 0
+        for minute in (0, 0, 10, 59):
+            jobs.enqueue_scheduled(datetime.datetime(2025, 1, 1, 12, minute))
+        assert hourly_jobs() == 1
+        jobs.enqueue_scheduled(datetime.datetime(2025, 1, 1, 13, 0))
+        assert hourly_jobs() == 2
+
+        jobs.run_pending(now=datetime.datetime.utcnow())
+        assert calls == ['hourly', 'hourly']
+
+
+def test_changing_a_schedule_does_not_fire_it(app, monkeypatch):
+    with app.app_context():
+        jobs.enqueue_scheduled(datetime.datetime(2025, 1, 1, 11, 40))
+        monkeypatch.setitem(jobs._schedules, 'test_hourly', Cron('30 * * * *'))
+        jobs.enqueue_scheduled(datetime.datetime(2025, 1, 1, 12, 5))
+        assert Job.query.filter(Job.name == 'test_hourly').count() == 0
+        jobs.enqueue_scheduled(datetime.datetime(2025, 1, 1, 12, 30))
+        assert Job.query.filter(Job.name == 'test_hourly').count() == 1
+
+
+@pytest.mark.parametrize('expression, moment, expected', [
+    # Month boundaries.
+    ('0 0 1 * *', datetime.datetime(2025, 1, 31, 23, 59), datetime.datetime(2025, 2, 1, 0, 0)),
+    ('0 0 1 * *', datetime.datetime(2025, 2, 1, 0, 0), datetime.datetime(2025, 3, 1, 0, 0)),
+    ('0 9 31 * *', datetime.datetime(2025, 4, 1, 0, 0), datetime.datetime(2025, 5, 31, 9, 0)),
+    ('0 12 29 2 *', datetime.datetime(2025, 3, 1, 0, 0), datetime.datetime(2028, 2, 29, 12, 0)),
+    # Day and year boundaries.
+    ('30 23 * * *', datetime.datetime(2025, 3, 10, 23, 45), datetime.datetime(2025, 3, 11, 23, 30)),
+    ('*/15 * * * *', datetime.datetime(2025, 12, 31, 23, 50), datetime.datetime(2026, 1, 1, 0, 0)),
+    ('0 8 * * 1', datetime.datetime(2025, 1, 31, 9, 0), datetime.datetime(2025, 2, 3, 8, 0)),
+    ('0 3 * * 7', datetime.datetime(2025, 6, 28, 4, 0), datetime.datetime(2025, 6, 29, 3, 0)),
+    # Restricted day-of-month and day-of-week match either.
+    ('0 0 13 * 5', datetime.datetime(2025, 6, 1, 0, 0), datetime.datetime(2025, 6, 6, 0, 0)),
+    # Seconds are dropped and the result is strictly later.
+    ('* * * * *', datetime.datetime(2025, 1, 1, 0, 0, 30), datetime.datetime(2025, 1, 1, 0, 1)),
+])
+def test_cron_next_after(expression, moment, expected):
+    assert Cron(expression).next_after(moment) == expected
+
+
+@pytest.mark.parametrize('expression', ['* * * *', '60 * * * *', '0 0 32 * *', '5-1 * * * *', '*/0 * * * *'])
+def test_invalid_cron_expressions(expression):
+    with pytest.raises(ValueError):
+        Cron(expression)
+
+
+def test_cron_that_never_matches():
+    with pytest.raises(ValueError):
+        Cron('0 0 31 2 *').next_after(datetime.datetime(2025, 1, 1))
@@ -0,0 +1,68 @@
+from database import db
+from models import Meal
+from quantities import QuantityTotal
+
+
+def _recipe(client, headers, name, ingredients):
+    response = client.post('/api/recipes', headers=headers, json={
+        'name': name, 'ingredients': [{'name': n, 'quantity': q} for n, q in ingredients]})
+    assert response.status_code == 201
+    return response.json['id']
+
+
+def _meal(client, headers, recipe_id, date='2025-01-06'):
+    return client.post('/api/meals', headers=headers, json={'name': 'dinner', 'date': date, 'recipe_id': recipe_id})
+
+
+def _from_meals(client, headers):
+    response = client.post('/api/grocery_items/from_meals?from=2025-01-01&to=2025-01-31', headers=headers)
+    assert response.status_code in (200, 201), response.json
+    return {item['name']: item['quantity'] for item in client.get('/api/grocery_items', headers=headers).json}
+
+
+def test_meals_only_use_the_familys_own_recipes(app, client, register):
+    alice = register('alice', 'A')
+    bob = register('bob', 'B')
+    secret = _recipe(client, alice, 'secret', [('unicorn meat', '2 kg')])
+    own = _recipe(client, bob, 'soup', [('carrot', '3')])
+
+    assert _meal(client, bob, secret).status_code == 400
+    assert _meal(client, bob, 'x').status_code == 400
+    meal = _meal(client, bob, own).json
+    assert client.put('/api/meals/%d' % meal['id'], headers=bob, json={'recipe_id': secret}).status_code == 400
+    assert client.put('/api/meals/%d' % meal['id'], headers=bob, json={'recipe_id': None}).status_code == 200
+    assert client.put('/api/meals/%d' % meal['id'], headers=bob, json={'recipe_id': own}).status_code == 200
+
+    # A meal row pointing elsewhere, e.g. from before the check, is ignored.
+    with app.app_context():
+        db.session.add(Meal(name='leak', date='2025-01-07', recipe_id=secret, family_id=meal['family_id']))
+        db.session.commit()
+    assert _from_meals(client, bob) == {'carrot': '3'}
+
+
+def test_from_meals_is_additive(client, register):
+    headers = register('alice')
+    _meal(client, headers, _recipe(client, headers, 'stew', [('beef', '2 kg')]))
+    assert _from_meals(client, headers) == {'beef': '2 kg'}
+    assert _from_meals(client, headers) == {'beef': '4 kg'}
+
+
+def test_long_totals_fit_the_quantity_column(client, register):
+    headers = register('alice')
+    quantities = ['1 tsp', '2 tbsp', '1 cup', '3 g', 'a pinch', 'to taste', 'some', 'a little more']
+    for i, quantity in enumerate(quantities):
+        _meal(client, headers, _recipe(client, headers, 'r%d' % i, [('salt', quantity)]))
+    quantity = _from_meals(client, headers)['salt']
+    assert len(quantity) <= 50
+    assert quantity.endswith(' + …')
+
+
+def test_quantity_total_format_drops_whole_parts():
+    total = QuantityTotal()
+    for text in ('1 tsp', '2 tbsp', 'a pinch', 'to taste'):
+        total.add(text)
+    assert total.format() == '1 tsp + 2 tbsp + a pinch + to taste'
+    assert total.format(40) == total.format()
+    assert total.format(28) == '1 tsp + 2 tbsp + a pinch + …'
+    assert total.format(27) == '1 tsp + 2 tbsp + …'
+    assert total.format(3) == '…'
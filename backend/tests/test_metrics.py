@@ -0,0 +1,19 @@
+import pytest
+
+
+def test_without_a_token_only_loopback_clients_may_scrape(client):
+    assert client.get('/metrics').status_code == 200
+    assert client.get('/metrics', environ_base={'REMOTE_ADDR': '::1'}).status_code == 200
+    assert client.get('/metrics', environ_base={'REMOTE_ADDR': '10.0.0.5'}).status_code == 403
+    assert client.get('/metrics', environ_base={'REMOTE_ADDR': '2001:db8::1'}).status_code == 403
+
+
+@pytest.mark.parametrize('remote_addr', ['127.0.0.1', '10.0.0.5'])
+def test_a_configured_token_is_required_from_everywhere(make_app, remote_addr):
+    client = make_app(METRICS_TOKEN='s3cret').test_client()
+    environ = {'REMOTE_ADDR': remote_addr}
+    assert client.get('/metrics', environ_base=environ).status_code == 401
+    assert client.get('/metrics', environ_base=environ, headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    response = client.get('/metrics', environ_base=environ, headers={'Authorization': 'Bearer s3cret'})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
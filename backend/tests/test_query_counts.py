@@ -0,0 +1,54 @@
+"""The list endpoints load related rows in bulk, so the number of SQL
+statements per request doesn't depend on how many rows are listed."""
+import pytest
+from sqlalchemy import event
+from database import db
+
+
+@pytest.fixture
+def app(make_app):
+    # Cached responses would skip the queries being counted.
+    return make_app(COLLECTION_CACHE_ENABLED='0')
+
+
+def _add_rows(client, headers, user_id, count):
+    for i in range(count):
+        assert client.post('/api/tasks', headers=headers, json={
+            'title': 'task %d' % i, 'assigned_user_id': user_id}).status_code == 201
+        assert client.post('/api/thoughts', headers=headers, json={'content': 'thought %d' % i}).status_code == 201
+        assert client.post('/api/recipes', headers=headers, json={
+            'name': 'recipe %d' % i,
+            'ingredients': [{'name': 'flour', 'quantity': '200 g'}, {'name': 'egg %d' % i, 'quantity': '2'}],
+        }).status_code == 201
+
+
+def _statement_count(app, client, headers, url):
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.get_engine(app)
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        response = client.get(url, headers=headers)
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+    assert response.status_code == 200
+    return len(statements), len(response.json)
+
+
+@pytest.mark.parametrize('url', ['/api/tasks', '/api/thoughts', '/api/recipes'])
+def test_list_statement_count_is_independent_of_row_count(app, client, register, url):
+    headers = register('alice')
+    user_id = client.get('/api/family/users', headers=headers).json[0]['id']
+
+    _add_rows(client, headers, user_id, 2)
+    client.get(url, headers=headers)  # warm the auth cache
+    few, few_rows = _statement_count(app, client, headers, url)
+    _add_rows(client, headers, user_id, 8)
+    many, many_rows = _statement_count(app, client, headers, url)
+
+    assert many_rows > few_rows
+    assert many == few
@@ -0,0 +1,20 @@
+import pytest
+
+XSS = '<img src=x onerror=alert(1)> chicken "soup" & more'
+
+
+@pytest.fixture(params=['fts', 'fallback'])
+def app(request, make_app):
+    return make_app(migrated=request.param == 'fts')
+
+
+def test_results_are_escaped_around_the_marks(client, register):
+    headers = register('alice')
+    assert client.post('/api/tasks', headers=headers, json={'title': XSS, 'description': 'make <b>chicken</b> stock'}).status_code == 201
+    assert client.post('/api/thoughts', headers=headers, json={'content': '<script>x()</script> chicken'}).status_code == 201
+
+    results = {result['type']: result for result in client.get('/api/search?q=chicken', headers=headers).json}
+    assert results['tasks']['title'] == (
+        '&lt;img src=x onerror=alert(1)&gt; <mark>chicken</mark> &quot;soup&quot; &amp; more')
+    assert results['tasks']['snippet'] == 'make &lt;b&gt;<mark>chicken</mark>&lt;/b&gt; stock'
+    assert results['thoughts']['snippet'] == '&lt;script&gt;x()&lt;/script&gt; <mark>chicken</mark>'
@@ -0,0 +1,53 @@
+"""Times with a UTC offset or a Z suffix are taken as UTC and compared with
+the naive UTC times that are stored."""
+import pytest
+
+
+@pytest.fixture
+def daily(client, register):
+    headers = register('alice')
+    task = client.post('/api/tasks', headers=headers, json={
+        'title': 'water plants', 'due_date': '2025-01-06T10:00:00', 'recurrence': 'FREQ=DAILY'}).json
+    return headers, task
+
+
+def _occurrences(client, headers, query):
+    response = client.get('/api/tasks?' + query, headers=headers)
+    assert response.status_code == 200, response.json
+    return [item['occurrence'] for item in response.json]
+
+
+def test_window_bounds_with_a_z_suffix(client, daily):
+    headers, _ = daily
+    assert _occurrences(client, headers, 'from=2025-01-06T00:00:00Z&to=2025-01-08T00:00:00Z') == [
+        '2025-01-06T10:00:00', '2025-01-07T10:00:00']
+
+
+def test_window_bounds_with_an_offset(client, daily):
+    headers, _ = daily
+    # 11:00+02:00 to 12:30+02:00 is 09:00 to 10:30 UTC.
+    assert _occurrences(client, headers, 'from=2025-01-06T11:00:00%2B02:00&to=2025-01-06T12:30:00%2B02:00') == [
+        '2025-01-06T10:00:00']
+    assert _occurrences(client, headers, 'from=2025-01-06T11:00:00%2B02:00&to=2025-01-06T11:30:00%2B02:00') == []
+
+
+@pytest.mark.parametrize('occurrence, stored', [
+    ('2025-01-07T10:00:00Z', '2025-01-07T10:00:00'),
+    ('2025-01-08T12:00:00+02:00', '2025-01-08T10:00:00'),
+])
+def test_completing_an_occurrence_given_in_utc(client, daily, occurrence, stored):
+    headers, task = daily
+    response = client.put('/api/tasks/%d/occurrences/%s' % (task['id'], occurrence), headers=headers,
+                          json={'completed': True})
+    assert response.status_code == 200, response.json
+    assert response.json['occurrence'] == stored
+    listed = client.get('/api/tasks?from=2025-01-06&to=2025-01-08', headers=headers).json
+    assert [item['occurrence'] for item in listed if item['completed']] == [stored]
+
+
+def test_due_dates_are_stored_in_utc(client, register):
+    headers = register('alice')
+    task = client.post('/api/tasks', headers=headers, json={'title': 't', 'due_date': '2025-01-06T10:00:00+01:00'}).json
+    assert task['due_date'] == '2025-01-06T09:00:00'
+    response = client.get('/api/tasks?due_from=2025-01-06T09:30:00%2B01:00&due_to=2025-01-06T10:30:00Z', headers=headers)
+    assert [item['id'] for item in response.json] == [task['id']]
@@ -0,0 +1,44 @@
+from database import db
+from models import Family
+from versions import bump_version, get_version
+
+
+def test_bump_version_creates_then_increments(app):
+    with app.app_context():
+        family = Family(name='Family')
+        db.session.add(family)
+        db.session.commit()
+
+        bump_version(family.id, 'tasks')
+        db.session.commit()
+        assert get_version(family.id, 'tasks') == 1
+
+        bump_version(family.id, 'tasks', 'thoughts')
+        db.session.commit()
+        assert (get_version(family.id, 'tasks'), get_version(family.id, 'thoughts')) == (2, 1)
+
+
+def test_bump_version_increments_a_row_another_writer_created(app):
+    with app.app_context():
+        family = Family(name='Family')
+        db.session.add(family)
+        db.session.commit()
+        assert get_version(family.id, 'tasks') == 0  # this session has seen no row
+
+        with db.engine.begin() as connection:
+            connection.execute(db.text(
+                "INSERT INTO collection_versions (family_id, collection, version) VALUES (:family_id, 'tasks', 5)"),
+                {'family_id': family.id})
+
+        bump_version(family.id, 'tasks')
+        db.session.commit()
+        assert get_version(family.id, 'tasks') == 6
+
+
+def test_each_write_bumps_the_version(app, client, register):
+    headers = register('alice')
+    before = client.get('/api/tasks', headers=headers).headers['ETag']
+    for i in range(3):
+        assert client.post('/api/tasks', headers=headers, json={'title': 'task %d' % i}).status_code == 201
+    after = client.get('/api/tasks', headers=headers).headers['ETag']
+    assert int(after.split('-')[2]) == int(before.split('-')[2]) + 3
@@ -0,0 +1,60 @@
+import zlib
+from functools import wraps
+from flask import request, g, current_app
+from database import db, upsert_insert
+from models import CollectionVersion
+
+def bump_version(family_id, *collections):
+    """Increment the change version of each collection in the current transaction."""
+    # collection_cache drops these collections' entries once the transaction commits.
+    db.session.info.setdefault('changed_collections', set()).update((family_id, c) for c in collections)
+    table = CollectionVersion.__table__
+    insert = upsert_insert(table)
+    for collection in collections:
+        if insert is not None:
+            # One statement, so two first writes to a collection can't both
+            # find no row and both insert it.
+            db.session.execute(insert.values(family_id=family_id, collection=collection, version=1).on_conflict_do_update(
+                index_elements=[table.c.family_id, table.c.collection], set_={'version': table.c.version + 1}))
+            continue
+        updated = CollectionVersion.query.filter_by(family_id=family_id, collection=collection).update(
+            {CollectionVersion.version: CollectionVersion.version + 1}, synchronize_session=False)
+        if not updated:
+            db.session.add(CollectionVersion(family_id=family_id, collection=collection, version=1))
+
+def get_version(family_id, collection):
+    row = db.session.query(CollectionVersion.version).filter_by(family_id=family_id, collection=collection).first()
+    return row[0] if row else 0
+
+def collection_etag(family_id, collection, version=None):
+    # The query string is part of the tag because filters and cursors select
+    # different representations of the same collection version.
+    if version is None:
+        version = get_version(family_id, collection)
+    return '%s-%d-%d-%s' % (collection, family_id, version, format(zlib.crc32(request.query_string), 'x'))
+
+def conditional(collection):
+    """Answer If-None-Match with 304 when the family's collection is unchanged.
+
+    Must be applied below token_required. The version is read before the
+    handler runs, so a concurrent write can only make the tag too old, never
+    let a client keep stale data.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            g.collection_version = get_version(g.current_user.family_id, collection)
+            etag = collection_etag(g.current_user.family_id, collection, g.collection_version)
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+                response.set_etag(etag, weak=True)
+                return response
+
+            response = current_app.make_response(f(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag, weak=True)
+            return response
+
+        return decorated
+
+    return decorator
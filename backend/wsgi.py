@@ -1,3 +1,5 @@
 from app import create_app
+from jobs import start_workers
 
 app = create_app()
+start_workers(app)
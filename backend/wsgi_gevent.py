@@ -0,0 +1,40 @@
+"""Cooperative entry point: one process serves thousands of connections.
+
+Everything blocking becomes a greenlet switch: sockets and locks through
+gevent's monkey patching, PostgreSQL queries through psycogreen's wait
+callback, and password hashing on a small pool of real threads. SQLite has
+no cooperative driver; its queries are short, and in WAL mode readers never
+wait on a lock, but a writer waiting out busy_timeout holds the whole
+process for that time.
+
+gunicorn.conf.py loads this module when GUNICORN_WORKER_CLASS is gevent
+(the default). To run it without gunicorn:
+
+    python wsgi_gevent.py
+"""
+from gevent import monkey
+monkey.patch_all()
+
+import os
+
+try:
+    from psycogreen.gevent import patch_psycopg
+except ImportError:  # pragma: no cover - only needed with PostgreSQL
+    patch_psycopg = None
+if patch_psycopg is not None:
+    patch_psycopg()
+
+# Inline hashing would stall every connection in the process for the length
+# of each hash.
+os.environ.setdefault('PASSWORD_HASH_WORKERS', '2')
+
+from app import create_app
+from jobs import start_workers
+
+app = create_app()
+start_workers(app)
+
+if __name__ == '__main__':
+    from gevent.pywsgi import WSGIServer
+    host, _, port = os.environ.get('GUNICORN_BIND', '0.0.0.0:8080').rpartition(':')
+    WSGIServer((host, int(port)), app).serve_forever()